@@ -259,6 +259,60 @@ NagSuppressions.add_resource_suppressions_by_path(
     avp_stack,
     "/AvpIotDemoStack/DemoLambdas/DownloadRole/DefaultPolicy/Resource",
     [
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "IoT DescribeEndpoint operation requires * resource permission",
+            "appliesTo": [
+                "Resource::*"
+            ]
+        },
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "Download messages presign any object in the device bucket",
+            "appliesTo": [
+                "Resource::arn:aws:s3:::IoTBucketName-Export/*"
+            ]
+        },
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "Download messages are published to the topic of each thing under the download topic",
+            "appliesTo": [
+                "Resource::arn:aws:iot:<AWS::Region>:<AWS::AccountId>:topic/IoTTopicName-Export/*"
+            ]
+        },
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "CloudWatch Logs permissions require wildcard for Lambda log groups",
+            "appliesTo": [
+                "Resource::arn:aws:logs:<AWS::Region>:<AWS::AccountId>:log-group:/aws/lambda/*:*"
+            ]
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/DemoLambdas/RolloutIntegrationFunction/Resource",
+    [
+        {
+            "id": "AwsSolutions-L1",
+            "reason": "Using stable Python runtime for Lambda functions"
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/DemoLambdas/RolloutRole/DefaultPolicy/Resource",
+    [
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "Job ids are generated per rollout and callers choose the targeted thing group",
+            "appliesTo": [
+                "Resource::arn:aws:iot:<AWS::Region>:<AWS::AccountId>:job/*",
+                "Resource::arn:aws:iot:<AWS::Region>:<AWS::AccountId>:thinggroup/*"
+            ]
+        },
         {
             "id": "AwsSolutions-IAM5",
             "reason": "CloudWatch Logs permissions require wildcard for Lambda log groups",
@@ -305,4 +359,146 @@ NagSuppressions.add_resource_suppressions_by_path(
     ]
 )
 
+# Fleet indexing is only part of the stack when enabled with -c enableFleetIndexing=true
+if avp_stack.node.try_find_child("FleetIndexing"):
+    NagSuppressions.add_resource_suppressions_by_path(
+        avp_stack,
+        "/AvpIotDemoStack/FleetIndexing/IndexingConfiguration/CustomResourcePolicy/Resource",
+        [
+            {
+                "id": "AwsSolutions-IAM5",
+                "reason": "IoT UpdateIndexingConfiguration does not support resource-level permissions",
+                "appliesTo": [
+                    "Resource::*"
+                ]
+            }
+        ]
+    )
+
+# Singleton function that backs AwsCustomResource constructs
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/AWS679f53fac002430cb0da5b7982bd2287/ServiceRole/Resource",
+    [
+        {
+            "id": "AwsSolutions-IAM4",
+            "reason": "The AwsCustomResource provider function uses the AWS managed basic execution role",
+            "appliesTo": [
+                "Policy::arn:<AWS::Partition>:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
+            ]
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/AWS679f53fac002430cb0da5b7982bd2287/Resource",
+    [
+        {
+            "id": "AwsSolutions-L1",
+            "reason": "The AwsCustomResource provider function runtime is managed by the CDK"
+        }
+    ]
+)
+
+for function_name in ("IngestFunction", "BackfillFunction"):
+    NagSuppressions.add_resource_suppressions_by_path(
+        avp_stack,
+        f"/AvpIotDemoStack/DeviceCatalog/{function_name}/Resource",
+        [
+            {
+                "id": "AwsSolutions-L1",
+                "reason": "Using stable Python runtime for Lambda functions"
+            }
+        ]
+    )
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/PublishQueue/PublisherFunction/Resource",
+    [
+        {
+            "id": "AwsSolutions-L1",
+            "reason": "Using stable Python runtime for Lambda functions"
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/PublishQueue/PublisherRole/DefaultPolicy/Resource",
+    [
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "IoT DescribeEndpoint operation requires * resource permission",
+            "appliesTo": [
+                "Resource::*"
+            ]
+        },
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "Download messages are published to the topic of each thing under the download topic",
+            "appliesTo": [
+                "Resource::arn:aws:iot:<AWS::Region>:<AWS::AccountId>:topic/IoTTopicName-Export/*"
+            ]
+        },
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "CloudWatch Logs permissions require wildcard for Lambda log groups",
+            "appliesTo": [
+                "Resource::arn:aws:logs:<AWS::Region>:<AWS::AccountId>:log-group:/aws/lambda/*:*"
+            ]
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/DeviceCatalog/IngestRole/DefaultPolicy/Resource",
+    [
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "CloudWatch Logs permissions require wildcard for Lambda log groups",
+            "appliesTo": [
+                "Resource::arn:aws:logs:<AWS::Region>:<AWS::AccountId>:log-group:/aws/lambda/*:*"
+            ]
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/DeviceCatalog/BackfillRole/DefaultPolicy/Resource",
+    [
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "IoT ListThings operation requires * resource permission as it's a list operation",
+            "appliesTo": [
+                "Resource::*"
+            ]
+        },
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "CloudWatch Logs permissions require wildcard for Lambda log groups",
+            "appliesTo": [
+                "Resource::arn:aws:logs:<AWS::Region>:<AWS::AccountId>:log-group:/aws/lambda/*:*"
+            ]
+        }
+    ]
+)
+
+NagSuppressions.add_resource_suppressions_by_path(
+    avp_stack,
+    "/AvpIotDemoStack/DeviceCatalog/RegistryEvents/CustomResourcePolicy/Resource",
+    [
+        {
+            "id": "AwsSolutions-IAM5",
+            "reason": "IoT UpdateEventConfigurations does not support resource-level permissions",
+            "appliesTo": [
+                "Resource::*"
+            ]
+        }
+    ]
+)
+
 app.synth()
@@ -5,7 +5,11 @@ from constructs import Construct
 from avp_iot_demo.policy_store.policy_store_construct import AvpPolicyStore
 from avp_iot_demo.constructs.apigateway_construct import AvpIotDemoApiGateway
 from avp_iot_demo.constructs.cognito_construct import CognitoConstruct
+from avp_iot_demo.constructs.device_catalog_construct import DeviceCatalog
+from avp_iot_demo.constructs.fleet_indexing_construct import FleetIndexing
+from avp_iot_demo.constructs.idempotency_construct import IdempotencyTable
 from avp_iot_demo.constructs.lambda_construct import Lambdas
+from avp_iot_demo.constructs.publish_queue_construct import PublishQueue
 
 class AvpIotDemoStack(Stack):
     def __init__(
@@ -23,15 +27,40 @@ class AvpIotDemoStack(Stack):
         # Import thing name from IoT stack
         thing_name = Fn.import_value("IoTThingName-Export")
         iot_topic = Fn.import_value("IoTTopicName-Export")
+        thing_group_name = Fn.import_value("IoTThingGroupName-Export")
+        download_bucket_name = Fn.import_value("IoTBucketName-Export")
+
+        # /devices searches the fleet index when filters are given. Indexing is configured
+        # account-wide, so the stack only sets it when asked: -c enableFleetIndexing=true
+        if str(self.node.try_get_context("enableFleetIndexing")).lower() == "true":
+            FleetIndexing(self, "FleetIndexing")
 
         lambdas = Lambdas(
             self,
             "DemoLambdas",
             policy_store_id=policy_store.policy_store_id,
+            action_ids=policy_store.action_ids,
+            authenticated_action_ids=["get /role"],  # any signed-in user may look up their own groups
+            user_pool_id=user_pool_id,
+            user_pool_client_id=cognito.cognito_client_id,
             thing_name=thing_name,
             iot_topic=iot_topic,
+            thing_group_name=thing_group_name,
+            download_bucket_name=download_bucket_name,
         )
 
+        # /devices pages through a DynamoDB copy of the registry instead of calling ListThings
+        device_catalog = DeviceCatalog(self, "DeviceCatalog", shared_layer=lambdas.shared_layer)
+        device_catalog.grant_read(lambdas.devices_integration_fn)
+
+        # /download queues messages and returns 202; the publisher drains the queue into IoT Core
+        publish_queue = PublishQueue(self, "PublishQueue", shared_layer=lambdas.shared_layer, iot_topic=iot_topic)
+        publish_queue.grant_send(lambdas.download_integration_fn)
+
+        # Double-clicks and client retries replay the first /download response for five minutes
+        idempotency = IdempotencyTable(self, "DownloadIdempotency")
+        idempotency.grant(lambdas.download_integration_fn, ttl_seconds=300)
+
         apigateway = AvpIotDemoApiGateway(
             self,
             "AvpIotDemoApi",
@@ -39,7 +68,9 @@ class AvpIotDemoStack(Stack):
             devices_lambda_arn=lambdas.devices_integration_arn,  # For /devices endpoint
             download_lambda_arn=lambdas.download_integration_arn,  # For /download endpoint
             role_lambda_arn=lambdas.role_integration_arn,  # For /role endpoint
-            lambda_authorizer_arn=lambdas.authorizer_arn,  # protects /devices and /download enpoints
+            rollout_lambda_arn=lambdas.rollout_integration_arn,  # For /rollout endpoint
+            lambda_authorizer_arn=lambdas.authorizer_arn,  # protects every endpoint
+            authorizer_result_ttl_seconds=300,  # cached policies cover every endpoint for the token
         )
 
         CfnOutput(
@@ -6,6 +6,7 @@ from aws_cdk import (
     aws_apigateway as apigateway,
     aws_logs as logs,
     RemovalPolicy,
+    Size,
 )
 from constructs import Construct
 
@@ -16,6 +17,7 @@ class _OpenApiVariableMapping(SimpleNamespace):
     cors_allow_origin: str
     role_actions_lambda_arn: str
     lambda_authorizer_arn: str
+    authorizer_result_ttl_seconds: int
 
 
 class AvpIotDemoApiGateway(Construct):
@@ -28,11 +30,17 @@ class AvpIotDemoApiGateway(Construct):
         devices_lambda_arn: str,
         download_lambda_arn: str,
         role_lambda_arn: str,
+        rollout_lambda_arn: str,
         lambda_authorizer_arn: str,
+        authorizer_result_ttl_seconds: int = 300,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # API Gateway caches authorizer results for at most one hour
+        if not 0 <= authorizer_result_ttl_seconds <= 3600:
+            raise ValueError("authorizer_result_ttl_seconds must be between 0 and 3600")
+
         # Create CloudWatch Logs group for API Gateway access logs
         log_group = logs.LogGroup(
             self,
@@ -50,7 +58,9 @@ class AvpIotDemoApiGateway(Construct):
                 devices_lambda_arn=devices_lambda_arn,
                 download_lambda_arn=download_lambda_arn,
                 role_lambda_arn=role_lambda_arn,
+                rollout_lambda_arn=rollout_lambda_arn,
                 lambda_authorizer_arn=lambda_authorizer_arn,
+                authorizer_result_ttl_seconds=authorizer_result_ttl_seconds,
             ),
         )
 
@@ -66,6 +76,8 @@ class AvpIotDemoApiGateway(Construct):
                 access_log_format=apigateway.AccessLogFormat.clf(),
             ),
             cloud_watch_role=True,
+            # Gzip responses larger than 1 KiB for clients that send Accept-Encoding
+            min_compression_size=Size.kibibytes(1),
         )
 
     @property
@@ -0,0 +1,189 @@
+from aws_cdk import (
+    Duration,
+    RemovalPolicy,
+    Stack,
+    aws_dynamodb as dynamodb,
+    aws_iam as iam,
+    aws_iot as iot,
+    aws_lambda as _lambda,
+    custom_resources as cr,
+)
+from constructs import Construct
+
+from avp_iot_demo.constructs.lambda_construct import LOGGING_ENVIRONMENT
+
+
+class DeviceCatalog(Construct):
+    """
+    A DynamoDB copy of the IoT registry that /devices can page through without
+    calling the IoT control plane. Registry events keep it current, and a
+    one-shot backfill copies the things that existed before deployment.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, shared_layer: _lambda.ILayerVersion, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.table = dynamodb.Table(
+            self,
+            "Table",
+            partition_key=dynamodb.Attribute(name="catalog", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="thingName", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expiresAt",
+            point_in_time_recovery=True,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        self.table.add_global_secondary_index(
+            index_name="byThingType",
+            partition_key=dynamodb.Attribute(name="thingTypeName", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="thingName", type=dynamodb.AttributeType.STRING),
+        )
+
+        environment = {
+            "DEVICE_CATALOG_TABLE": self.table.table_name,
+            **LOGGING_ENVIRONMENT,
+        }
+
+        ingest_role = self._create_role("IngestRole", ["dynamodb:PutItem"])
+        self.ingest_function = _lambda.Function(
+            self,
+            "IngestFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="ingest.lambda_handler",
+            code=_lambda.Code.from_asset("lambdas/catalog"),
+            environment=environment,
+            layers=[shared_layer],
+            role=ingest_role,
+        )
+
+        backfill_role = self._create_role("BackfillRole", ["dynamodb:PutItem"])
+        # ListThings requires * resource permission
+        backfill_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["iot:ListThings"],
+                resources=["*"],
+            )
+        )
+        self.backfill_function = _lambda.Function(
+            self,
+            "BackfillFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="backfill.lambda_handler",
+            code=_lambda.Code.from_asset("lambdas/catalog"),
+            environment=environment,
+            layers=[shared_layer],
+            role=backfill_role,
+            timeout=Duration.minutes(15),
+        )
+
+        # Publish thing created, updated and deleted events to $aws/events/thing/<thingName>/<operation>
+        event_configurations = cr.AwsCustomResource(
+            self,
+            "RegistryEvents",
+            on_create=self._enable_thing_events(),
+            on_update=self._enable_thing_events(),
+            # UpdateEventConfigurations does not support resource-level permissions
+            policy=cr.AwsCustomResourcePolicy.from_statements([
+                iam.PolicyStatement(
+                    actions=["iot:UpdateEventConfigurations"],
+                    resources=["*"],
+                )
+            ]),
+        )
+
+        topic_rule = iot.CfnTopicRule(
+            self,
+            "ThingEventsRule",
+            topic_rule_payload=iot.CfnTopicRule.TopicRulePayloadProperty(
+                sql="SELECT * FROM '$aws/events/thing/+/+'",
+                aws_iot_sql_version="2016-03-23",
+                actions=[
+                    iot.CfnTopicRule.ActionProperty(
+                        lambda_=iot.CfnTopicRule.LambdaActionProperty(
+                            function_arn=self.ingest_function.function_arn,
+                        )
+                    )
+                ],
+            ),
+        )
+        self.ingest_function.add_permission(
+            "AllowThingEventsRule",
+            principal=iam.ServicePrincipal("iot.amazonaws.com"),
+            source_arn=topic_rule.attr_arn,
+        )
+
+        # Backfill once, after events are flowing, so that no change falls between the two
+        backfill = cr.AwsCustomResource(
+            self,
+            "Backfill",
+            on_create=cr.AwsSdkCall(
+                service="Lambda",
+                action="invoke",
+                parameters={
+                    "FunctionName": self.backfill_function.function_name,
+                    "InvocationType": "Event",
+                },
+                physical_resource_id=cr.PhysicalResourceId.of("DeviceCatalogBackfill"),
+            ),
+            policy=cr.AwsCustomResourcePolicy.from_statements([
+                iam.PolicyStatement(
+                    actions=["lambda:InvokeFunction"],
+                    resources=[self.backfill_function.function_arn],
+                )
+            ]),
+        )
+        backfill.node.add_dependency(event_configurations)
+        backfill.node.add_dependency(topic_rule)
+
+    @staticmethod
+    def _enable_thing_events() -> cr.AwsSdkCall:
+        return cr.AwsSdkCall(
+            service="Iot",
+            action="updateEventConfigurations",
+            parameters={"eventConfigurations": {"THING": {"Enabled": True}}},
+            physical_resource_id=cr.PhysicalResourceId.of("ThingRegistryEvents"),
+        )
+
+    def _create_role(self, id: str, table_actions: list) -> iam.Role:
+        """Create a role for a catalog function"""
+        role = iam.Role(
+            self,
+            id,
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")
+        )
+
+        role.add_to_policy(
+            iam.PolicyStatement(
+                actions=table_actions,
+                resources=[self.table.table_arn],
+            )
+        )
+
+        # Add CloudWatch Logs permissions with wildcard to match any function name
+        role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:PutLogEvents",
+                ],
+                resources=[
+                    f"arn:aws:logs:{Stack.of(self).region}:{Stack.of(self).account}:log-group:/aws/lambda/*:*",
+                ]
+            )
+        )
+
+        return role
+
+    def grant_read(self, function: _lambda.Function) -> None:
+        """Let a function page through the catalog, and tell it where the catalog is."""
+        function.add_environment("DEVICE_CATALOG_TABLE", self.table.table_name)
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["dynamodb:Query"],
+                resources=[
+                    self.table.table_arn,
+                    f"{self.table.table_arn}/index/byThingType",
+                ],
+            )
+        )
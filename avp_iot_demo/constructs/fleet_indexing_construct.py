@@ -0,0 +1,41 @@
+from aws_cdk import aws_iam as iam, custom_resources as cr
+from constructs import Construct
+
+
+class FleetIndexing(Construct):
+    """
+    Turns on AWS IoT fleet indexing for the registry and connectivity status so
+    that /devices can search the AWS_Things index instead of listing every thing.
+    Fleet indexing is an account-wide setting: this replaces any existing thing
+    indexing configuration, such as shadow or custom field indexing, and is left in
+    place when the stack is deleted. Only add it to accounts that do not index things yet.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        update_indexing = cr.AwsSdkCall(
+            service="Iot",
+            action="updateIndexingConfiguration",
+            parameters={
+                "thingIndexingConfiguration": {
+                    "thingIndexingMode": "REGISTRY",
+                    "thingConnectivityIndexingMode": "STATUS",
+                },
+            },
+            physical_resource_id=cr.PhysicalResourceId.of("FleetIndexing"),
+        )
+
+        cr.AwsCustomResource(
+            self,
+            "IndexingConfiguration",
+            on_create=update_indexing,
+            on_update=update_indexing,
+            # UpdateIndexingConfiguration does not support resource-level permissions
+            policy=cr.AwsCustomResourcePolicy.from_statements([
+                iam.PolicyStatement(
+                    actions=["iot:UpdateIndexingConfiguration"],
+                    resources=["*"],
+                )
+            ]),
+        )
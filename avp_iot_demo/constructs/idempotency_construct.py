@@ -0,0 +1,39 @@
+from aws_cdk import (
+    RemovalPolicy,
+    aws_dynamodb as dynamodb,
+    aws_iam as iam,
+    aws_lambda as _lambda,
+)
+from constructs import Construct
+
+
+class IdempotencyTable(Construct):
+    """
+    Records of recently handled requests, so that retried and double-submitted
+    requests replay their first response instead of running again. Records
+    expire through the expiresAt TTL.
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.table = dynamodb.Table(
+            self,
+            "Table",
+            partition_key=dynamodb.Attribute(name="idempotencyKey", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expiresAt",
+            point_in_time_recovery=True,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+    def grant(self, function: _lambda.Function, ttl_seconds: int = 300) -> None:
+        """Let a function record idempotent requests, and tell it where and for how long."""
+        function.add_environment("IDEMPOTENCY_TABLE", self.table.table_name)
+        function.add_environment("IDEMPOTENCY_TTL_SECONDS", str(ttl_seconds))
+        function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["dynamodb:PutItem", "dynamodb:GetItem", "dynamodb:DeleteItem"],
+                resources=[self.table.table_arn],
+            )
+        )
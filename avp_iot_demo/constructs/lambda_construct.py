@@ -1,16 +1,60 @@
-from aws_cdk import Stack, CfnOutput, aws_lambda as _lambda, aws_iam as iam
+import json
+
+from aws_cdk import Duration, Stack, CfnOutput, aws_lambda as _lambda, aws_iam as iam
 from constructs import Construct
 
+# Steady-state requests log at INFO; a sample of requests logs at DEBUG
+LOGGING_ENVIRONMENT = {
+    "LOG_LEVEL": "INFO",
+    "LOG_SAMPLE_RATE": "0.01",
+}
+
+# Each Verified Permissions call, retries included, gives up after this long
+AVP_TIMEOUT_BUDGET_SECONDS = 2
+# The authorizer's JWKS fetch gives up after this long (JwtVerifier's default)
+JWKS_TIMEOUT_SECONDS = 2
+# BatchIsAuthorizedWithToken accepts at most 30 requests per call
+AVP_BATCH_SIZE = 30
+
 
 class Lambdas(Construct):
-    def __init__(self, scope: Construct, id: str, policy_store_id: str, thing_name: str, iot_topic: str) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        policy_store_id: str,
+        action_ids: list,
+        authenticated_action_ids: list,
+        user_pool_id: str,
+        user_pool_client_id: str,
+        thing_name: str,
+        iot_topic: str,
+        thing_group_name: str,
+        download_bucket_name: str,
+    ) -> None:
         super().__init__(scope, id)
 
         # Create custom roles first
         authorizer_role = self._create_authorizer_role(policy_store_id)
         devices_role = self._create_devices_role()
-        download_role = self._create_download_role(iot_topic)
+        download_role = self._create_download_role(iot_topic, download_bucket_name)
         role_integration_role = self._create_role_integration_role()
+        rollout_role = self._create_rollout_role()
+
+        # Code shared by every function, mounted under /opt/python
+        self.shared_layer = shared_layer = _lambda.LayerVersion(
+            self,
+            "SharedLayer",
+            code=_lambda.Code.from_asset("lambdas/layers/shared"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
+            description="Shared logging and AWS client helpers for the demo functions",
+        )
+
+        # A cold start may fetch the JWKS, authorize every action in batches and make one call for
+        # an action outside the schema, each within its own budget. The timeout covers all of them,
+        # so that a slow Verified Permissions ends in a degraded decision rather than a timeout
+        avp_calls = -(-len(action_ids) // AVP_BATCH_SIZE) + 1
+        authorizer_timeout = Duration.seconds(JWKS_TIMEOUT_SECONDS + avp_calls * AVP_TIMEOUT_BUDGET_SECONDS + 2)
 
         # Create Lambda functions with the roles
         self.authorizer_function = _lambda.Function(
@@ -19,11 +63,29 @@ class Lambdas(Construct):
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="index.lambda_handler",
             code=_lambda.Code.from_asset("lambdas/authorizer"),
+            timeout=authorizer_timeout,
             environment={
                 "POLICY_STORE_ID": policy_store_id,
                 "TOKEN_TYPE": "identityToken",
                 "NAMESPACE": "AvpIotDemoApi",
+                "USER_POOL_ID": user_pool_id,
+                "CLIENT_ID": user_pool_client_id,
+                "DECISION_CACHE_MAX_ENTRIES": "1024",
+                "DECISION_CACHE_TTL_SECONDS": "3600",
+                "LOCAL_EVALUATION": "false",
+                "POLICY_REFRESH_SECONDS": "300",
+                "ACTION_IDS": json.dumps(action_ids),
+                "AUTHENTICATED_ACTION_IDS": json.dumps(authenticated_action_ids),
+                "AVP_MAX_ATTEMPTS": "2",
+                "AVP_TIMEOUT_BUDGET_SECONDS": str(AVP_TIMEOUT_BUDGET_SECONDS),
+                "AVP_BREAKER_FAILURE_THRESHOLD": "5",
+                "AVP_BREAKER_RESET_SECONDS": "30",
+                # API Gateway caches a policy built from last known decisions for the authorizer
+                # TTL, so it covers every action; without a decision for each, nothing is served
+                "STALE_DECISION_MAX_AGE_SECONDS": "900",
+                **LOGGING_ENVIRONMENT,
             },
+            layers=[shared_layer],
             role=authorizer_role,
         )
 
@@ -33,6 +95,11 @@ class Lambdas(Construct):
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="devices.lambda_handler",
             code=_lambda.Code.from_asset("lambdas/integration"),
+            environment={
+                "DEVICE_CACHE_TTL_SECONDS": "30",
+                **LOGGING_ENVIRONMENT,
+            },
+            layers=[shared_layer],
             role=devices_role,
         )
 
@@ -44,9 +111,20 @@ class Lambdas(Construct):
             code=_lambda.Code.from_asset("lambdas/integration"),
             environment={
                 "IOT_THING_NAME": thing_name,
-                "IOT_TOPIC": iot_topic
+                "IOT_TOPIC": iot_topic,
+                # Batch publishes share one connection pool
+                "PUBLISH_CONCURRENCY": "16",
+                "AWS_CLIENT_MAX_POOL_CONNECTIONS": "16",
+                "MAX_BATCH_TARGETS": "1000",
+                # Devices download with a short-lived URL instead of their own S3 credentials
+                "PRESIGN_BUCKET": download_bucket_name,
+                "PRESIGN_EXPIRES_SECONDS": "900",
+                **LOGGING_ENVIRONMENT,
             },
+            layers=[shared_layer],
             role=download_role,
+            # API Gateway gives up on integrations after 29 seconds
+            timeout=Duration.seconds(29),
         )
 
         self.role_integration_fn = _lambda.Function(
@@ -55,14 +133,36 @@ class Lambdas(Construct):
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="role.lambda_handler",
             code=_lambda.Code.from_asset("lambdas/integration"),
+            environment=LOGGING_ENVIRONMENT,
+            layers=[shared_layer],
             role=role_integration_role,
         )
 
+        self.rollout_integration_fn = _lambda.Function(
+            self,
+            "RolloutIntegrationFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="rollout.lambda_handler",
+            code=_lambda.Code.from_asset("lambdas/integration"),
+            environment={
+                "IOT_THING_GROUP": thing_group_name,
+                # IoT Jobs paces the rollout and cancels it when too many devices fail
+                "ROLLOUT_MAXIMUM_PER_MINUTE": "100",
+                "ROLLOUT_ABORT_FAILURE_PERCENT": "10",
+                "ROLLOUT_ABORT_MIN_EXECUTED_THINGS": "10",
+                "ROLLOUT_TIMEOUT_MINUTES": "30",
+                **LOGGING_ENVIRONMENT,
+            },
+            layers=[shared_layer],
+            role=rollout_role,
+        )
+
         # Grant API Gateway invoke permissions
         self.authorizer_function.grant_invoke(iam.ServicePrincipal("apigateway.amazonaws.com"))
         self.devices_integration_fn.grant_invoke(iam.ServicePrincipal("apigateway.amazonaws.com"))
         self.download_integration_fn.grant_invoke(iam.ServicePrincipal("apigateway.amazonaws.com"))
         self.role_integration_fn.grant_invoke(iam.ServicePrincipal("apigateway.amazonaws.com"))
+        self.rollout_integration_fn.grant_invoke(iam.ServicePrincipal("apigateway.amazonaws.com"))
         
         # Create CloudFormation outputs
         self._create_outputs()
@@ -78,7 +178,14 @@ class Lambdas(Construct):
         # Add Verified Permissions policy
         role.add_to_policy(
             iam.PolicyStatement(
-                actions=["verifiedpermissions:IsAuthorizedWithToken"],
+                actions=[
+                    "verifiedpermissions:IsAuthorizedWithToken",
+                    "verifiedpermissions:BatchIsAuthorizedWithToken",
+                    # Needed to keep a local copy of the store when LOCAL_EVALUATION is enabled
+                    "verifiedpermissions:ListPolicies",
+                    "verifiedpermissions:GetPolicy",
+                    "verifiedpermissions:GetSchema",
+                ],
                 resources=[
                     f"arn:aws:verifiedpermissions::{Stack.of(self).account}:policy-store/{policy_store_id}"
                 ],
@@ -117,6 +224,17 @@ class Lambdas(Construct):
                 resources=["*"]  # ListThings requires * resource permission
             )
         )
+
+        # Search the fleet index when /devices is called with filters
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["iot:SearchIndex"],
+                resources=[
+                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:index/AWS_Things"
+                ],
+            )
+        )
         
         # Add CloudWatch Logs permissions with wildcard to match any function name
         role.add_to_policy(
@@ -134,7 +252,7 @@ class Lambdas(Construct):
         
         return role
     
-    def _create_download_role(self, iot_topic: str) -> iam.Role:
+    def _create_download_role(self, iot_topic: str, download_bucket_name: str) -> iam.Role:
         """Create a custom role for the download integration function"""
         role = iam.Role(
             self,
@@ -142,16 +260,42 @@ class Lambdas(Construct):
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")
         )
         
+        # Resolve the iot-data endpoint once per container; DescribeEndpoint requires * resource
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["iot:DescribeEndpoint"],
+                resources=["*"],
+            )
+        )
+
         # Add IoT publish permissions
         role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
                 actions=["iot:Publish"],
                 resources=[
-                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:topic/{iot_topic}"
+                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:topic/{iot_topic}/*"
                 ],
             )
         )
+
+        # Presigned URLs carry the role's permissions; HeadObject reads the manifest
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:GetObject", "s3:GetObjectVersion"],
+                resources=[f"arn:aws:s3:::{download_bucket_name}/*"],
+            )
+        )
+        # Without ListBucket, S3 answers HeadObject for a missing object with 403 instead of 404
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::{download_bucket_name}"],
+            )
+        )
         
         # Add CloudWatch Logs permissions with wildcard to match any function name
         role.add_to_policy(
@@ -193,6 +337,51 @@ class Lambdas(Construct):
         
         return role
 
+    def _create_rollout_role(self) -> iam.Role:
+        """Create a custom role for the rollout integration function"""
+        role = iam.Role(
+            self,
+            "RolloutRole",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")
+        )
+
+        # Job ids are generated per rollout, and callers may target any thing group
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["iot:CreateJob"],
+                resources=[
+                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:job/*",
+                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:thinggroup/*",
+                ],
+            )
+        )
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["iot:DescribeThingGroup"],
+                resources=[
+                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:thinggroup/*",
+                ],
+            )
+        )
+
+        # Add CloudWatch Logs permissions with wildcard to match any function name
+        role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:PutLogEvents",
+                ],
+                resources=[
+                    f"arn:aws:logs:{Stack.of(self).region}:{Stack.of(self).account}:log-group:/aws/lambda/*:*",
+                ]
+            )
+        )
+
+        return role
+
     @property
     def authorizer_arn(self) -> str:
         return self.authorizer_function.function_arn
@@ -208,6 +397,10 @@ class Lambdas(Construct):
     @property
     def download_integration_arn(self) -> str:
         return self.download_integration_fn.function_arn
+
+    @property
+    def rollout_integration_arn(self) -> str:
+        return self.rollout_integration_fn.function_arn
         
     # Add CloudFormation outputs
     def _create_outputs(self):
@@ -238,4 +431,11 @@ class Lambdas(Construct):
             "RoleIntegrationFunctionArn",
             value=self.role_integration_fn.function_arn,
             description="ARN of the Role Integration function",
+        )
+
+        CfnOutput(
+            self,
+            "RolloutIntegrationFunctionArn",
+            value=self.rollout_integration_fn.function_arn,
+            description="ARN of the Rollout Integration function",
         )
\ No newline at end of file
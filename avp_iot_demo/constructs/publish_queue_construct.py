@@ -0,0 +1,150 @@
+from aws_cdk import (
+    Duration,
+    Stack,
+    CfnOutput,
+    aws_cloudwatch as cloudwatch,
+    aws_iam as iam,
+    aws_lambda as _lambda,
+    aws_lambda_event_sources as event_sources,
+    aws_sqs as sqs,
+)
+from constructs import Construct
+
+from avp_iot_demo.constructs.lambda_construct import LOGGING_ENVIRONMENT
+
+
+class PublishQueue(Construct):
+    """
+    Buffers download messages between the API and IoT Core. The API only
+    enqueues; a publisher function drains the queue in batches at a bounded
+    concurrency, so bursts of requests do not turn into IoT publish throttling.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        shared_layer: _lambda.ILayerVersion,
+        iot_topic: str,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        publisher_timeout = Duration.seconds(30)
+
+        self.dead_letter_queue = sqs.Queue(
+            self,
+            "DeadLetterQueue",
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            enforce_ssl=True,
+            retention_period=Duration.days(14),
+        )
+        self.queue = sqs.Queue(
+            self,
+            "Queue",
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            enforce_ssl=True,
+            # Lambda recommends at least six times the function timeout
+            visibility_timeout=Duration.seconds(publisher_timeout.to_seconds() * 6),
+            dead_letter_queue=sqs.DeadLetterQueue(queue=self.dead_letter_queue, max_receive_count=5),
+        )
+
+        publisher_role = self._create_publisher_role(iot_topic)
+        self.publisher_function = _lambda.Function(
+            self,
+            "PublisherFunction",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="publisher.lambda_handler",
+            code=_lambda.Code.from_asset("lambdas/publisher"),
+            environment={
+                "IOT_TOPIC": iot_topic,
+                "PUBLISH_CONCURRENCY": "10",
+                "AWS_CLIENT_MAX_POOL_CONNECTIONS": "10",
+                **LOGGING_ENVIRONMENT,
+            },
+            layers=[shared_layer],
+            role=publisher_role,
+            timeout=publisher_timeout,
+        )
+        self.publisher_function.add_event_source(
+            event_sources.SqsEventSource(
+                self.queue,
+                batch_size=50,
+                max_batching_window=Duration.seconds(1),
+                report_batch_item_failures=True,
+                # Caps the publish rate at two batches in flight
+                max_concurrency=2,
+            )
+        )
+
+        # Sustained depth means publishing is falling behind; anything in the DLQ was never delivered
+        cloudwatch.Alarm(
+            self,
+            "QueueDepthAlarm",
+            metric=self.queue.metric_approximate_number_of_messages_visible(period=Duration.minutes(1)),
+            threshold=1000,
+            evaluation_periods=5,
+            alarm_description="Download messages are queuing faster than they are published",
+        )
+        cloudwatch.Alarm(
+            self,
+            "DeadLetterAlarm",
+            metric=self.dead_letter_queue.metric_approximate_number_of_messages_visible(period=Duration.minutes(1)),
+            threshold=0,
+            evaluation_periods=1,
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+            alarm_description="Download messages could not be published to IoT Core",
+        )
+
+        CfnOutput(
+            self,
+            "PublishQueueUrl",
+            value=self.queue.queue_url,
+            description="URL of the queue of download messages",
+        )
+
+    def _create_publisher_role(self, iot_topic: str) -> iam.Role:
+        """Create a custom role for the publisher function"""
+        role = iam.Role(
+            self,
+            "PublisherRole",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")
+        )
+
+        # Resolve the iot-data endpoint once per container; DescribeEndpoint requires * resource
+        role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["iot:DescribeEndpoint"],
+                resources=["*"],
+            )
+        )
+
+        role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["iot:Publish"],
+                resources=[
+                    f"arn:aws:iot:{Stack.of(self).region}:{Stack.of(self).account}:topic/{iot_topic}/*"
+                ],
+            )
+        )
+
+        # Add CloudWatch Logs permissions with wildcard to match any function name
+        role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:PutLogEvents",
+                ],
+                resources=[
+                    f"arn:aws:logs:{Stack.of(self).region}:{Stack.of(self).account}:log-group:/aws/lambda/*:*",
+                ]
+            )
+        )
+
+        return role
+
+    def grant_send(self, function: _lambda.Function) -> None:
+        """Let a function queue download messages, and tell it where the queue is."""
+        function.add_environment("PUBLISH_QUEUE_URL", self.queue.queue_url)
+        self.queue.grant_send_messages(function)
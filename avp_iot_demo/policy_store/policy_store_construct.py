@@ -1,3 +1,4 @@
+import json
 import os
 from aws_cdk import aws_verifiedpermissions as verifiedpermissions, CfnOutput, Stack
 from constructs import Construct
@@ -14,6 +15,11 @@ class AvpPolicyStore(Construct):
         schema_json_str = file_to_string(
             f'{os.path.join(os.path.dirname(__file__), "cedarschema.json")}',
         )
+        self._action_ids = [
+            action_id
+            for namespace in json.loads(schema_json_str).values()
+            for action_id in namespace["actions"]
+        ]
         cfn_policy_store = verifiedpermissions.CfnPolicyStore(
             self,
             "AvpIotDemoPolicyStore",
@@ -49,12 +55,50 @@ class AvpPolicyStore(Construct):
         # Ensure identity source is created after policy store
         identity_source.node.add_dependency(cfn_policy_store)
         
+        # Create one static policy per group
+        for policy_name, statement in self.policy_statements(user_pool_id).items():
+            policy = verifiedpermissions.CfnPolicy(
+                self,
+                policy_name,
+                policy_store_id=self._policy_store_id,
+                definition=verifiedpermissions.CfnPolicy.PolicyDefinitionProperty(
+                    static=verifiedpermissions.CfnPolicy.StaticPolicyDefinitionProperty(
+                        statement=statement
+                    )
+                ),
+            )
+            policy.node.add_dependency(cfn_policy_store)
+
+        CfnOutput(
+            self,
+            "PolicyStoreId",
+            value=self._policy_store_id,
+            description="ID of the created policy store",
+        )
+
+    @property
+    def policy_store_id(self) -> str:
+        return self._policy_store_id
+
+    @property
+    def action_ids(self) -> list:
+        return self._action_ids
+
+    @staticmethod
+    def policy_statements(user_pool_id: str) -> dict:
+        """
+        Get the Cedar statements of the static policies in the store.
+        :param user_pool_id: The Cognito user pool used as identity source.
+        :return: A mapping of policy construct id to Cedar statement.
+        """
         # Manager policy statement
         manager_policy_statement = f"""permit (
             principal in AvpIotDemoApi::UserGroup::"{user_pool_id}|manager",
             action in [
                 AvpIotDemoApi::Action::"get /devices",
-                AvpIotDemoApi::Action::"post /download"
+                AvpIotDemoApi::Action::"post /download",
+                AvpIotDemoApi::Action::"post /download/batch",
+                AvpIotDemoApi::Action::"post /rollout"
             ],
             resource
         );"""
@@ -68,40 +112,7 @@ class AvpPolicyStore(Construct):
             resource
         );"""
 
-        # Create manager policy
-        manager_policy = verifiedpermissions.CfnPolicy(
-            self,
-            "ManagerPolicy",
-            policy_store_id=self._policy_store_id,
-            definition=verifiedpermissions.CfnPolicy.PolicyDefinitionProperty(
-                static=verifiedpermissions.CfnPolicy.StaticPolicyDefinitionProperty(
-                    statement=manager_policy_statement
-                )
-            ),
-        )
-
-        # Create operator policy
-        operator_policy = verifiedpermissions.CfnPolicy(
-            self,
-            "OperatorPolicy",
-            policy_store_id=self._policy_store_id,
-            definition=verifiedpermissions.CfnPolicy.PolicyDefinitionProperty(
-                static=verifiedpermissions.CfnPolicy.StaticPolicyDefinitionProperty(
-                    statement=operator_policy_statement
-                )
-            ),
-        )
-
-        manager_policy.node.add_dependency(cfn_policy_store)
-        operator_policy.node.add_dependency(cfn_policy_store)
-
-        CfnOutput(
-            self,
-            "PolicyStoreId",
-            value=self._policy_store_id,
-            description="ID of the created policy store",
-        )
-
-    @property
-    def policy_store_id(self) -> str:
-        return self._policy_store_id
+        return {
+            "ManagerPolicy": manager_policy_statement,
+            "OperatorPolicy": operator_policy_statement,
+        }
@@ -0,0 +1,151 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from ranged_download import fsync_directory
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_by_last_used ON blobs (last_used);
+CREATE TABLE IF NOT EXISTS links (
+    path TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_by_key ON links (key);
+"""
+
+
+def content_key(item):
+    """
+    Get the key a download message's content is stored under.
+    Objects are identified by their checksum, or by ETag and size when S3 holds no checksum.
+    :return: The key, or None if the message carries no manifest.
+    """
+    checksum = item.get('checksum')
+    if checksum:
+        return f"{checksum['algorithm'].lower()}-{base64.b64decode(checksum['value']).hex()}"
+    if item.get('etag') and item.get('size') is not None:
+        return "etag-" + hashlib.sha256(f"{item['etag']}:{item['size']}".encode('utf-8')).hexdigest()
+    return None
+
+
+class ArtifactStore:
+    """
+    Downloaded artifacts, stored once per content and hardlinked into the paths
+    where the device expects them, so that repeat pushes cost neither network nor
+    disk. An SQLite index tracks the size and last use of every blob and the paths
+    linked to it; once blobs exceed the quota, the least recently used ones are
+    evicted together with their links.
+    """
+
+    def __init__(self, root, quota_bytes=None):
+        """
+        :param root: Directory of the blobs and the index; must be on the same filesystem as the links.
+        :param quota_bytes: How much disk the blobs may use, or None for no limit.
+        """
+        self._blob_dir = os.path.join(root, "blobs")
+        self._quota_bytes = quota_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self._blob_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def _blob_path(self, key):
+        return os.path.join(self._blob_dir, key)
+
+    def _place_link(self, blob_path, local_path):
+        """Hardlink a blob to local_path, replacing whatever is there in one step."""
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        temporary_path = f"{local_path}.link"
+        if os.path.lexists(temporary_path):
+            os.remove(temporary_path)
+        os.link(blob_path, temporary_path)
+        os.replace(temporary_path, local_path)
+        fsync_directory(os.path.dirname(local_path))
+
+    def link(self, key, local_path):
+        """
+        Serve a download from the store.
+        :return: Whether local_path now holds the content; False if the store does not have it.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT size FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            blob_path = self._blob_path(key)
+            if not os.path.isfile(blob_path) or os.path.getsize(blob_path) != row[0]:
+                self._forget(key)
+                return False
+            if not (os.path.exists(local_path) and os.path.samefile(blob_path, local_path)):
+                self._place_link(blob_path, local_path)
+            with self._db:
+                self._db.execute("UPDATE blobs SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._db.execute("INSERT OR REPLACE INTO links (path, key) VALUES (?, ?)", (local_path, key))
+            return True
+
+    def add(self, key, local_path):
+        """Store a downloaded file under its content key, then evict blobs over the quota."""
+        with self._lock:
+            blob_path = self._blob_path(key)
+            if os.path.isfile(blob_path) and os.path.getsize(blob_path) == os.path.getsize(local_path):
+                # Downloaded again, e.g. by two workers at once; keep one copy
+                if not os.path.samefile(blob_path, local_path):
+                    self._place_link(blob_path, local_path)
+            else:
+                temporary_path = f"{blob_path}.tmp"
+                if os.path.lexists(temporary_path):
+                    os.remove(temporary_path)
+                os.link(local_path, temporary_path)
+                os.replace(temporary_path, blob_path)
+                fsync_directory(self._blob_dir)
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO blobs (key, size, last_used) VALUES (?, ?, ?)",
+                    (key, os.path.getsize(blob_path), time.time())
+                )
+                self._db.execute("INSERT OR REPLACE INTO links (path, key) VALUES (?, ?)", (local_path, key))
+            self._evict(keep=key)
+
+    def stats(self):
+        """Gauges of the store, e.g. {'blobs': 3, 'bytes': 1048576, 'links': 5}."""
+        with self._lock:
+            blobs, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            links = self._db.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+            return {'blobs': blobs, 'bytes': size, 'links': links}
+
+    def _evict(self, keep):
+        if self._quota_bytes is None:
+            return
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        for key, size in self._db.execute(
+            "SELECT key, size FROM blobs WHERE key != ? ORDER BY last_used", (keep,)
+        ).fetchall():
+            if total <= self._quota_bytes:
+                return
+            print(f"Artifact store over quota, evicting {key} ({size} bytes)")
+            self._forget(key)
+            total -= size
+
+    def _forget(self, key):
+        """Remove a blob, the links that still point to it, and its index entries."""
+        blob_path = self._blob_path(key)
+        for (path,) in self._db.execute("SELECT path FROM links WHERE key = ?", (key,)).fetchall():
+            try:
+                # The path may since hold another download
+                if os.path.exists(blob_path) and os.path.samefile(blob_path, path):
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+        with self._db:
+            self._db.execute("DELETE FROM links WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM blobs WHERE key = ?", (key,))
@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import zlib
+
+try:
+    from awscrt import checksums as crt_checksums
+except ImportError:
+    crt_checksums = None
+
+# The algorithms of the DownloadMessage checksum in the API's OpenAPI spec, in order of preference
+ALGORITHMS = ('SHA256', 'CRC64NVME', 'CRC32C', 'CRC32', 'SHA1')
+
+
+def _crc(update, width):
+    class Crc:
+        def __init__(self):
+            self._value = 0
+
+        def update(self, data):
+            self._value = update(data, self._value)
+
+        def digest(self):
+            return self._value.to_bytes(width, 'big')
+    return Crc
+
+
+def _checksum_factory(algorithm):
+    if algorithm == 'SHA256':
+        return hashlib.sha256
+    if algorithm == 'SHA1':
+        return hashlib.sha1
+    if algorithm == 'CRC32':
+        return _crc(zlib.crc32, 4)
+    if crt_checksums is not None and algorithm == 'CRC32C':
+        return _crc(crt_checksums.crc32c, 4)
+    # CRC64NVME only exists in awscrt 0.23 and later
+    crc64nvme = getattr(crt_checksums, 'crc64nvme', None)
+    if crc64nvme is not None and algorithm == 'CRC64NVME':
+        return _crc(crc64nvme, 8)
+    return None
+
+
+def new_digest(algorithm):
+    """
+    Start computing an S3 checksum incrementally.
+    :return: An object with update() and digest(), or None if the algorithm is not supported on this device.
+    """
+    factory = _checksum_factory(algorithm)
+    return factory() if factory is not None else None
+
+
+def checksum_of(head):
+    """Get the full-object checksum of a head_object response, if S3 holds one."""
+    # Checksums of multipart uploads cover the parts, and cannot be recomputed from the file alone
+    if head.get('ChecksumType') == 'COMPOSITE':
+        return None
+    for algorithm in ALGORITHMS:
+        value = head.get(f'Checksum{algorithm}')
+        if value and '-' not in value:
+            return {'algorithm': algorithm, 'value': value}
+    return None
+
+
+def encode_digest(digest):
+    """Encode a digest the way S3 reports checksums: base64 of the big-endian digest bytes."""
+    return base64.b64encode(digest.digest()).decode('ascii')
+
@@ -0,0 +1,107 @@
+import heapq
+import itertools
+import threading
+
+# What submit() does when the queue is full. It never waits for room: it runs on the MQTT
+# client's event loop thread, and blocking there stalls keep-alives and acknowledgements
+REJECT = 'reject'  # drop the new download
+DROP_LOWEST = 'drop-lowest'  # evict the lowest-priority queued download if the new one outranks it
+OVERFLOW_POLICIES = (REJECT, DROP_LOWEST)
+
+
+class DownloadPool:
+    """
+    A fixed number of worker threads draining a bounded priority queue of downloads.
+    Higher priorities run first; downloads of equal priority run in submission order.
+    A download that is already queued or running for the same key is not queued again.
+    """
+
+    def __init__(self, download, workers=4, max_queued=100, overflow=REJECT):
+        """
+        :param download: Called by a worker with the arguments given to submit().
+        :param workers: How many downloads run at once.
+        :param max_queued: How many downloads may wait for a worker.
+        :param overflow: One of OVERFLOW_POLICIES.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self._download = download
+        self._max_queued = max_queued
+        self._overflow = overflow
+        self._heap = []
+        self._sequence = itertools.count()
+        self._keys = set()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._in_flight = 0
+        self._counters = {'completed': 0, 'failed': 0, 'rejected': 0, 'evicted': 0, 'duplicates': 0}
+        self._workers = [
+            threading.Thread(target=self._work, name=f"download-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key, *args, priority=0):
+        """
+        Queue a download without waiting.
+        :param key: Identifies the download, e.g. its local path.
+        :return: Whether the download was queued.
+        """
+        with self._condition:
+            if key in self._keys:
+                self._counters['duplicates'] += 1
+                return False
+            if len(self._heap) >= self._max_queued:
+                if self._overflow == DROP_LOWEST and self._heap and max(self._heap)[0] > -priority:
+                    # The heap holds negated priorities, so its largest entry has the lowest priority
+                    evicted = max(self._heap)
+                    self._heap.remove(evicted)
+                    heapq.heapify(self._heap)
+                    self._keys.discard(evicted[2])
+                    self._counters['evicted'] += 1
+                    print(f"Download queue full, dropped queued download {evicted[2]}")
+                else:
+                    self._counters['rejected'] += 1
+                    print(f"Download queue full, rejected download {key}")
+                    return False
+            if self._stopping:
+                return False
+            heapq.heappush(self._heap, (-priority, next(self._sequence), key, args))
+            self._keys.add(key)
+            self._condition.notify_all()
+            return True
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._heap or self._stopping)
+                if not self._heap:
+                    return
+                _, _, key, args = heapq.heappop(self._heap)
+                self._in_flight += 1
+
+            succeeded = False
+            try:
+                succeeded = self._download(*args) is not False
+            except Exception as e:
+                print(f"Download {key} failed: {str(e)}")
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._keys.discard(key)
+                    self._counters['completed' if succeeded else 'failed'] += 1
+
+    def stats(self):
+        """Gauges and counters of the pool, e.g. {'queued': 3, 'inFlight': 4, 'completed': 10, ...}."""
+        with self._condition:
+            return {'queued': len(self._heap), 'inFlight': self._in_flight, **self._counters}
+
+    def shutdown(self, wait=True):
+        """Stop accepting downloads; workers finish the queued ones first."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
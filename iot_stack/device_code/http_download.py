@@ -0,0 +1,129 @@
+import os
+
+import urllib3
+
+from checksums import encode_digest, new_digest
+from ranged_download import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_PART_SIZE,
+    ChecksumMismatchError,
+    discard,
+    download_ranges,
+    fsync_directory,
+    partial_path_for,
+    state_path_for,
+)
+
+CHUNK_SIZE = 1024 * 1024
+
+_RETRIES = urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+_TIMEOUT = urllib3.Timeout(connect=5, read=60)
+
+# One pool for every download, so that connections to S3 are reused across files
+_http = urllib3.PoolManager(maxsize=8, retries=_RETRIES, timeout=_TIMEOUT)
+
+
+class ObjectChangedError(RuntimeError):
+    """The object no longer has the ETag the download started with."""
+
+
+def configure(max_connections):
+    """Size the connection pool, e.g. to download workers times part concurrency."""
+    global _http
+    _http = urllib3.PoolManager(maxsize=max_connections, retries=_RETRIES, timeout=_TIMEOUT)
+
+
+def _read_range(url, etag):
+    def read_range(start, end):
+        headers = {'Range': f"bytes={start}-{end}"}
+        if etag:
+            headers['If-Match'] = etag
+        response = _http.request('GET', url, headers=headers, preload_content=False)
+        try:
+            if response.status == 412:
+                raise ObjectChangedError(f"GET returned HTTP {response.status}")
+            # A 200 is the whole object; it only helps a range that starts at the beginning
+            if response.status != 206 and not (response.status == 200 and start == 0):
+                raise RuntimeError(f"GET returned HTTP {response.status}")
+            remaining = end - start + 1
+            for chunk in response.stream(CHUNK_SIZE):
+                yield chunk[:remaining]
+                remaining -= len(chunk)
+                if remaining <= 0:
+                    break
+        finally:
+            response.release_conn()
+    return read_range
+
+
+def download_url(url, local_path, size=None, etag=None, part_size=DEFAULT_PART_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, checksum=None):
+    """
+    Download a presigned URL to local_path.
+    When the size is known, the object is fetched as parallel range requests, and an
+    interrupted attempt resumes from the last byte each part recorded. Otherwise it is
+    streamed, and a partial file left by an interrupted attempt is resumed with one
+    range request.
+    :param size: The expected size in bytes.
+    :param etag: The expected ETag. It is sent as If-Match, so that a download
+                 never mixes two versions of the object.
+    :param checksum: The checksum of the manifest, verified as the download arrives.
+    :raises: RuntimeError if the download fails, is incomplete or does not match the checksum.
+    """
+    if size is not None:
+        try:
+            download_ranges(_read_range(url, etag), local_path, size, etag, part_size, concurrency, checksum)
+        except ObjectChangedError:
+            # What was downloaded so far belongs to the old version
+            discard(local_path)
+            raise
+        return
+
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    partial_path = partial_path_for(local_path)
+    if os.path.exists(state_path_for(local_path)):
+        # Left by a ranged download, so the partial file has gaps
+        discard(local_path)
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+
+    digest = None
+    if checksum:
+        digest = new_digest(checksum['algorithm'])
+        if digest is None:
+            print(f"Cannot verify {checksum['algorithm']} checksums on this device")
+
+    headers = {'If-Match': etag} if etag else {}
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+    response = _http.request('GET', url, headers=headers, preload_content=False)
+    try:
+        if response.status == 412 and os.path.exists(partial_path):
+            # The object changed; what was downloaded so far belongs to the old version
+            os.remove(partial_path)
+        if response.status not in (200, 206):
+            raise RuntimeError(f"GET returned HTTP {response.status}")
+        if digest is not None and response.status == 206:
+            # The checksum covers the bytes an earlier attempt wrote
+            with open(partial_path, 'rb') as file:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        # A 200 means the server sent the whole object rather than the requested range
+        with open(partial_path, 'ab' if response.status == 206 else 'wb') as file:
+            for chunk in response.stream(CHUNK_SIZE):
+                file.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+    finally:
+        response.release_conn()
+
+    if digest is not None:
+        actual = encode_digest(digest)
+        if actual != checksum['value']:
+            discard(local_path)
+            raise ChecksumMismatchError(
+                f"{checksum['algorithm']} checksum mismatch: expected {checksum['value']}, got {actual}"
+            )
+    os.replace(partial_path, local_path)
+    fsync_directory(os.path.dirname(local_path))
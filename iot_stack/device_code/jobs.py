@@ -0,0 +1,121 @@
+import threading
+
+from awscrt import mqtt
+from awsiot import iotjobs
+
+
+class JobRunner:
+    """
+    Executes the AWS IoT Jobs queued for this thing, one at a time, and reports
+    the outcome of each back to the Jobs service.
+
+    Handlers are looked up by the "operation" field of the job document. A
+    handler receives the document and returns status details to report; if it
+    raises, the job execution is reported as FAILED.
+    """
+
+    def __init__(self, mqtt_connection, thing_name, handlers):
+        self._jobs_client = iotjobs.IotJobsClient(mqtt_connection)
+        self._thing_name = thing_name
+        self._handlers = handlers
+        self._lock = threading.Lock()
+        self._busy = False
+        self._pending = False
+
+    def start(self):
+        """Subscribe to job notifications and ask for the first queued job."""
+        subscriptions = [
+            self._jobs_client.subscribe_to_next_job_execution_changed_events(
+                iotjobs.NextJobExecutionChangedSubscriptionRequest(thing_name=self._thing_name),
+                mqtt.QoS.AT_LEAST_ONCE,
+                self._on_next_job_execution_changed,
+            ),
+            self._jobs_client.subscribe_to_start_next_pending_job_execution_accepted(
+                iotjobs.StartNextPendingJobExecutionSubscriptionRequest(thing_name=self._thing_name),
+                mqtt.QoS.AT_LEAST_ONCE,
+                self._on_start_next_accepted,
+            ),
+            self._jobs_client.subscribe_to_start_next_pending_job_execution_rejected(
+                iotjobs.StartNextPendingJobExecutionSubscriptionRequest(thing_name=self._thing_name),
+                mqtt.QoS.AT_LEAST_ONCE,
+                self._on_rejected,
+            ),
+            self._jobs_client.subscribe_to_update_job_execution_rejected(
+                iotjobs.UpdateJobExecutionSubscriptionRequest(thing_name=self._thing_name, job_id='+'),
+                mqtt.QoS.AT_LEAST_ONCE,
+                self._on_update_rejected,
+            ),
+        ]
+        for subscribe_future, _ in subscriptions:
+            subscribe_future.result()
+
+        self._request_next_job()
+
+    def _request_next_job(self):
+        with self._lock:
+            if self._busy:
+                # Ask again once the current job has finished
+                self._pending = True
+                return
+            self._busy = True
+        self._jobs_client.publish_start_next_pending_job_execution(
+            iotjobs.StartNextPendingJobExecutionRequest(thing_name=self._thing_name),
+            mqtt.QoS.AT_LEAST_ONCE,
+        )
+
+    def _job_finished(self, request_next=False):
+        with self._lock:
+            self._busy = False
+            request_next, self._pending = request_next or self._pending, False
+        if request_next:
+            self._request_next_job()
+
+    def _on_next_job_execution_changed(self, event):
+        if event is not None and event.execution is not None:
+            print(f"Job {event.execution.job_id} is queued")
+            self._request_next_job()
+
+    def _on_start_next_accepted(self, response):
+        if response is None or response.execution is None:
+            print("No queued jobs")
+            self._job_finished()
+            return
+        # Run the job off the MQTT event loop thread
+        threading.Thread(target=self._run, args=(response.execution,), daemon=True).start()
+
+    def _on_rejected(self, error):
+        print(f"Start next job rejected: {error.code if error else 'unknown'}")
+        self._job_finished()
+
+    def _on_update_rejected(self, error):
+        # The Jobs service times the execution out if its status never arrives
+        print(f"Job status update rejected: {error.code if error else 'unknown'}")
+
+    def _run(self, execution):
+        document = execution.job_document or {}
+        status, details = 'SUCCEEDED', {}
+        try:
+            handler = self._handlers.get(document.get('operation'))
+            if handler is None:
+                raise ValueError(f"Unsupported operation: {document.get('operation')}")
+            print(f"Running job {execution.job_id}")
+            details = handler(document) or {}
+        except Exception as e:
+            print(f"Job {execution.job_id} failed: {str(e)}")
+            status, details = 'FAILED', {'reason': str(e)[:1024]}
+
+        try:
+            self._jobs_client.publish_update_job_execution(
+                iotjobs.UpdateJobExecutionRequest(
+                    thing_name=self._thing_name,
+                    job_id=execution.job_id,
+                    status=status,
+                    status_details={key: str(value) for key, value in details.items()},
+                    expected_version=execution.version_number,
+                ),
+                mqtt.QoS.AT_LEAST_ONCE,
+            ).result()
+            print(f"Job {execution.job_id} reported as {status}")
+        finally:
+            # Pick up whatever was queued while this job ran
+            self._job_finished(request_next=True)
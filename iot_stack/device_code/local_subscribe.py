@@ -1,5 +1,6 @@
 import json
 import boto3
+from botocore.config import Config
 import time
 import os
 import threading
@@ -9,12 +10,45 @@ from awsiot import mqtt_connection_builder
 import argparse
 from urllib.parse import urlparse
 
+from artifact_store import ArtifactStore, content_key
+from checksums import checksum_of
+from download_pool import OVERFLOW_POLICIES, REJECT, DownloadPool
+import http_download
+from http_download import download_url
+from jobs import JobRunner
+from ranged_download import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_PART_SIZE,
+    download_ranges,
+)
+
 
 CERT_PATH = "/home/ec2-user/certs"
 CERTIFICATE = os.path.join(CERT_PATH, "device.pem.crt")
 PRIVATE_KEY = os.path.join(CERT_PATH, "private.pem.key")
 ROOT_CA = os.path.join(CERT_PATH, "AmazonRootCA1.pem")
 
+DOWNLOAD_DIR = "/home/ec2-user/downloads"
+# Blobs live next to the dated downloads, so that they can be hardlinked
+STORE_DIR = os.path.join(DOWNLOAD_DIR, ".store")
+
+# How often the download pool gauges are printed while they change
+STATS_INTERVAL_SECONDS = 60
+
+# How each file is split into ranged GETs; set from the command line in main()
+PART_SIZE = DEFAULT_PART_SIZE
+PART_CONCURRENCY = DEFAULT_CONCURRENCY
+CHUNK_SIZE = 1024 * 1024
+
+# The thing this device downloads for; set from the command line in main()
+THING_NAME = None
+
+# Created in main()
+download_pool = None
+artifact_store = None
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
 
 def get_current_region():
     """Get current AWS region from environment variables or EC2 metadata."""
@@ -60,29 +94,114 @@ def parse_s3_uri(s3_uri):
     key = parsed.path.lstrip('/')
     return bucket, key
 
-def download_from_s3(s3_uri, local_path):
-    """Download file from S3."""
+def get_s3_client(max_pool_connections=10):
+    """Get the S3 client shared by every download, creating it on first use."""
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client(
+                's3',
+                region_name=get_current_region(),
+                config=Config(max_pool_connections=max_pool_connections, retries={'mode': 'adaptive'})
+            )
+    return _s3_client
+
+def _read_s3_range(s3_client, request):
+    def read_range(start, end):
+        body = s3_client.get_object(**request, Range=f"bytes={start}-{end}")['Body']
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+    return read_range
+
+def download_from_s3(s3_uri, local_path, version_id=None, checksum=None):
+    """
+    Download file from S3 as parallel ranged GETs.
+    An interrupted download resumes from the last byte each part recorded.
+    :param checksum: The checksum of the manifest; defaults to the one S3 holds for the object.
+    """
     try:
         bucket, key = parse_s3_uri(s3_uri)
-        s3_client = boto3.client('s3')
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        
+        s3_client = get_s3_client()
+
         print(f"Downloading {s3_uri} to {local_path}")
-        s3_client.download_file(bucket, key, local_path)
+        request = {'Bucket': bucket, 'Key': key}
+        if version_id:
+            request['VersionId'] = version_id
+        head = s3_client.head_object(**request, ChecksumMode='ENABLED')
+        # Every part must come from the version the download started with
+        download_ranges(
+            _read_s3_range(s3_client, {**request, 'IfMatch': head['ETag']}),
+            local_path,
+            head['ContentLength'],
+            head['ETag'],
+            part_size=PART_SIZE,
+            concurrency=PART_CONCURRENCY,
+            checksum=checksum or checksum_of(head)
+        )
         print(f"Successfully downloaded file to {local_path}")
         return True
     except Exception as e:
         print(f"Error downloading file: {str(e)}")
         return False
 
-def download_worker(s3_path, local_path):
-    """Worker function to download file in a separate thread."""
-    try:
-        download_from_s3(s3_path, local_path)
-    except Exception as e:
-        print(f"Error in download worker thread: {str(e)}")
+def reuse_local_copy(item, local_path):
+    """
+    Serve a download from the artifact store if it already holds the same content.
+    :return: Whether the file at local_path is now up to date.
+    """
+    key = content_key(item)
+    if key is None or not artifact_store.link(key, local_path):
+        return False
+    print(f"Already have {item['s3Path']} (ETag {item.get('etag')}), linked it to {local_path}")
+    return True
+
+def fetch(item, local_path):
+    """
+    Download the object of a download message or job document.
+    Objects whose content is already in the artifact store are not downloaded again.
+    The presigned URL is used when the item carries one; the S3 API is the fallback.
+    Either way the checksum is verified while the file downloads, and the file
+    only appears at local_path once it is complete and matches.
+    :return: Whether the download succeeded.
+    """
+    if reuse_local_copy(item, local_path):
+        return True
+
+    downloaded = False
+    if item.get('url'):
+        try:
+            print(f"Downloading {item['s3Path']} to {local_path} with a presigned URL")
+            download_url(item['url'], local_path, item.get('size'), item.get('etag'),
+                         part_size=PART_SIZE, concurrency=PART_CONCURRENCY, checksum=item.get('checksum'))
+            print(f"Successfully downloaded file to {local_path}")
+            downloaded = True
+        except Exception as e:
+            print(f"Presigned download failed, retrying with the S3 API: {str(e)}")
+    if not downloaded and not download_from_s3(item['s3Path'], local_path, item.get('versionId'),
+                                               item.get('checksum')):
+        return False
+
+    key = content_key(item)
+    if key is not None:
+        artifact_store.add(key, local_path)
+    return True
+
+def local_path_for(device_id, timestamp_obj, s3_path):
+    """Get where a downloaded file is stored on the device."""
+    local_directory = f"{DOWNLOAD_DIR}/{device_id}/{timestamp_obj.strftime('%Y-%m-%d')}"
+    return f"{local_directory}/{os.path.basename(s3_path)}"
+
+def run_download_job(device_id, document):
+    """Download the file of an IoT Job document, raising if the download fails."""
+    s3_path = document.get('s3Path')
+    if not s3_path:
+        raise ValueError("No S3 path provided in job document")
+    local_path = local_path_for(device_id, datetime.utcnow(), s3_path)
+    if not fetch(document, local_path):
+        raise RuntimeError(f"Downloading {s3_path} failed")
+    return {'localPath': local_path}
 
 def on_connection_interrupted(connection, error, **kwargs):
     print(f"Connection interrupted. error: {error}")
@@ -98,29 +217,30 @@ def on_message_received(topic, payload, dup, qos, retain, **kwargs):
         print(f"Received message from topic '{topic}': {json.dumps(message, indent=2)}")
 
         # Extract information from payload
-        device_id = message.get('iotdevice')
+        device_id = message.get('device')
         timestamp = message.get('timestamp')
         s3_path = message.get('s3Path')
 
+        if device_id != THING_NAME:
+            print(f"Ignoring message for device {device_id}")
+            return
+
         if not s3_path:
             print("No S3 path provided in message")
             return
 
         # Create local file path
         timestamp_obj = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%SZ")
-        local_directory = f"/home/ec2-user/downloads/{device_id}/{timestamp_obj.strftime('%Y-%m-%d')}"
-        filename = os.path.basename(s3_path)
-        local_path = f"{local_directory}/{filename}"
-
-        # Start a new thread to download the file
-        print(f"Starting download thread for {s3_path}")
-        download_thread = threading.Thread(
-            target=download_worker,
-            args=(s3_path, local_path),
-            daemon=True
-        )
-        download_thread.start()
-        print(f"Download thread started for {s3_path}")
+        local_path = local_path_for(device_id, timestamp_obj, s3_path)
+
+        priority = message.get('priority', 0)
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            print(f"Ignoring invalid priority: {priority}")
+            priority = 0
+
+        # Queue the download for the worker pool
+        if download_pool.submit(local_path, message, local_path, priority=priority):
+            print(f"Queued download of {s3_path} with priority {priority}")
 
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON payload: {str(e)}")
@@ -130,9 +250,25 @@ def on_message_received(topic, payload, dup, qos, retain, **kwargs):
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser(description="IoT Core subscriber and S3 downloader")
-    parser.add_argument('--topic', required=True, help='Topic to subscribe to')
+    parser.add_argument('--topic', required=True,
+                      help='Topic downloads are sent under; the device subscribes to <topic>/<thing name>')
     parser.add_argument('--client-id', default='avp-iot-device',
                       help='Client ID for MQTT connection (default: ec2-subscriber)')
+    parser.add_argument('--thing-name',
+                      help='Also run the IoT Jobs queued for this thing (e.g. rollouts)')
+    parser.add_argument('--download-workers', type=int, default=4,
+                      help='Number of downloads that run at once (default: 4)')
+    parser.add_argument('--max-queued-downloads', type=int, default=100,
+                      help='Number of downloads that may wait for a worker (default: 100)')
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default=REJECT,
+                      help='What to do with a download when the queue is full (default: reject)')
+    parser.add_argument('--part-size-mb', type=int, default=DEFAULT_PART_SIZE // (1024 * 1024),
+                      help='Size of the ranges each file is downloaded in (default: 8)')
+    parser.add_argument('--part-concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                      help='Number of ranges of a file that download at once (default: 4)')
+    parser.add_argument('--store-quota-mb', type=int, default=2048,
+                      help='Disk the artifact store may use before least recently used '
+                           'artifacts are evicted; 0 for no limit (default: 2048)')
 
     args = parser.parse_args()
 
@@ -145,6 +281,26 @@ def main():
         if not os.path.exists(cert_file):
             raise FileNotFoundError(f"{cert_name} not found at {cert_file}")
 
+    global download_pool, artifact_store, THING_NAME, PART_SIZE, PART_CONCURRENCY
+    # The IoT policy only lets a thing connect with its own name as the client id
+    THING_NAME = args.thing_name or args.client_id
+    PART_SIZE = args.part_size_mb * 1024 * 1024
+    PART_CONCURRENCY = args.part_concurrency
+    # Every part of every running download holds a connection
+    max_connections = args.download_workers * args.part_concurrency
+    get_s3_client(max_pool_connections=max_connections)
+    http_download.configure(max_connections)
+    artifact_store = ArtifactStore(
+        STORE_DIR,
+        quota_bytes=args.store_quota_mb * 1024 * 1024 if args.store_quota_mb else None
+    )
+    download_pool = DownloadPool(
+        fetch,
+        workers=args.download_workers,
+        max_queued=args.max_queued_downloads,
+        overflow=args.overflow
+    )
+
     # Get IoT endpoint
     print("Getting IoT endpoint...")
     endpoint = get_iot_endpoint()
@@ -168,20 +324,36 @@ def main():
     connect_future.result()
     print("Connected!")
 
-    print(f"Subscribing to topic: {args.topic}")
+    topic = f"{args.topic}/{THING_NAME}"
+    print(f"Subscribing to topic: {topic}")
     subscribe_future, _ = mqtt_connection.subscribe(
-        topic=args.topic,
+        topic=topic,
         qos=mqtt.QoS.AT_LEAST_ONCE,
         callback=on_message_received
     )
     subscribe_future.result()
-    print(f"Subscribed to topic: {args.topic}")
+    print(f"Subscribed to topic: {topic}")
+
+    if args.thing_name:
+        print(f"Starting IoT Jobs runner for thing: {args.thing_name}")
+        job_runner = JobRunner(
+            mqtt_connection,
+            args.thing_name,
+            {'download': lambda document: run_download_job(args.thing_name, document)}
+        )
+        job_runner.start()
 
-    # Keep the main thread alive
+    # Keep the main thread alive, reporting the download pool and store gauges while they change
     try:
+        last_stats, last_report = None, 0
         while True:
             time.sleep(1)
+            stats = download_pool.stats()
+            if stats != last_stats and time.time() - last_report >= STATS_INTERVAL_SECONDS:
+                print(f"Download pool: {json.dumps(stats)}, artifact store: {json.dumps(artifact_store.stats())}")
+                last_stats, last_report = stats, time.time()
     except KeyboardInterrupt:
+        download_pool.shutdown(wait=False)
         print("Disconnecting...")
         disconnect_future = mqtt_connection.disconnect()
         disconnect_future.result()
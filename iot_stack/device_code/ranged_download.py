@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from checksums import encode_digest, new_digest
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+CHUNK_SIZE = 1024 * 1024
+
+# How far parts may run ahead of the first missing byte while a checksum is computed
+MAX_BUFFERED_BYTES = 16 * 1024 * 1024
+
+
+class ChecksumMismatchError(RuntimeError):
+    """The downloaded bytes do not match the checksum of the manifest."""
+
+
+def partial_path_for(local_path):
+    """Where a download is written until it is complete."""
+    return f"{local_path}.part"
+
+
+def state_path_for(local_path):
+    """Where the progress of a ranged download is kept until it is complete."""
+    return f"{local_path}.part.json"
+
+
+def discard(local_path):
+    """Remove what an unfinished download left behind."""
+    for path in (partial_path_for(local_path), state_path_for(local_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def fsync_directory(path):
+    """Make a rename into a directory durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _OrderedDigest:
+    """
+    Feeds a digest the bytes of a file in order while parts arrive out of order.
+    Chunks ahead of the first missing byte wait in memory, and a part that runs too
+    far ahead waits for the parts before it. Bytes an earlier attempt wrote are read
+    back from the file when the digest reaches them.
+    """
+
+    def __init__(self, digest, fd, written, max_buffered=MAX_BUFFERED_BYTES):
+        """
+        :param written: (start, end) byte ranges already in the file, end exclusive.
+        """
+        self.digest = digest
+        self._fd = fd
+        self._written = written
+        self._max_buffered = max_buffered
+        self._offset = 0
+        self._pending = {}
+        self._buffered = 0
+        self._cancelled = False
+        self._condition = threading.Condition()
+        with self._condition:
+            self._advance()
+
+    def update(self, offset, chunk):
+        with self._condition:
+            # The chunk at the first missing byte is always taken, so the digest never stalls
+            self._condition.wait_for(lambda: self._cancelled or offset == self._offset
+                                     or self._buffered + len(chunk) <= self._max_buffered)
+            if self._cancelled:
+                raise RuntimeError("Download cancelled")
+            self._pending[offset] = chunk
+            self._buffered += len(chunk)
+            self._advance()
+            self._condition.notify_all()
+
+    def cancel(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def _advance(self):
+        while True:
+            if self._offset in self._pending:
+                chunk = self._pending.pop(self._offset)
+                self._buffered -= len(chunk)
+                self.digest.update(chunk)
+                self._offset += len(chunk)
+                continue
+            end = next((end for start, end in self._written if start <= self._offset < end), None)
+            if end is None:
+                return
+            while self._offset < end:
+                chunk = os.pread(self._fd, min(CHUNK_SIZE, end - self._offset), self._offset)
+                self.digest.update(chunk)
+                self._offset += len(chunk)
+
+
+def _parts(size, part_size):
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def _load_progress(local_path, parts, size, etag, part_size):
+    """
+    Get how many bytes of each part an earlier attempt wrote.
+    Progress only carries over if the earlier attempt downloaded the same object
+    version with the same part size. A partial file without state was written
+    front to back, so its length is the progress.
+    """
+    state_path, partial_path = state_path_for(local_path), partial_path_for(local_path)
+    if os.path.exists(state_path):
+        try:
+            with open(state_path) as file:
+                state = json.load(file)
+            if (state['size'], state['etag'], state['partSize']) == (size, etag, part_size) \
+                    and len(state['progress']) == len(parts):
+                return [max(0, min(int(done), end - start + 1)) for done, (start, end) in zip(state['progress'], parts)]
+        except (ValueError, KeyError, TypeError):
+            pass
+        return [0] * len(parts)
+
+    prefix = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    return [max(0, min(prefix - start, end - start + 1)) for start, end in parts]
+
+
+def download_ranges(read_range, local_path, size, etag=None, part_size=DEFAULT_PART_SIZE,
+                    concurrency=DEFAULT_CONCURRENCY, checksum=None):
+    """
+    Download an object of known size as parts fetched in parallel.
+    Every part is written in place into a preallocated partial file, and the bytes
+    written per part are recorded in a state file as parts finish or fail, so that an
+    interrupted download resumes from the last recorded byte of each part. The
+    checksum is computed as bytes arrive, and the file only replaces local_path once
+    it is synced to disk and matches.
+    :param read_range: Called with the first and last byte of a range; yields its bytes in order.
+    :param etag: Identifies the object version; progress made on another version is discarded.
+    :param checksum: The expected checksum, {"algorithm": "SHA256", "value": "<base64>"}.
+    :raises: ChecksumMismatchError, RuntimeError if a part is incomplete, or whatever read_range raises.
+    """
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    parts = _parts(size, part_size)
+    progress = _load_progress(local_path, parts, size, etag, part_size)
+    lock = threading.Lock()
+    cancelled = threading.Event()
+    state_path = state_path_for(local_path)
+
+    def save_state():
+        with lock:
+            temporary_path = f"{state_path}.tmp"
+            with open(temporary_path, 'w') as file:
+                json.dump({'size': size, 'etag': etag, 'partSize': part_size, 'progress': progress}, file)
+            os.replace(temporary_path, state_path)
+
+    def fetch(index):
+        start, end = parts[index]
+        offset = start + progress[index]
+        if offset > end:
+            return
+        try:
+            for chunk in read_range(offset, end):
+                if cancelled.is_set():
+                    raise RuntimeError("Download cancelled")
+                if offset + len(chunk) > end + 1:
+                    raise RuntimeError(f"Received more than bytes {start}-{end}")
+                os.pwrite(fd, chunk, offset)
+                if digest is not None:
+                    digest.update(offset, chunk)
+                offset += len(chunk)
+                progress[index] = offset - start
+        finally:
+            save_state()
+        if offset != end + 1:
+            raise RuntimeError(f"Received bytes {start}-{offset - 1} of {start}-{end}")
+
+    # Record the state first, so that the preallocated file is never mistaken for a front-to-back prefix
+    save_state()
+    fd = os.open(partial_path_for(local_path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        digest = None
+        if checksum:
+            algorithm_digest = new_digest(checksum['algorithm'])
+            if algorithm_digest is None:
+                print(f"Cannot verify {checksum['algorithm']} checksums on this device")
+            else:
+                written = [(start, start + done) for done, (start, _) in zip(progress, parts) if done]
+                digest = _OrderedDigest(algorithm_digest, fd, written, MAX_BUFFERED_BYTES)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(parts))))
+        try:
+            futures = [executor.submit(fetch, index) for index in range(len(parts))]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+        except BaseException:
+            cancelled.set()
+            if digest is not None:
+                digest.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    if digest is not None:
+        actual = encode_digest(digest.digest)
+        if actual != checksum['value']:
+            discard(local_path)
+            raise ChecksumMismatchError(
+                f"{checksum['algorithm']} checksum mismatch: expected {checksum['value']}, got {actual}"
+            )
+    os.replace(partial_path_for(local_path), local_path)
+    os.remove(state_path)
+    fsync_directory(os.path.dirname(local_path))
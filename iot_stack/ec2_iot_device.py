@@ -19,6 +19,7 @@ from aws_cdk import (
 from cdk_nag import NagSuppressions, NagPackSuppression
 
 from constructs import Construct
+import hashlib
 import os
 
 class IoTThingStack(Stack):
@@ -60,6 +61,20 @@ class IoTThingStack(Stack):
 
         # Use the parameter throughout the code
         thing_name = thing_name_parameter.value_as_string
+
+        # Rollouts (IoT Jobs) target every thing in this group
+        thing_group_parameter = CfnParameter(
+            self, "ThingGroupName",
+            type="String",
+            description="Name of the IoT Thing Group targeted by rollouts",
+            default="avp-iot-devices"
+        )
+        thing_group_name = thing_group_parameter.value_as_string
+
+        thing_group = iot.CfnThingGroup(
+            self, "ThingGroup",
+            thing_group_name=thing_group_name
+        )
         
         
         # Lambda function for certificate creation
@@ -77,6 +92,7 @@ class IoTThingStack(Stack):
                 "THING_NAME": thing_name,
                 "IOT_TOPIC": topic_parameter.value_as_string,
                 "IOT_POLICY": f"{thing_name}-policy",
+                "THING_GROUP": thing_group_name,
                 "REGION": self.region,
                 "ACCOUNT": self.account
             },
@@ -188,6 +204,7 @@ class IoTThingStack(Stack):
                 "iot:GetPolicy",
                 "iot:DeletePolicy",
                 "iot:ListPolicyVersions",
+                "iot:CreatePolicyVersion",
                 "iot:DeletePolicyVersion"
             ],
             resources=[
@@ -198,15 +215,37 @@ class IoTThingStack(Stack):
 
 
 
+        cert_handler.add_to_role_policy(iam.PolicyStatement(
+            actions=[
+                "iot:AddThingToThingGroup"
+            ],
+            resources=[
+                f"arn:aws:iot:{self.region}:{self.account}:thinggroup/{thing_group_name}",
+                f"arn:aws:iot:{self.region}:{self.account}:thing/{thing_name}"
+            ]
+        ))
+
+        # CloudFormation only sends Update when the properties change, so they carry
+        # everything the handler applies; the handler source stands in for the policy document
+        with open(os.path.join(lambda_path, "create_cert.py"), "rb") as handler_source:
+            handler_hash = hashlib.sha256(handler_source.read()).hexdigest()
+
         # Create custom resource
         cert_resource = CustomResource(
             self, "CertificateResource",
             removal_policy=RemovalPolicy.RETAIN,
+            properties={
+                "TopicName": topic_parameter.value_as_string,
+                "ThingGroupName": thing_group_name,
+                "HandlerHash": handler_hash
+            },
             service_token=cr.Provider(
                 self, "CertProvider",
                 on_event_handler=cert_handler
             ).service_token
         )
+        # The handler adds the thing to the group, which is only passed by name
+        cert_resource.node.add_dependency(thing_group)
 
 
 
@@ -281,15 +320,15 @@ class IoTThingStack(Stack):
 
 
 
-        # Add S3 permissions using the parameter
+        # Add S3 permissions using the parameter. Download messages normally carry a
+        # presigned URL; these are only needed when a device falls back to the S3 API
         s3_policy = iam.PolicyStatement(
             sid="S3BucketAccess",  # Add a statement ID for better identification
             actions=[
                 "s3:GetObject",
-                "s3:ListBucket"
+                "s3:GetObjectVersion"
             ],
             resources=[
-                f"arn:aws:s3:::{bucket_parameter.value_as_string}",
                 f"arn:aws:s3:::{bucket_parameter.value_as_string}/*"
             ]
         )
@@ -390,6 +429,20 @@ class IoTThingStack(Stack):
             description="EC2 Instance Public IP"
         )
 
+        CfnOutput(
+            self, "ThingGroupNameOutput",
+            value=thing_group.thing_group_name,
+            description="IoT Thing Group targeted by rollouts",
+            export_name="IoTThingGroupName-Export"
+        )
+
+        CfnOutput(
+            self, "BucketNameOutput",
+            value=bucket_parameter.value_as_string,
+            description="S3 bucket that devices download from",
+            export_name="IoTBucketName-Export"
+        )
+
         CfnOutput(
             self, "TopicNameOutput",
             value=topic_parameter.value_as_string,
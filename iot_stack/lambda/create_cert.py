@@ -7,6 +7,101 @@ import os
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+def policy_document(region, account_id, thing_name, topic):
+    """
+    Build the IoT policy that lets the device run downloads and rollouts.
+    :param region: The region of the IoT endpoint.
+    :param account_id: The account that owns the thing.
+    :param thing_name: The thing, which is also the MQTT client ID.
+    :param topic: The topic that downloads are published under.
+    :return: The policy document.
+    """
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "iot:Connect"
+                ],
+                "Resource": [f"arn:aws:iot:{region}:{account_id}:client/{thing_name}"]
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "iot:Publish"
+                ],
+                "Resource": [f"arn:aws:iot:{region}:{account_id}:topic/{topic}"]
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "iot:Subscribe"
+                ],
+                # Each thing only receives the downloads sent to it
+                "Resource": [f"arn:aws:iot:{region}:{account_id}:topicfilter/{topic}/{thing_name}"]
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "iot:Receive"
+                ],
+                "Resource": [f"arn:aws:iot:{region}:{account_id}:topic/{topic}/{thing_name}"]
+            },
+            # Reserved topics used by the device to run IoT Jobs (rollouts)
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "iot:Publish",
+                    "iot:Receive"
+                ],
+                "Resource": [f"arn:aws:iot:{region}:{account_id}:topic/$aws/things/{thing_name}/jobs/*"]
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "iot:Subscribe"
+                ],
+                "Resource": [f"arn:aws:iot:{region}:{account_id}:topicfilter/$aws/things/{thing_name}/jobs/*"]
+            }
+        ]
+    }
+
+
+def delete_old_policy_versions(iot, policy_name):
+    """
+    Delete every version of a policy except the default one. A policy keeps at most
+    five versions, and cannot be deleted while it has more than one.
+    """
+    for version in iot.list_policy_versions(policyName=policy_name)['policyVersions']:
+        if not version.get('isDefaultVersion'):
+            iot.delete_policy_version(policyName=policy_name, policyVersionId=version['versionId'])
+
+
+def ensure_policy(iot, policy_name, document):
+    """
+    Create the policy, or make the document its default version if the policy
+    exists with another one. Certificates keep the policy attached across versions.
+    """
+    try:
+        current = iot.get_policy(policyName=policy_name)
+    except iot.exceptions.ResourceNotFoundException:
+        iot.create_policy(policyName=policy_name, policyDocument=json.dumps(document))
+        logger.info("Created new IoT policy: %s", policy_name)
+        return
+
+    if json.loads(current['policyDocument']) == document:
+        logger.info("Policy '%s' is up to date", policy_name)
+        return
+    delete_old_policy_versions(iot, policy_name)
+    version = iot.create_policy_version(
+        policyName=policy_name,
+        policyDocument=json.dumps(document),
+        setAsDefault=True
+    )
+    logger.info("Updated IoT policy '%s' to version %s", policy_name, version['policyVersionId'])
+
+
 def handler(event, context):
     logger.info('Event: %s', event)
     
@@ -26,60 +121,11 @@ def handler(event, context):
         iot = boto3.client('iot')
         
         if request_type in ['Create', 'Update']:
-            # Create IoT policy first
-            try:
-                # Check if policy already exists
-                iot.get_policy(policyName=policy_name)
-                logger.info(f"Policy '{policy_name}' already exists")
-            except iot.exceptions.ResourceNotFoundException:
-                # Create the policy if it doesn't exist
-                # Get the AWS region and account ID from the Lambda context
-                region = context.invoked_function_arn.split(":")[3]
-                account_id = context.invoked_function_arn.split(":")[4]
-                
-                # Get the topic name from environment variable or use a default
-                # In a real implementation, you might want to pass this as a parameter
-                topic = os.environ.get('IOT_TOPIC', 'my/topic/name')
-                
-                policy_document = {
-                    "Version": "2012-10-17",
-                    "Statement": [
-                        {
-                            "Effect": "Allow",
-                            "Action": [
-                                "iot:Connect"
-                            ],
-                            "Resource": [f"arn:aws:iot:{region}:{account_id}:client/{thing_name}"]
-                        },
-                        {
-                            "Effect": "Allow",
-                            "Action": [
-                                "iot:Publish"
-                            ],
-                            "Resource": [f"arn:aws:iot:{region}:{account_id}:topic/{topic}"]
-                        },
-                        {
-                            "Effect": "Allow",
-                            "Action": [
-                                "iot:Subscribe"
-                            ],
-                            "Resource": [f"arn:aws:iot:{region}:{account_id}:topicfilter/{topic}"]
-                        },
-                        {
-                            "Effect": "Allow",
-                            "Action": [
-                                "iot:Receive"
-                            ],
-                            "Resource": [f"arn:aws:iot:{region}:{account_id}:topic/{topic}"]
-                        }
-                    ]
-                }
-                
-                policy_response = iot.create_policy(
-                    policyName=policy_name,
-                    policyDocument=json.dumps(policy_document)
-                )
-                logger.info(f"Created new IoT policy: {policy_name}")
+            # Create the IoT policy, or move it to the current document on redeploys
+            region = context.invoked_function_arn.split(":")[3]
+            account_id = context.invoked_function_arn.split(":")[4]
+            topic = os.environ.get('IOT_TOPIC', 'my/topic/name')
+            ensure_policy(iot, policy_name, policy_document(region, account_id, thing_name, topic))
             
             # Create IoT thing
             try:
@@ -92,54 +138,73 @@ def handler(event, context):
                     thingName=thing_name,
                 )
                 logger.info("Created new IoT thing: %s", thing_response['thingName'])
+
+            # Rollouts target the thing group rather than individual things. Adding a member
+            # again is a no-op, so this also runs on Update to pick up a renamed group
+            thing_group = os.environ.get('THING_GROUP')
+            if thing_group:
+                iot.add_thing_to_thing_group(thingGroupName=thing_group, thingName=thing_name)
+                logger.info("Added thing '%s' to thing group '%s'", thing_name, thing_group)
             
-            # Create certificate
-            cert_response = iot.create_keys_and_certificate(setAsActive=True)
+            if request_type == 'Update':
+                # Keep the device's certificate; a new physical ID would make CloudFormation
+                # delete the old one, and the thing and policy with it
+                response_data = {
+                    'certificateArn': physical_id,
+                    'certificateId': physical_id.split('/')[-1],
+                    'certificateParameter': cert_param_name,
+                    'privateKeyParameter': private_key_param_name,
+                    'publicKeyParameter': public_key_param_name,
+                    'thingName': thing_name
+                }
+            else:
+                # Create certificate
+                cert_response = iot.create_keys_and_certificate(setAsActive=True)
             
-            # Store certificate and keys in SSM Parameter Store
-            ssm.put_parameter(
-                Name=cert_param_name,
-                Value=cert_response['certificatePem'],
-                Type='SecureString',
-                Overwrite=True
-            )
+                # Store certificate and keys in SSM Parameter Store
+                ssm.put_parameter(
+                    Name=cert_param_name,
+                    Value=cert_response['certificatePem'],
+                    Type='SecureString',
+                    Overwrite=True
+                )
             
-            ssm.put_parameter(
-                Name=private_key_param_name,
-                Value=cert_response['keyPair']['PrivateKey'],
-                Type='SecureString',
-                Overwrite=True
-            )
+                ssm.put_parameter(
+                    Name=private_key_param_name,
+                    Value=cert_response['keyPair']['PrivateKey'],
+                    Type='SecureString',
+                    Overwrite=True
+                )
             
-            ssm.put_parameter(
-                Name=public_key_param_name,
-                Value=cert_response['keyPair']['PublicKey'],
-                Type='SecureString',
-                Overwrite=True
-            )
+                ssm.put_parameter(
+                    Name=public_key_param_name,
+                    Value=cert_response['keyPair']['PublicKey'],
+                    Type='SecureString',
+                    Overwrite=True
+                )
             
-            # Attach policy to certificate
-            iot.attach_policy(
-                policyName=policy_name,
-                target=cert_response['certificateArn']
-            )
+                # Attach policy to certificate
+                iot.attach_policy(
+                    policyName=policy_name,
+                    target=cert_response['certificateArn']
+                )
             
-            # Attach thing to certificate
-            iot.attach_thing_principal(
-                thingName=thing_name,
-                principal=cert_response['certificateArn']
-            )
+                # Attach thing to certificate
+                iot.attach_thing_principal(
+                    thingName=thing_name,
+                    principal=cert_response['certificateArn']
+                )
             
-            response_data = {
-                'certificateArn': cert_response['certificateArn'],
-                'certificateId': cert_response['certificateId'],
-                'certificateParameter': cert_param_name,
-                'privateKeyParameter': private_key_param_name,
-                'publicKeyParameter': public_key_param_name,
-                'thingName': thing_name
-            }
+                response_data = {
+                    'certificateArn': cert_response['certificateArn'],
+                    'certificateId': cert_response['certificateId'],
+                    'certificateParameter': cert_param_name,
+                    'privateKeyParameter': private_key_param_name,
+                    'publicKeyParameter': public_key_param_name,
+                    'thingName': thing_name
+                }
             
-            physical_id = cert_response['certificateArn']
+                physical_id = cert_response['certificateArn']
 
             
         elif request_type == 'Delete':
@@ -178,6 +243,7 @@ def handler(event, context):
                             
                             # Delete the policy
                             try:
+                                delete_old_policy_versions(iot, policy['policyName'])
                                 iot.delete_policy(
                                     policyName=policy['policyName']
                                 )
@@ -0,0 +1,48 @@
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency after consecutive failures.
+    After reset_timeout_seconds one trial call is let through: success closes
+    the circuit again, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: float = 30, on_state_change=None) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout_seconds = reset_timeout_seconds
+        self._on_state_change = on_state_change
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.time()
+        if self._on_state_change is not None:
+            self._on_state_change(state)
+
+    def allow_request(self) -> bool:
+        if self._state == OPEN and time.time() - self._opened_at >= self._reset_timeout_seconds:
+            self._transition(HALF_OPEN)
+        return self._state != OPEN
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self._failure_threshold:
+            self._transition(OPEN)
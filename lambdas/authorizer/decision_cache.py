@@ -0,0 +1,73 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class DecisionCache:
+    """
+    Bounded LRU cache for authorization decisions.
+    Entries expire after ttl_seconds or when the token they were issued for expires,
+    whichever comes first.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: int = 300) -> None:
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(token: str, action_id: str) -> str:
+        """
+        Build a cache key without keeping the raw token in memory.
+        :param token: The raw bearer token.
+        :param action_id: The action the decision applies to.
+        :return: A hex digest identifying the (token, action) pair.
+        """
+        return hashlib.sha256(f"{action_id}\n{token}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value, token_exp: float) -> None:
+        """
+        Store a decision.
+        :param key: Key built with make_key.
+        :param value: The decision to cache.
+        :param token_exp: The token's exp claim (epoch seconds); the entry never outlives it.
+        """
+        expires_at = min(time.time() + self._ttl_seconds, token_exp)
+        if expires_at <= time.time() or self._max_entries <= 0:
+            return
+
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxEntries": self._max_entries,
+        }
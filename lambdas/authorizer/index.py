@@ -1,95 +1,336 @@
 import json
-import base64
+import math
 import os
-import boto3
 from urllib.parse import parse_qs
 
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+from lambda_shared.clients import get_client
+from lambda_shared.logger import get_logger, start_request
+from lambda_shared.metrics import emit_metrics
+
+from circuit_breaker import OPEN, CircuitBreaker
+from decision_cache import DecisionCache
+from jwt_verifier import InvalidTokenError, JwtVerifier
+from local_evaluator import LocalPolicyEvaluator
+
 policy_store_id = os.environ['POLICY_STORE_ID']
 namespace = os.environ['NAMESPACE']
 token_type = os.environ['TOKEN_TYPE']
 resource_type = f"{namespace}::Application"
 resource_id = namespace
 action_type = f"{namespace}::Action"
+# Every action in the schema, authorized together on the first request for a token
+action_ids = json.loads(os.environ.get('ACTION_IDS', '[]'))
+# BatchIsAuthorizedWithToken accepts at most 30 requests per call
+batch_size = 30
+# Actions outside the schema that any verified token may call, e.g. looking up the caller's own groups
+authenticated_action_ids = json.loads(os.environ.get('AUTHENTICATED_ACTION_IDS', '[]'))
+
+logger = get_logger(__name__)
+logger.info(
+    "Environment variables loaded: POLICY_STORE_ID=%s, NAMESPACE=%s, TOKEN_TYPE=%s",
+    policy_store_id, namespace, token_type,
+)
+
+# All attempts of one Verified Permissions call share AVP_TIMEOUT_BUDGET_SECONDS
+avp_max_attempts = int(os.environ.get('AVP_MAX_ATTEMPTS', '2'))
+avp_attempt_timeout = float(os.environ.get('AVP_TIMEOUT_BUDGET_SECONDS', '2')) / avp_max_attempts
+verifiedpermissions = get_client(
+    'verifiedpermissions',
+    connect_timeout=avp_attempt_timeout / 2,
+    read_timeout=avp_attempt_timeout / 2,
+    retries={'mode': 'adaptive', 'max_attempts': avp_max_attempts},
+)
+
+# Tokens are verified locally so that invalid tokens never reach Verified Permissions
+user_pool_id = os.environ['USER_POOL_ID']
+jwt_verifier = JwtVerifier(
+    issuer=f"https://cognito-idp.{verifiedpermissions.meta.region_name}.amazonaws.com/{user_pool_id}",
+    client_id=os.environ['CLIENT_ID'],
+    token_use='id' if token_type == 'identityToken' else 'access',
+    jwks_url=os.environ.get('JWKS_URL'),
+)
+
+# Decisions are cached per container, keyed by a hash of the token and the action
+decision_cache = DecisionCache(
+    max_entries=int(os.environ.get('DECISION_CACHE_MAX_ENTRIES', '1024')),
+    ttl_seconds=int(os.environ.get('DECISION_CACHE_TTL_SECONDS', '300')),
+)
+
+# Errors that mean Verified Permissions is throttling or unhealthy, not that the request is invalid
+_TRANSIENT_ERROR_CODES = {'ThrottlingException', 'InternalServerException'}
 
-print(f"Environment variables loaded: POLICY_STORE_ID={policy_store_id}, NAMESPACE={namespace}, TOKEN_TYPE={token_type}")
-print(f"Derived variables: resource_type={resource_type}, resource_id={resource_id}, action_type={action_type}")
 
-verifiedpermissions = boto3.client('verifiedpermissions')
+def _on_breaker_state_change(state):
+    logger.warning("Verified Permissions circuit breaker is now %s", state)
+    emit_metrics({'AvpCircuitOpen': 1 if state == OPEN else 0}, {'Service': 'Authorizer'})
+
+
+avp_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('AVP_BREAKER_FAILURE_THRESHOLD', '5')),
+    reset_timeout_seconds=float(os.environ.get('AVP_BREAKER_RESET_SECONDS', '30')),
+    on_state_change=_on_breaker_state_change,
+)
+
+# Last decision seen per (principal, action), served while Verified Permissions is unavailable
+last_known_good = DecisionCache(
+    max_entries=int(os.environ.get('LAST_KNOWN_GOOD_MAX_ENTRIES', '4096')),
+    ttl_seconds=int(os.environ.get('STALE_DECISION_MAX_AGE_SECONDS', '900')),
+)
+
+# Optional in-process Cedar evaluation against a local copy of the policy store
+local_evaluator = None
+if os.environ.get('LOCAL_EVALUATION', 'false').lower() == 'true':
+    local_evaluator = LocalPolicyEvaluator(
+        verifiedpermissions,
+        policy_store_id,
+        namespace,
+        refresh_seconds=int(os.environ.get('POLICY_REFRESH_SECONDS', '300')),
+    )
+    if not local_evaluator.available:
+        logger.warning("LOCAL_EVALUATION is enabled but cedarpy is not installed, using Verified Permissions")
+        local_evaluator = None
+
+
+def _authorize_all_actions(bearer_token):
+    """
+    Authorize every schema action for a token with BatchIsAuthorizedWithToken.
+    :param bearer_token: The raw token.
+    :return: A mapping of action id to a response shaped like IsAuthorizedWithToken's.
+    """
+    decisions = {}
+    for start in range(0, len(action_ids), batch_size):
+        batch_response = verifiedpermissions.batch_is_authorized_with_token(
+            **{token_type: bearer_token},
+            policyStoreId=policy_store_id,
+            requests=[
+                {
+                    'action': {'actionType': action_type, 'actionId': batch_action_id},
+                    'resource': {'entityType': resource_type, 'entityId': resource_id},
+                }
+                for batch_action_id in action_ids[start:start + batch_size]
+            ],
+        )
+        for result in batch_response['results']:
+            decision = {'decision': result['decision']}
+            if 'principal' in batch_response:
+                decision['principal'] = batch_response['principal']
+            decisions[result['request']['action']['actionId']] = decision
+    return decisions
+
+
+def _evaluate_locally(parsed_token, requested_action_ids):
+    """Evaluate with the local engine, or return None to fall back to Verified Permissions."""
+    try:
+        return {
+            requested_action_id: local_evaluator.is_authorized(
+                user_pool_id, parsed_token, requested_action_id, resource_id
+            )
+            for requested_action_id in requested_action_ids
+        }
+    except Exception as e:
+        logger.warning("Local evaluation unavailable, falling back to Verified Permissions: %s", e)
+        return None
+
+
+def _is_transient(error):
+    if isinstance(error, ClientError):
+        return error.response['Error']['Code'] in _TRANSIENT_ERROR_CODES
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+def _stale_decisions(principal, requested_action_ids, reason):
+    """
+    Get the last known decisions of a principal while Verified Permissions is unavailable.
+    API Gateway caches the resulting policy for the token and reuses it for every endpoint
+    the token calls until the authorizer TTL expires, which outlasts the breaker's open
+    window. Decisions are therefore only served if one was seen within the staleness window
+    for every requested action, so that a short outage never denies the other endpoints.
+    :return: A decision for every requested action, or an empty mapping.
+    """
+    logger.warning("Verified Permissions is unavailable: %s", reason)
+    decisions = {}
+    for requested_action_id in requested_action_ids:
+        decision = last_known_good.get(DecisionCache.make_key(principal, requested_action_id))
+        if decision is None:
+            logger.warning("No last known decision for %s", requested_action_id)
+            return {}
+        decisions[requested_action_id] = decision
+    logger.warning("Serving last known decisions for %d actions", len(decisions))
+    emit_metrics({'StaleDecisionsServed': 1}, {'Service': 'Authorizer'})
+    return decisions
+
+
+def _decide(bearer_token, parsed_token, requested_action_ids):
+    """
+    Get decisions for a set of actions.
+    :return: A mapping of action id to a response shaped like IsAuthorizedWithToken's,
+             and whether the decisions are fresh enough to be cached for the token.
+    """
+    if local_evaluator is not None:
+        local_decisions = _evaluate_locally(parsed_token, requested_action_ids)
+        logger.debug("Local decisions: %s", local_decisions)
+        if local_decisions is not None:
+            return local_decisions, True
+
+    principal = f"{user_pool_id}|{parsed_token['sub']}"
+    if not avp_breaker.allow_request():
+        return _stale_decisions(principal, requested_action_ids, "circuit open"), False
+
+    try:
+        decisions = _decide_remotely(bearer_token, requested_action_ids)
+    except Exception as e:
+        if not _is_transient(e):
+            raise
+        avp_breaker.record_failure()
+        return _stale_decisions(principal, requested_action_ids, str(e)), False
+
+    avp_breaker.record_success()
+    for decided_action_id, decision in decisions.items():
+        last_known_good.put(DecisionCache.make_key(principal, decided_action_id), decision, math.inf)
+    return decisions, True
+
+
+def _decide_remotely(bearer_token, requested_action_ids):
+    """Get decisions from Verified Permissions."""
+    decisions = {}
+    if action_ids:
+        decisions = _authorize_all_actions(bearer_token)
+        logger.debug("AVP decisions: %s", decisions)
+
+    for requested_action_id in sorted(set(requested_action_ids) - decisions.keys()):
+        auth_response = verifiedpermissions.is_authorized_with_token(
+            **{token_type: bearer_token},
+            policyStoreId=policy_store_id,
+            action={'actionType': action_type, 'actionId': requested_action_id},
+            resource={'entityType': resource_type, 'entityId': resource_id},
+        )
+        logger.debug("AVP decision: %s", auth_response)
+        decisions[requested_action_id] = {
+            key: auth_response[key] for key in ('decision', 'principal') if key in auth_response
+        }
+    return decisions
+
+
+def _method_arn(method_arn, policy_action_id):
+    """
+    Build the execute-api ARN of an action on the API and stage of the incoming request.
+    :param method_arn: The methodArn of the incoming request.
+    :param policy_action_id: An action id such as "get /devices".
+    """
+    api_arn, stage = method_arn.split('/')[:2]
+    http_method, resource_path = policy_action_id.split(' ', 1)
+    return f"{api_arn}/{stage}/{http_method.upper()}/{resource_path.lstrip('/')}"
+
+
+def _policy_statements(method_arn, decisions):
+    """
+    Build one Allow and one Deny statement covering every decided action, so that
+    API Gateway can reuse the cached policy for any endpoint the token calls.
+    """
+    resources = {'Allow': [], 'Deny': []}
+    for decided_action_id, decision in sorted(decisions.items()):
+        effect = 'Allow' if decision['decision'].upper() == 'ALLOW' else 'Deny'
+        resources[effect].append(_method_arn(method_arn, decided_action_id))
+    return [
+        {
+            'Action': 'execute-api:Invoke',
+            'Effect': effect,
+            'Resource': effect_resources
+        }
+        for effect, effect_resources in resources.items() if effect_resources
+    ]
+
+
+def _authorizer_context(parsed_token, principal_id, decisions, degraded=False):
+    """
+    Build the context API Gateway passes to integrations under requestContext.authorizer.
+    The context is cached with the policy, so it only holds values that depend on the
+    token, never on the request. API Gateway only accepts string, number and boolean values.
+    :param degraded: Whether the decisions are last known ones served while Verified Permissions is unavailable.
+    """
+    return {
+        'principalId': principal_id,
+        'sub': parsed_token['sub'],
+        'groups': ','.join(parsed_token.get('cognito:groups', [])),
+        'allowedActions': ','.join(sorted(
+            decided_action_id for decided_action_id, decision in decisions.items()
+            if decision['decision'].upper() == 'ALLOW'
+        )),
+        'degraded': degraded,
+    }
+
 
 def lambda_handler(event, context):
-    print(f"Received event: {event}")
+    start_request(logger)
+    logger.debug("Received event: %s", event)
     
     try:
         bearer_token = event.get('headers', {}).get('Authorization') or event.get('headers', {}).get('authorization')
-        print(f"Extracted bearer token (masked): {bearer_token[:10]}...")
-        
         if bearer_token and bearer_token.lower().startswith('bearer '):
             bearer_token = bearer_token.split(' ')[1]
-            print("Bearer prefix removed from token")
+        if not bearer_token:
+            raise InvalidTokenError("Missing bearer token")
             
-        token_payload = bearer_token.split('.')[1]
-        padding = '=' * (-len(token_payload) % 4)
-        parsed_token = json.loads(
-            base64.b64decode(token_payload + padding).decode('utf-8')
-        )
-        print(f"Parsed token payload: {parsed_token}")
+        parsed_token = jwt_verifier.verify(bearer_token)
+        logger.debug("Verified token payload: %s", parsed_token)
         
         action_id = f"{event['requestContext']['httpMethod'].lower()} {event['requestContext']['resourcePath']}"
-        print(f"Constructed action_id: {action_id}")
+        logger.debug("Constructed action_id: %s", action_id)
         
-        input_params = {
-            token_type: bearer_token,
-            'policyStoreId': policy_store_id,
-            'action': {
-                'actionType': action_type,
-                'actionId': action_id
-            },
-            'resource': {
-                'entityType': resource_type,
-                'entityId': resource_id
-            }
+        requested_action_ids = (set(action_ids) | {action_id}) - set(authenticated_action_ids)
+        decisions = {
+            cached_action_id: decision_cache.get(DecisionCache.make_key(bearer_token, cached_action_id))
+            for cached_action_id in requested_action_ids
         }
-            
-        print("Calling verifiedpermissions.is_authorized_with_token...")
-        auth_response = verifiedpermissions.is_authorized_with_token(**input_params)
-        print(f"AVP decision: {auth_response}")
+        hits = sum(1 for decision in decisions.values() if decision)
+        emit_metrics({'DecisionCacheHits': hits, 'DecisionCacheMisses': len(decisions) - hits},
+                     {'Service': 'Authorizer'})
+        degraded = False
+        if all(decisions.values()):
+            logger.debug("Decision cache hit: %s", decisions)
+        else:
+            decisions, fresh = _decide(bearer_token, parsed_token, requested_action_ids)
+            degraded = not fresh
+            if fresh and 'exp' in parsed_token:
+                for decided_action_id, decision in decisions.items():
+                    decision_cache.put(
+                        DecisionCache.make_key(bearer_token, decided_action_id),
+                        decision,
+                        parsed_token['exp'],
+                    )
+        decisions.update({
+            authenticated_action_id: {'decision': 'ALLOW'}
+            for authenticated_action_id in authenticated_action_ids
+        })
+        if action_id not in decisions:
+            raise RuntimeError(f"No decision is available for {action_id}")
+        logger.debug("Decision cache stats", extra={'fields': {'decisionCache': decision_cache.stats()}})
         
-        principal_id = f"{parsed_token['iss'].split('/')[3]}|{parsed_token['sub']}"
-        print(f"Initial principal_id: {principal_id}")
+        principal_id = f"{user_pool_id}|{parsed_token['sub']}"
         
-        if 'principal' in auth_response:
-            principal_eid_obj = auth_response['principal']
+        principal_eid_obj = next(
+            (decision['principal'] for decision in [decisions[action_id], *decisions.values()] if 'principal' in decision),
+            None,
+        )
+        if principal_eid_obj is not None:
             principal_id = f"{principal_eid_obj['entityType']}::\"{principal_eid_obj['entityId']}\""
-            print(f"Updated principal_id: {principal_id}")
-        
-        # Extract s3Path from query string parameters
-        query_params = event.get('queryStringParameters', {}) or {}
-        s3_path = query_params.get('s3Path', '')
-        print(f"S3 Path from query parameters: {s3_path}")
         
         response = {
             'principalId': principal_id,
             'policyDocument': {
                 'Version': '2012-10-17',
-                'Statement': [{
-                    'Action': 'execute-api:Invoke',
-                    'Effect': 'Allow' if auth_response['decision'].upper() == 'ALLOW' else 'Deny',
-                    'Resource': event['methodArn']
-                }]
+                'Statement': _policy_statements(event['methodArn'], decisions)
             },
-            'context': {
-                'actionId': action_id,
-                's3Path': s3_path
-            }
+            'context': _authorizer_context(parsed_token, principal_id, decisions, degraded)
         }
-        print(f"Final response: {response}")
+        logger.debug("Final response: %s", response)
         return response
         
-    except Exception as e:
-        print(f"Error occurred: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except InvalidTokenError as e:
+        # Rejecting the token is a decision, which API Gateway may cache for the token
+        logger.warning("Invalid token, denying request: %s", e)
         
         deny_response = {
             'principalId': '',
@@ -103,5 +344,11 @@ def lambda_handler(event, context):
             },
             'context': {}
         }
-        print(f"Returning deny response: {json.dumps(deny_response, indent=2)}")
+        logger.debug("Returning deny response: %s", deny_response)
         return deny_response
+
+    except Exception as e:
+        # Anything else, e.g. Verified Permissions throttling, is not a decision. Raising makes
+        # API Gateway answer 500 without caching a result for the token.
+        logger.error("Authorization failed: %s", e, exc_info=True)
+        raise
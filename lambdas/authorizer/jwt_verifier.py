@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import urllib.request
+
+from lambda_shared.logger import get_logger
+
+# DER encoding of the SHA-256 AlgorithmIdentifier used by RSASSA-PKCS1-v1_5 (RFC 8017, section 9.2)
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+logger = get_logger(__name__)
+
+
+class InvalidTokenError(ValueError):
+    pass
+
+
+def _b64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def _b64url_to_int(value: str) -> int:
+    return int.from_bytes(_b64url_decode(value), 'big')
+
+
+class JwtVerifier:
+    """
+    Verifies Cognito-issued RS256 tokens locally against the user pool's JWKS.
+    The JWKS is fetched once and only re-fetched when a token references an unknown kid.
+    """
+
+    def __init__(
+        self,
+        issuer: str,
+        client_id: str,
+        token_use: str,
+        jwks_url: str = None,
+        min_refresh_seconds: int = 60,
+        timeout_seconds: float = 2.0,
+    ) -> None:
+        self._issuer = issuer
+        self._client_id = client_id
+        self._token_use = token_use
+        self._jwks_url = jwks_url or f"{issuer}/.well-known/jwks.json"
+        self._min_refresh_seconds = min_refresh_seconds
+        self._timeout_seconds = timeout_seconds
+        self._keys = {}
+        self._fetched_at = None
+
+    def _refresh_keys(self) -> None:
+        """
+        Fetch the JWKS again.
+        :raises: The fetch error if no keys are known yet, so that callers fail instead of
+                 rejecting valid tokens.
+        """
+        # Tokens with made-up kids must not be able to make us hammer the JWKS endpoint
+        if self._fetched_at is not None and time.time() - self._fetched_at < self._min_refresh_seconds:
+            return
+        attempted_at = time.time()
+        try:
+            with urllib.request.urlopen(self._jwks_url, timeout=self._timeout_seconds) as response:
+                jwks = json.loads(response.read())
+            keys = {
+                key['kid']: (_b64url_to_int(key['n']), _b64url_to_int(key['e']))
+                for key in jwks['keys']
+                if key.get('kty') == 'RSA'
+            }
+        except Exception:
+            if not self._keys:
+                raise
+            # The known keys still verify most tokens; back off before fetching again
+            logger.warning("JWKS refresh failed, keeping the known keys", exc_info=True)
+            self._fetched_at = attempted_at
+            return
+        self._keys = keys
+        self._fetched_at = attempted_at
+
+    def _public_key(self, kid: str):
+        if kid not in self._keys:
+            self._refresh_keys()
+        if kid not in self._keys:
+            raise InvalidTokenError(f"Unknown signing key: {kid}")
+        return self._keys[kid]
+
+    def _verify_signature(self, signing_input: bytes, signature: bytes, kid: str) -> None:
+        modulus, exponent = self._public_key(kid)
+        key_length = (modulus.bit_length() + 7) // 8
+        signature_int = int.from_bytes(signature, 'big')
+        if len(signature) != key_length or signature_int >= modulus:
+            raise InvalidTokenError("Invalid token signature")
+
+        encoded = pow(signature_int, exponent, modulus).to_bytes(key_length, 'big')
+        digest_info = _SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+        expected = b'\x00\x01' + b'\xff' * (key_length - len(digest_info) - 3) + b'\x00' + digest_info
+        if not hmac.compare_digest(encoded, expected):
+            raise InvalidTokenError("Invalid token signature")
+
+    def verify(self, token: str) -> dict:
+        """
+        Verify a token's signature and claims.
+        :param token: The raw JWT.
+        :return: The verified claims.
+        :raises: InvalidTokenError if the token is malformed, forged, expired or issued for another client.
+        """
+        try:
+            encoded_header, encoded_payload, encoded_signature = token.split('.')
+            header = json.loads(_b64url_decode(encoded_header))
+            claims = json.loads(_b64url_decode(encoded_payload))
+            signature = _b64url_decode(encoded_signature)
+        except (ValueError, TypeError) as e:
+            raise InvalidTokenError(f"Malformed token: {str(e)}")
+
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise InvalidTokenError("Malformed token: header and payload must be JSON objects")
+        if header.get('alg') != 'RS256':
+            raise InvalidTokenError(f"Unsupported token algorithm: {header.get('alg')}")
+        exp = claims.get('exp')
+        if isinstance(exp, bool) or not isinstance(exp, (int, float)):
+            raise InvalidTokenError("Token has no numeric exp claim")
+        if exp <= time.time():
+            raise InvalidTokenError("Token has expired")
+        if claims.get('iss') != self._issuer:
+            raise InvalidTokenError("Token was issued by another issuer")
+        if claims.get('token_use') != self._token_use:
+            raise InvalidTokenError(f"Expected a token with token_use={self._token_use}")
+        audience = claims.get('aud') if self._token_use == 'id' else claims.get('client_id')
+        if audience != self._client_id:
+            raise InvalidTokenError("Token was issued for another client")
+
+        self._verify_signature(f"{encoded_header}.{encoded_payload}".encode('ascii'), signature, header.get('kid'))
+        return claims
@@ -0,0 +1,113 @@
+import time
+
+from lambda_shared.logger import get_logger
+
+try:
+    import cedarpy
+except ImportError:  # cedarpy is only needed when local evaluation is enabled
+    cedarpy = None
+
+logger = get_logger(__name__)
+
+
+class LocalPolicyEvaluator:
+    """
+    Evaluates authorization requests in-process against a local copy of the
+    policy store's policies and schema. The copy is refreshed from Verified
+    Permissions every refresh_seconds; after a failed refresh, the previous copy
+    is served and the refresh is retried at most every retry_seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        policy_store_id: str,
+        namespace: str,
+        refresh_seconds: int = 300,
+        retry_seconds: int = 30,
+    ) -> None:
+        self._client = client
+        self._policy_store_id = policy_store_id
+        self._namespace = namespace
+        self._refresh_seconds = refresh_seconds
+        self._retry_seconds = retry_seconds
+        self._policy_set = None
+        self._schema = None
+        self._loaded_at = 0.0
+        self._failed_at = 0.0
+
+    @property
+    def available(self) -> bool:
+        return cedarpy is not None
+
+    def refresh(self) -> None:
+        """
+        Download every static policy and the schema from the policy store.
+        :raises: ValueError if the store contains policies that cannot be evaluated locally.
+        """
+        statements = []
+        paginator = self._client.get_paginator('list_policies')
+        for page in paginator.paginate(policyStoreId=self._policy_store_id):
+            for summary in page['policies']:
+                policy = self._client.get_policy(
+                    policyStoreId=self._policy_store_id,
+                    policyId=summary['policyId'],
+                )
+                static = policy['definition'].get('static')
+                if static is None:
+                    raise ValueError(f"Policy {summary['policyId']} is not a static policy")
+                statements.append(static['statement'])
+
+        schema = self._client.get_schema(policyStoreId=self._policy_store_id)['schema']
+
+        self._policy_set = cedarpy.PolicySet.from_str("\n".join(statements))
+        self._schema = cedarpy.Schema.from_json_str(schema)
+        self._loaded_at = time.time()
+
+    def _ensure_fresh(self) -> None:
+        now = time.time()
+        if now - self._loaded_at < self._refresh_seconds:
+            return
+        # Failed refreshes are not retried on every request
+        if self._policy_set is not None and now - self._failed_at < self._retry_seconds:
+            return
+        try:
+            self.refresh()
+        except Exception:
+            # Keep serving from the previous copy when a refresh fails
+            self._failed_at = now
+            if self._policy_set is None:
+                raise
+            logger.warning("Policy refresh failed, keeping the previous local copy", exc_info=True)
+
+    def is_authorized(self, user_pool_id: str, claims: dict, action_id: str, resource_id: str) -> dict:
+        """
+        Evaluate a request for the principal described by Cognito token claims.
+        :param user_pool_id: The Cognito user pool that issued the token.
+        :param claims: The token claims, which must already be verified.
+        :param action_id: The action to evaluate, e.g. "get /devices".
+        :param resource_id: The Application entity id.
+        :return: A response shaped like IsAuthorizedWithToken's (decision and principal).
+        """
+        self._ensure_fresh()
+
+        user = {'type': f"{self._namespace}::User", 'id': f"{user_pool_id}|{claims['sub']}"}
+        groups = [
+            {'type': f"{self._namespace}::UserGroup", 'id': f"{user_pool_id}|{group}"}
+            for group in claims.get('cognito:groups', [])
+        ]
+        entities = [{'uid': user, 'attrs': {}, 'parents': groups}]
+        entities.extend({'uid': group, 'attrs': {}, 'parents': []} for group in groups)
+
+        request = {
+            'principal': user,
+            'action': {'type': f"{self._namespace}::Action", 'id': action_id},
+            'resource': {'type': f"{self._namespace}::Application", 'id': resource_id},
+            'context': {},
+        }
+        result = cedarpy.is_authorized(request, self._policy_set, entities, self._schema)
+
+        return {
+            'decision': 'ALLOW' if result.allowed else 'DENY',
+            'principal': {'entityType': user['type'], 'entityId': user['id']},
+        }
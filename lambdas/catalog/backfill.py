@@ -0,0 +1,33 @@
+import os
+import time
+
+from lambda_shared.clients import get_client
+from lambda_shared.device_catalog import put_thing
+from lambda_shared.logger import get_logger, start_request
+
+logger = get_logger(__name__)
+
+table_name = os.environ['DEVICE_CATALOG_TABLE']
+
+
+def lambda_handler(event, context):
+    """
+    Copy every thing in the registry into the device catalog.
+    Runs once after deployment; things changed by registry events since the
+    listing started are not overwritten.
+    """
+    start_request(logger)
+    iot = get_client('iot')
+    dynamodb = get_client('dynamodb')
+
+    observed_at = int(time.time() * 1000)
+    written = skipped = 0
+    for page in iot.get_paginator('list_things').paginate(PaginationConfig={'PageSize': 250}):
+        for thing in page['things']:
+            if put_thing(dynamodb, table_name, thing, observed_at):
+                written += 1
+            else:
+                skipped += 1
+
+    logger.info("Device catalog backfilled", extra={'fields': {'written': written, 'skipped': skipped}})
+    return {'written': written, 'skipped': skipped}
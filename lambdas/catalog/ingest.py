@@ -0,0 +1,44 @@
+import os
+
+from lambda_shared.clients import get_client
+from lambda_shared.device_catalog import delete_thing, put_thing, thing_arn
+from lambda_shared.logger import get_logger, start_request
+
+logger = get_logger(__name__)
+
+table_name = os.environ['DEVICE_CATALOG_TABLE']
+
+
+def lambda_handler(event, context):
+    """
+    Apply an AWS IoT registry thing event to the device catalog.
+    Events can arrive out of order; older events never overwrite newer ones.
+    """
+    start_request(logger)
+    logger.debug("Received event: %s", event)
+
+    if event.get('eventType') != 'THING_EVENT':
+        logger.warning("Ignoring unsupported event type: %s", event.get('eventType'))
+        return
+
+    dynamodb = get_client('dynamodb')
+    operation = event['operation']
+    if operation == 'DELETED':
+        applied = delete_thing(dynamodb, table_name, event['thingName'], event['timestamp'])
+    elif operation in ('CREATED', 'UPDATED'):
+        thing = {
+            'thingName': event['thingName'],
+            'thingArn': thing_arn(event['accountId'], event['thingName']),
+            'thingTypeName': event.get('thingTypeName'),
+            'attributes': event.get('attributes'),
+            'version': event.get('versionNumber', 0),
+        }
+        applied = put_thing(dynamodb, table_name, thing, event['timestamp'])
+    else:
+        logger.warning("Ignoring unsupported operation: %s", operation)
+        return
+
+    logger.info(
+        "Thing event processed",
+        extra={'fields': {'thingName': event['thingName'], 'operation': operation, 'applied': applied}},
+    )
@@ -1,35 +1,279 @@
+import base64
+import binascii
+import hashlib
 import json
-import boto3
+import os
+import re
+import time
 from botocore.exceptions import ClientError
 
+from lambda_shared.clients import get_client
+from lambda_shared.device_catalog import query_things
+from lambda_shared.logger import get_logger, start_request
+
+logger = get_logger(__name__)
+
+# ListThings returns at most 250 things per page
+MAX_PAGE_SIZE = 250
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+# Lambda proxy responses are limited to 6 MB, keep "all" responses well below it
+MAX_RESPONSE_BYTES = int(os.environ.get('MAX_RESPONSE_BYTES', str(4 * 1024 * 1024)))
+
+# Responses are cached per container; the registry changes rarely, so short staleness is acceptable
+CACHE_TTL_SECONDS = float(os.environ.get('DEVICE_CACHE_TTL_SECONDS', '30'))
+CACHE_MAX_ENTRIES = int(os.environ.get('DEVICE_CACHE_MAX_ENTRIES', '128'))
+_response_cache = {}
+
+# When set, listings are read from the DynamoDB device catalog instead of the IoT registry
+DEVICE_CATALOG_TABLE = os.environ.get('DEVICE_CATALOG_TABLE')
+
+# Fields of a thing that can be requested with fields=, e.g. fields=thingName,attributes
+THING_FIELDS = {
+    'thingName', 'thingId', 'thingArn', 'thingTypeName', 'thingGroupNames',
+    'attributes', 'connectivity', 'shadow', 'version',
+}
+# Filter values are restricted so that they cannot change the meaning of the search query
+_SEARCH_TERM = re.compile(r'^[A-Za-z0-9_.@-]+$')
+
+
+def encode_cursor(next_token):
+    """Wrap an IoT pagination token so that clients treat it as opaque."""
+    return base64.urlsafe_b64encode(json.dumps({'t': next_token}).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Unwrap a cursor returned by encode_cursor.
+    :raises: ValueError if the cursor was not issued by this API.
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['t']
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise ValueError("nextToken is invalid")
+
+
+def _page_size(params):
+    value = params.get('maxResults', DEFAULT_PAGE_SIZE)
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("maxResults must be an integer")
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"maxResults must be between 1 and {MAX_PAGE_SIZE}")
+    return page_size
+
+
+def _search_term(name, value):
+    if not _SEARCH_TERM.match(value):
+        raise ValueError(f"{name} may only contain letters, digits and _.@-")
+    return value
+
+
+def build_search_query(params):
+    """
+    Build a fleet indexing query string from the search query parameters.
+    :param params: Query parameters, e.g. {'namePrefix': 'sensor-', 'attributes': 'floor=2,site=lab'}.
+    :return: The query string, or None when no search parameter is present.
+    :raises: ValueError if a parameter is malformed.
+    """
+    terms = []
+    if params.get('namePrefix'):
+        terms.append(f"thingName:{_search_term('namePrefix', params['namePrefix'])}*")
+    if params.get('thingType'):
+        terms.append(f"thingTypeName:{_search_term('thingType', params['thingType'])}")
+    if params.get('attributes'):
+        for attribute in params['attributes'].split(','):
+            name, separator, value = attribute.partition('=')
+            if not separator:
+                raise ValueError("attributes must be a comma-separated list of name=value pairs")
+            terms.append(f"attributes.{_search_term('attributes', name)}:{_search_term('attributes', value)}")
+    if params.get('connectivity'):
+        connectivity = params['connectivity'].lower()
+        if connectivity not in ('connected', 'disconnected'):
+            raise ValueError("connectivity must be connected or disconnected")
+        terms.append(f"connectivity.connected:{'true' if connectivity == 'connected' else 'false'}")
+    return ' AND '.join(terms) or None
+
+
+def _fields(params):
+    if not params.get('fields'):
+        return None
+    fields = tuple(sorted({field.strip() for field in params['fields'].split(',') if field.strip()}))
+    unknown = set(fields) - THING_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def project(things, fields):
+    """Keep only the requested fields of each thing, or every field when fields is None."""
+    if fields is None:
+        return things
+    return [{field: thing[field] for field in fields if field in thing} for thing in things]
+
+
+def _registry_pages(iot_client, query):
+    """Page through the IoT registry, or through the fleet index when a query is given."""
+    def fetch_page(page_size, next_token):
+        request = {'maxResults': page_size}
+        if next_token:
+            request['nextToken'] = next_token
+        if query:
+            response = iot_client.search_index(indexName='AWS_Things', queryString=query, **request)
+        else:
+            response = iot_client.list_things(**request)
+        return response['things'], response.get('nextToken')
+    return fetch_page
+
+
+def _catalog_pages(dynamodb, params):
+    """Page through the device catalog table."""
+    name_prefix = _search_term('namePrefix', params['namePrefix']) if params.get('namePrefix') else None
+    thing_type = _search_term('thingType', params['thingType']) if params.get('thingType') else None
+
+    def fetch_page(page_size, start_key):
+        if start_key is not None and not isinstance(start_key, dict):
+            raise ValueError("nextToken is invalid")
+        return query_things(dynamodb, DEVICE_CATALOG_TABLE, page_size, start_key, name_prefix, thing_type)
+    return fetch_page
+
+
+def list_devices(fetch_page, page_size, next_token=None, all_pages=False):
+    """
+    List things one page at a time.
+    :param fetch_page: Returns a page of things and the token of the next page, given a page size and a token.
+    :param page_size: Things requested per page.
+    :param next_token: The token to resume from.
+    :param all_pages: Keep fetching pages until the listing is exhausted or the
+                      response would exceed MAX_RESPONSE_BYTES.
+    :return: The things and the token of the next page, or None on the last page.
+    """
+    things = []
+    response_bytes = 0
+    while True:
+        page, next_token = fetch_page(page_size, next_token)
+        things.extend(page)
+
+        response_bytes += len(json.dumps(page))
+        if not all_pages or not next_token:
+            return things, next_token
+        # Stop early and hand back a cursor if another page of average-sized things might not fit
+        average_thing_bytes = response_bytes / len(things) if things else 0
+        if response_bytes + average_thing_bytes * page_size > MAX_RESPONSE_BYTES:
+            logger.info("Response size limit reached after %d things", len(things))
+            return things, next_token
+
+
+def _cached_response(key, load):
+    """
+    Get a serialized response body and its ETag, calling load() at most once per TTL.
+    :param key: Identifies the request, e.g. its paging parameters.
+    :param load: Returns the response body as a dictionary.
+    """
+    now = time.time()
+    cached = _response_cache.get(key)
+    if cached is not None and cached[2] > now:
+        logger.debug("Device cache hit")
+        return cached[0], cached[1]
+
+    # Compact, key-sorted JSON keeps the body small, its ETag stable and repeated keys compressible
+    body = json.dumps(load(), separators=(',', ':'), sort_keys=True)
+    etag = f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()}"'
+    if CACHE_TTL_SECONDS <= 0 or CACHE_MAX_ENTRIES <= 0:
+        return body, etag
+
+    if len(_response_cache) >= CACHE_MAX_ENTRIES:
+        # Drop expired entries first, then the oldest one
+        for expired_key in [k for k, v in _response_cache.items() if v[2] <= now]:
+            del _response_cache[expired_key]
+        if len(_response_cache) >= CACHE_MAX_ENTRIES:
+            del _response_cache[next(iter(_response_cache))]
+    _response_cache[key] = (body, etag, now + CACHE_TTL_SECONDS)
+    return body, etag
+
+
+def _etag_matches(event, etag):
+    """Check the request's If-None-Match header against an ETag."""
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    if_none_match = headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    # Weak comparison, as required for If-None-Match
+    return '*' in candidates or etag in [candidate.removeprefix('W/') for candidate in candidates]
+
+
 def lambda_handler(event, context):
-    iot_client = boto3.client('iot')
-    
+    start_request(logger)
+    iot_client = get_client('iot')
+
     try:
-        response = iot_client.list_things()
-        things = response['things']
-        
+        params = event.get('queryStringParameters') or {}
+        page_size = _page_size(params)
+        next_token = decode_cursor(params['nextToken']) if params.get('nextToken') else None
+        all_pages = params.get('all', 'false').lower() == 'true'
+        query = build_search_query(params)
+        fields = _fields(params)
+
+        # The catalog indexes thing names and types; other filters need the fleet index
+        if DEVICE_CATALOG_TABLE and not (params.get('attributes') or params.get('connectivity')):
+            source = 'catalog'
+            fetch_page = _catalog_pages(get_client('dynamodb'), params)
+        else:
+            source = 'registry'
+            fetch_page = _registry_pages(iot_client, query)
+
+        def load():
+            things, page_token = list_devices(fetch_page, page_size, next_token, all_pages)
+            body = {
+                'message': 'Successfully retrieved IoT things',
+                'things': project(things, fields)
+            }
+            if page_token:
+                body['nextToken'] = encode_cursor(page_token)
+            return body
+
+        cache_key = (source, query, fields, page_size, json.dumps(next_token, sort_keys=True), all_pages)
+        body, etag = _cached_response(cache_key, load)
+        # Clients may reuse their copy, but must revalidate it with If-None-Match first
+        headers = {'Content-Type': 'application/json', 'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if _etag_matches(event, etag):
+            return {
+                'statusCode': 304,
+                'headers': headers,
+                'body': ''
+            }
         return {
             'statusCode': 200,
+            'headers': headers,
+            'body': body
+        }
+
+    except ValueError as e:
+        logger.warning("Invalid request: %s", e)
+        return {
+            'statusCode': 400,
             'body': json.dumps({
-                'message': 'Successfully retrieved IoT things',
-                'things': things
+                'error': str(e),
+                'type': 'ValidationError'
             })
         }
-        
+
     except ClientError as e:
         error_code = e.response['Error']['Code']
         error_message = e.response['Error']['Message']
-        
+        logger.warning("Listing IoT things failed: %s", error_code)
+
         return {
-            'statusCode': error_code,
+            'statusCode': e.response['ResponseMetadata'].get('HTTPStatusCode', 500),
             'body': json.dumps({
                 'error': error_message,
                 'type': 'ClientError'
             })
         }
-        
+
     except Exception as e:
+        logger.exception("Listing IoT things failed: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({
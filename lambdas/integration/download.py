@@ -1,39 +1,357 @@
 import json
-import boto3
 import os
-from datetime import datetime, timezone
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from lambda_shared.clients import get_client, get_iot_data_client
+from lambda_shared.idempotency import COMPLETED, DynamoDbIdempotencyStore, LocalIdempotencyStore, make_key
+from lambda_shared.logger import get_logger, start_request
+
+logger = get_logger(__name__)
+
+# Batch requests publish one message per (thing, s3Path) pair
+MAX_BATCH_TARGETS = int(os.environ.get('MAX_BATCH_TARGETS', '1000'))
+# Keep at or below AWS_CLIENT_MAX_POOL_CONNECTIONS so that publishes never wait for a connection
+PUBLISH_CONCURRENCY = int(os.environ.get('PUBLISH_CONCURRENCY', '16'))
+
+# When set, messages are queued for the publisher function instead of being published inline
+PUBLISH_QUEUE_URL = os.environ.get('PUBLISH_QUEUE_URL')
+# SendMessageBatch accepts at most 10 messages
+SQS_BATCH_SIZE = 10
+
+# Repeated requests within the window replay the first response instead of publishing again
+IDEMPOTENCY_TABLE = os.environ.get('IDEMPOTENCY_TABLE')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '300'))
+# Outlives the function timeout, so that a request still running is never handled twice
+IDEMPOTENCY_LEASE_SECONDS = 60
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+_local_idempotency_store = LocalIdempotencyStore()
+
+# Messages for objects in this bucket carry a manifest and a presigned URL, so that devices
+# can skip objects they already hold and need no S3 credentials for the rest
+PRESIGN_BUCKET = os.environ.get('PRESIGN_BUCKET')
+PRESIGN_EXPIRES_SECONDS = int(os.environ.get('PRESIGN_EXPIRES_SECONDS', '900'))
+# Checksums S3 may hold for an object, in order of preference. Messages carry them as S3
+# reports them; the algorithms are part of the DownloadMessage contract in openapi-spec.yaml
+CHECKSUM_ALGORITHMS = ('SHA256', 'CRC64NVME', 'CRC32C', 'CRC32', 'SHA1')
+
+_THING_NAME = re.compile(r'^[a-zA-Z0-9:_-]{1,128}$')
+
+
+class ObjectNotFoundError(LookupError):
+    """Raised when a download names objects that do not exist."""
+
+
+def _message(thing_name, s3_path, objects=None):
+    return {
+        "timestamp": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%SZ'),
+        "device": thing_name,
+        "s3Path": s3_path,
+        **((objects or {}).get(s3_path) or {})
+    }
+
+
+def _checksum(head):
+    """Get the full-object checksum S3 holds for an object, if any."""
+    # Checksums of multipart uploads cover the parts, and cannot be recomputed from the file alone
+    if head.get('ChecksumType') == 'COMPOSITE':
+        return None
+    for algorithm in CHECKSUM_ALGORITHMS:
+        value = head.get(f'Checksum{algorithm}')
+        if value and '-' not in value:
+            return {"algorithm": algorithm, "value": value}
+    return None
+
+
+def describe_object(s3_client, s3_path):
+    """
+    Describe an object in PRESIGN_BUCKET and presign a download of it.
+    :return: The manifest (size, etag, versionId, checksum) and url fields of a download
+             message, or None when the object is not in PRESIGN_BUCKET.
+    :raises: ObjectNotFoundError if the object does not exist.
+    """
+    bucket, _, key = s3_path[len('s3://'):].partition('/')
+    if not PRESIGN_BUCKET or bucket != PRESIGN_BUCKET or not key:
+        return None
+
+    try:
+        head = s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            raise ObjectNotFoundError(s3_path)
+        raise
+
+    # Pin the URL to the version described, so that the manifest always matches the download
+    params = {'Bucket': bucket, 'Key': key}
+    if head.get('VersionId'):
+        params['VersionId'] = head['VersionId']
+    url = s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=PRESIGN_EXPIRES_SECONDS)
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=PRESIGN_EXPIRES_SECONDS)
+    fields = {
+        "url": url,
+        "expiresAt": expires_at.strftime('%Y-%m-%d %H:%M:%SZ'),
+        "size": head['ContentLength'],
+        # Devices send it as If-Match, so that a download never mixes two versions of the object
+        "etag": head['ETag'],
+    }
+    if head.get('VersionId'):
+        fields["versionId"] = head['VersionId']
+    checksum = _checksum(head)
+    if checksum:
+        fields["checksum"] = checksum
+    return fields
+
+
+def describe_objects(s3_paths):
+    """
+    Describe every distinct S3 path once, however many devices it is sent to.
+    Paths that cannot be described are left out; devices then download them with their own credentials.
+    :raises: ObjectNotFoundError naming the objects that do not exist.
+    """
+    if not PRESIGN_BUCKET:
+        return {}
+    # Presigned URLs must use SigV4 to be accepted in every region
+    s3_client = get_client('s3', signature_version='s3v4')
+
+    def describe(s3_path):
+        try:
+            return s3_path, describe_object(s3_client, s3_path), False
+        except ObjectNotFoundError:
+            return s3_path, None, True
+        except ClientError as e:
+            logger.warning("Describing %s failed: %s", s3_path, e.response['Error']['Code'])
+            return s3_path, None, False
+
+    distinct_paths = list(dict.fromkeys(s3_paths))
+    with ThreadPoolExecutor(max_workers=min(PUBLISH_CONCURRENCY, len(distinct_paths))) as executor:
+        described = list(executor.map(describe, distinct_paths))
+
+    missing = [s3_path for s3_path, _, not_found in described if not_found]
+    if missing:
+        raise ObjectNotFoundError(f"Objects not found: {', '.join(missing[:5])}")
+    return {s3_path: fields for s3_path, fields, _ in described if fields}
+
+
+def topic_for(thing_name):
+    """Get the topic a thing receives its download messages on; no other thing subscribes to it."""
+    return f"{os.environ['IOT_TOPIC']}/{thing_name}"
+
+
+def _publish(iot_client, message):
+    iot_client.publish(
+        topic=topic_for(message['device']),
+        qos=1,
+        payload=json.dumps(message)
+    )
+
+
+def _string_list(body, name, valid=None):
+    values = body.get(name)
+    if not isinstance(values, list) or not values or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"{name} must be a non-empty list of strings")
+    invalid = [value for value in values if valid is not None and not valid(value)]
+    if invalid:
+        raise ValueError(f"{name} contains invalid values: {', '.join(invalid[:5])}")
+    # Drop duplicates, keeping the caller's order
+    return list(dict.fromkeys(values))
+
+
+def parse_batch_request(event):
+    """
+    Read the targets of a batch download request.
+    :param event: An API Gateway proxy event whose body is {"s3Paths": [...], "things": [...]}.
+    :return: Every (thing name, s3Path) pair to publish.
+    :raises: ValueError if the body is malformed or has too many targets.
+    """
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except json.JSONDecodeError:
+        raise ValueError("Body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+
+    s3_paths = _string_list(body, 's3Paths', lambda value: value.startswith('s3://'))
+    things = _string_list(body, 'things', _THING_NAME.match)
+    if len(s3_paths) * len(things) > MAX_BATCH_TARGETS:
+        raise ValueError(f"A batch may publish at most {MAX_BATCH_TARGETS} messages")
+    return [(thing, s3_path) for thing in things for s3_path in s3_paths]
+
+
+def publish_batch(iot_client, targets, objects=None):
+    """
+    Publish one message per target concurrently.
+    :param targets: (thing name, s3Path) pairs.
+    :param objects: Presigned download fields by s3Path, see describe_objects.
+    :return: One result per target, in the order of targets.
+    """
+    def publish(target):
+        thing_name, s3_path = target
+        result = {'thing': thing_name, 's3Path': s3_path}
+        try:
+            _publish(iot_client, _message(thing_name, s3_path, objects))
+            result['status'] = 'published'
+        except Exception as e:
+            logger.warning("Publishing to %s failed: %s", thing_name, e)
+            result.update(status='failed', error=str(e))
+        return result
+
+    with ThreadPoolExecutor(max_workers=min(PUBLISH_CONCURRENCY, len(targets))) as executor:
+        return list(executor.map(publish, targets))
+
+
+def queue_batch(sqs_client, targets, objects=None):
+    """
+    Queue one message per target for the publisher function, ten messages per request.
+    :param targets: (thing name, s3Path) pairs.
+    :param objects: Presigned download fields by s3Path, see describe_objects.
+    :return: One result per target, in the order of targets.
+    """
+    results = [{'thing': thing_name, 's3Path': s3_path, 'status': 'queued'} for thing_name, s3_path in targets]
+
+    def send(start):
+        entries = [
+            {'Id': str(index), 'MessageBody': json.dumps(_message(*targets[index], objects))}
+            for index in range(start, min(start + SQS_BATCH_SIZE, len(targets)))
+        ]
+        try:
+            response = sqs_client.send_message_batch(QueueUrl=PUBLISH_QUEUE_URL, Entries=entries)
+            failed = [(int(failure['Id']), failure.get('Message', failure['Code'])) for failure in response.get('Failed', [])]
+        except Exception as e:
+            logger.warning("Queueing messages failed: %s", e)
+            failed = [(int(entry['Id']), str(e)) for entry in entries]
+        for index, error in failed:
+            results[index].update(status='failed', error=error)
+
+    with ThreadPoolExecutor(max_workers=min(PUBLISH_CONCURRENCY, len(targets))) as executor:
+        list(executor.map(send, range(0, len(targets), SQS_BATCH_SIZE)))
+    return results
+
+
+def idempotency_key(event, targets, objects=None):
+    """
+    Identify a download request for duplicate suppression.
+    The Idempotency-Key header is used when present; otherwise the key is derived
+    from the targets and the versions of the objects they download, so that a request
+    made after an object is overwritten publishes the new version. Either way the key
+    is scoped to the caller and the resource.
+    :param targets: The (thing name, s3Path) pairs the request publishes to.
+    :param objects: Presigned download fields by s3Path, see describe_objects.
+    :raises: ValueError if the Idempotency-Key header is malformed.
+    """
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    principal = ((event.get('requestContext') or {}).get('authorizer') or {}).get('principalId')
+    header_key = headers.get('idempotency-key')
+    if header_key is not None:
+        if not 1 <= len(header_key) <= MAX_IDEMPOTENCY_KEY_LENGTH or not header_key.isprintable():
+            raise ValueError(f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} printable characters")
+        return make_key(principal, event.get('resource'), 'header', header_key)
+    versions = sorted(
+        (s3_path, fields.get('versionId'), fields['etag']) for s3_path, fields in (objects or {}).items()
+    )
+    return make_key(principal, event.get('resource'), sorted(targets), versions)
+
+
+def _idempotency_store():
+    if IDEMPOTENCY_TABLE:
+        return DynamoDbIdempotencyStore(get_client('dynamodb'), IDEMPOTENCY_TABLE)
+    return _local_idempotency_store
 
-def lambda_handler(event, context):
 
+def run_once(key, handle):
+    """
+    Handle a request unless a request with the same key was handled within the window.
+    :param handle: Handles the request and returns the proxy response.
+    :return: The response of handle(), the replayed response of the first request,
+             or 409 while the first request is still running.
+    """
+    store = _idempotency_store()
     try:
-        authorizer_context = event['requestContext']['authorizer']
-        s3Path = authorizer_context.get('s3Path', '')
-        print(f"S3 path: {s3Path}")
+        existing = store.claim(key, IDEMPOTENCY_LEASE_SECONDS)
     except Exception as e:
-        print(f"Error extracting s3Path from authorizer context: {str(e)}")
-    
-    print(f"Extracted s3Path: {s3Path}")
-    
-    iotDevice = os.environ['IOT_THING_NAME']
-    topic_name = os.environ['IOT_TOPIC']
-    
-    timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%SZ')
-    
-    message = {
-        "timestamp": timestamp,
-        "device": iotDevice,
-        "s3Path": s3Path
+        # A duplicate download is cheaper than refusing the request
+        logger.warning("Idempotency store unavailable: %s", e)
+        return handle()
+
+    if existing is not None:
+        if existing['status'] == COMPLETED:
+            logger.info("Replaying the response of a duplicate request")
+            response = existing['response']
+            return {**response, 'headers': {**response.get('headers', {}), 'Idempotent-Replayed': 'true'}}
+        logger.info("Rejecting a duplicate of a request in progress")
+        return {
+            'statusCode': 409,
+            'body': json.dumps({
+                'error': 'A request with the same idempotency key is in progress'
+            })
+        }
+
+    response = handle()
+    try:
+        if response['statusCode'] in (200, 202):
+            store.complete(key, response, IDEMPOTENCY_TTL_SECONDS)
+        else:
+            # Failed and partially failed requests may be retried
+            store.release(key)
+    except Exception as e:
+        logger.warning("Recording the idempotent response failed: %s", e)
+    return response
+
+
+def batch_handler(targets, objects):
+    try:
+        if PUBLISH_QUEUE_URL:
+            results = queue_batch(get_client('sqs'), targets, objects)
+        else:
+            results = publish_batch(get_iot_data_client(), targets, objects)
+    except Exception as e:
+        logger.exception("Publishing to IoT Core failed: %s", e)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
+
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    logger.info("Batch %s", 'queued' if PUBLISH_QUEUE_URL else 'published',
+                extra={'fields': {'targets': len(results), 'failed': failed}})
+    if PUBLISH_QUEUE_URL:
+        status_code, message = 202, f"Queued {len(results) - failed} of {len(results)} messages for IoT Core"
+    else:
+        status_code, message = 200, f"Published {len(results) - failed} of {len(results)} messages to IoT Core"
+    return {
+        # 207 tells the caller to inspect the per-target results
+        'statusCode': 207 if failed else status_code,
+        'body': json.dumps({
+            'message': message,
+            'results': results
+        })
     }
-    
-    iot_client = boto3.client('iot-data')
-    
+
+
+def download_handler(targets, objects):
+    ((thing_name, s3Path),) = targets
+    logger.debug("Extracted s3Path: %s", s3Path)
+
     try:
-        response = iot_client.publish(
-            topic=topic_name,  # Adjust for IoT topic
-            qos=1,
-            payload=json.dumps(message)
-        )
-        
+        message = _message(thing_name, s3Path, objects)
+        if PUBLISH_QUEUE_URL:
+            # The publisher function drains the queue at a rate IoT Core accepts
+            get_client('sqs').send_message(QueueUrl=PUBLISH_QUEUE_URL, MessageBody=json.dumps(message))
+            return {
+                'statusCode': 202,
+                'body': json.dumps({
+                    'message': 'Queued for publishing to IoT Core',
+                    'data': message
+                })
+            }
+
+        iot_client = get_iot_data_client()
+        _publish(iot_client, message)
+
         return {
             'statusCode': 200,
             'body': json.dumps({
@@ -41,11 +359,55 @@ def lambda_handler(event, context):
                 'data': message
             })
         }
-        
+
+    except Exception as e:
+        logger.exception("Publishing to IoT Core failed: %s", e)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
+
+
+def lambda_handler(event, context):
+    start_request(logger)
+
+    batch = event.get('resource') == '/download/batch'
+    try:
+        if batch:
+            targets = parse_batch_request(event)
+        else:
+            # The authorizer result is cached across requests, so read request data from the request itself
+            query_params = event.get('queryStringParameters') or {}
+            targets = [(os.environ['IOT_THING_NAME'], query_params.get('s3Path', ''))]
+        # The key covers the object versions, so the objects are described before duplicates are looked up
+        objects = describe_objects([s3_path for _, s3_path in targets])
+        key = idempotency_key(event, targets, objects)
+    except ValueError as e:
+        logger.warning("Invalid download request: %s", e)
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
+    except ObjectNotFoundError as e:
+        logger.warning("Rejected download: %s", e)
+        return {
+            'statusCode': 404,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
     except Exception as e:
+        logger.exception("Describing objects failed: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'error': str(e)
             })
         }
+
+    handler = batch_handler if batch else download_handler
+    return run_once(key, lambda: handler(targets, objects))
@@ -1,27 +1,19 @@
 import json
-import base64
-import os
+
+from lambda_shared.logger import get_logger, start_request
+
+logger = get_logger(__name__)
 
 def lambda_handler(event, context):
+    start_request(logger)
     try:
-        bearer_token = event.get('headers', {}).get('Authorization') or event.get('headers', {}).get('authorization')
-        if not bearer_token:
-            raise ValueError("Authorization header is missing")
-        
-        print(f"Extracted bearer token (masked): {bearer_token[:10]}...")
-        
-        if bearer_token.lower().startswith('bearer '):
-            bearer_token = bearer_token.split(' ')[1]
-            print("Bearer prefix removed from token")
+        # The authorizer has already verified the token and resolved the caller's groups
+        authorizer_context = event.get('requestContext', {}).get('authorizer') or {}
+        if 'groups' not in authorizer_context:
+            raise ValueError("Authorizer context is missing")
+        logger.debug("Authorizer context: %s", authorizer_context)
         
-        token_payload = bearer_token.split('.')[1]
-        padding = '=' * (-len(token_payload) % 4)
-        parsed_token = json.loads(
-            base64.b64decode(token_payload + padding).decode('utf-8')
-        )
-        print(f"Parsed token payload: {parsed_token}")
-        
-        groups = parsed_token.get('cognito:groups', [])
+        groups = [group for group in authorizer_context['groups'].split(',') if group]
         
         if not groups:
             return {
@@ -38,19 +30,13 @@ def lambda_handler(event, context):
         }
     
     except ValueError as ve:
-        print(f"ValueError: {str(ve)}")
+        logger.warning("ValueError: %s", ve)
         return {
             'statusCode': 400,
             'body': json.dumps({'error': str(ve)})
         }
-    except json.JSONDecodeError as je:
-        print(f"JSONDecodeError: {str(je)}")
-        return {
-            'statusCode': 400,
-            'body': json.dumps({'error': 'Invalid token format'})
-        }
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logger.exception("Unexpected error: %s", e)
         return {
             'statusCode': 500,
             'body': json.dumps({'error': 'Internal server error'})
@@ -0,0 +1,136 @@
+import json
+import os
+import uuid
+
+from botocore.exceptions import ClientError
+
+from lambda_shared.clients import get_client
+from lambda_shared.logger import get_logger, start_request
+
+logger = get_logger(__name__)
+
+# Defaults applied when the request leaves a setting out
+DEFAULT_MAXIMUM_PER_MINUTE = int(os.environ.get('ROLLOUT_MAXIMUM_PER_MINUTE', '100'))
+DEFAULT_ABORT_FAILURE_PERCENT = float(os.environ.get('ROLLOUT_ABORT_FAILURE_PERCENT', '10'))
+DEFAULT_ABORT_MIN_EXECUTED_THINGS = int(os.environ.get('ROLLOUT_ABORT_MIN_EXECUTED_THINGS', '10'))
+DEFAULT_TIMEOUT_MINUTES = int(os.environ.get('ROLLOUT_TIMEOUT_MINUTES', '30'))
+
+
+def _number(settings, name, default, minimum, maximum, kind=int):
+    value = settings.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not minimum <= value <= maximum:
+        raise ValueError(f"{name} must be a number between {minimum} and {maximum}")
+    return kind(value)
+
+
+def build_job_request(body, thing_group_arn):
+    """
+    Translate a rollout request into CreateJob parameters.
+    :param body: The request body, e.g.
+                 {"s3Path": "s3://bucket/key", "thingGroup": "fleet", "maximumPerMinute": 50,
+                  "exponentialRate": {"baseRatePerMinute": 5, "incrementFactor": 2, "numberOfSucceededThings": 10},
+                  "abort": {"failurePercent": 5, "minExecutedThings": 20}, "timeoutMinutes": 15,
+                  "continuous": false}
+    :param thing_group_arn: The ARN of the targeted thing group.
+    :raises: ValueError if a setting is out of range.
+    """
+    rollout_config = {
+        'maximumPerMinute': _number(body, 'maximumPerMinute', DEFAULT_MAXIMUM_PER_MINUTE, 1, 1000),
+    }
+    # Start slowly and speed up as devices succeed
+    if body.get('exponentialRate') is not None:
+        rate = body['exponentialRate']
+        if not isinstance(rate, dict):
+            raise ValueError("exponentialRate must be an object")
+        rollout_config['exponentialRate'] = {
+            'baseRatePerMinute': _number(rate, 'baseRatePerMinute', None, 1, 1000),
+            'incrementFactor': _number(rate, 'incrementFactor', None, 1.1, 5, float),
+            'rateIncreaseCriteria': {
+                'numberOfSucceededThings': _number(rate, 'numberOfSucceededThings', None, 1, 1000000),
+            },
+        }
+
+    abort = body.get('abort') or {}
+    if not isinstance(abort, dict):
+        raise ValueError("abort must be an object")
+    continuous = body.get('continuous', False)
+    if not isinstance(continuous, bool):
+        raise ValueError("continuous must be a boolean")
+
+    return {
+        'jobId': f"download-{uuid.uuid4().hex}",
+        'targets': [thing_group_arn],
+        'document': json.dumps({'operation': 'download', 's3Path': body['s3Path']}),
+        'description': f"Download {body['s3Path']}",
+        # A snapshot job completes once the things in the group have run it; a continuous one
+        # also runs on things added to the group later, and never completes
+        'targetSelection': 'CONTINUOUS' if continuous else 'SNAPSHOT',
+        'jobExecutionsRolloutConfig': rollout_config,
+        'abortConfig': {
+            'criteriaList': [{
+                'failureType': 'ALL',
+                'action': 'CANCEL',
+                'thresholdPercentage': _number(abort, 'failurePercent', DEFAULT_ABORT_FAILURE_PERCENT, 0, 100, float),
+                'minNumberOfExecutedThings': _number(
+                    abort, 'minExecutedThings', DEFAULT_ABORT_MIN_EXECUTED_THINGS, 1, 1000000
+                ),
+            }],
+        },
+        'timeoutConfig': {
+            'inProgressTimeoutInMinutes': _number(body, 'timeoutMinutes', DEFAULT_TIMEOUT_MINUTES, 1, 10080),
+        },
+    }
+
+
+def lambda_handler(event, context):
+    start_request(logger)
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+        if not isinstance(body, dict):
+            raise ValueError("Body must be a JSON object")
+        if not isinstance(body.get('s3Path'), str) or not body['s3Path'].startswith('s3://'):
+            raise ValueError("s3Path must be an s3:// URI")
+        thing_group = body.get('thingGroup') or os.environ['IOT_THING_GROUP']
+
+        iot_client = get_client('iot')
+        thing_group_arn = iot_client.describe_thing_group(thingGroupName=thing_group)['thingGroupArn']
+        job_request = build_job_request(body, thing_group_arn)
+        response = iot_client.create_job(**job_request)
+        logger.info("Rollout created", extra={'fields': {'jobId': response['jobId'], 'thingGroup': thing_group}})
+
+        return {
+            'statusCode': 201,
+            'body': json.dumps({
+                'message': 'Rollout created',
+                'jobId': response['jobId'],
+                'jobArn': response['jobArn']
+            })
+        }
+
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning("Invalid rollout request: %s", e)
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
+
+    except ClientError as e:
+        logger.warning("Creating rollout failed: %s", e.response['Error']['Code'])
+        return {
+            'statusCode': e.response['ResponseMetadata'].get('HTTPStatusCode', 500),
+            'body': json.dumps({
+                'error': e.response['Error']['Message']
+            })
+        }
+
+    except Exception as e:
+        logger.exception("Creating rollout failed: %s", e)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
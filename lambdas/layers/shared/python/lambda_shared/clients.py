@@ -0,0 +1,56 @@
+import os
+
+import boto3
+from botocore.config import Config
+
+# Clients live for the lifetime of the container so warm invocations reuse their connection pools
+_clients = {}
+_iot_data_endpoint = None
+
+
+def client_config(**overrides) -> Config:
+    """
+    Build the botocore configuration shared by every client.
+    Defaults can be tuned per function through AWS_CLIENT_* environment variables.
+    :param overrides: Config options that replace the defaults, e.g. read_timeout.
+    :return: The merged configuration.
+    """
+    config = Config(
+        max_pool_connections=int(os.environ.get("AWS_CLIENT_MAX_POOL_CONNECTIONS", "10")),
+        tcp_keepalive=True,
+        connect_timeout=float(os.environ.get("AWS_CLIENT_CONNECT_TIMEOUT", "2")),
+        read_timeout=float(os.environ.get("AWS_CLIENT_READ_TIMEOUT", "5")),
+        retries={
+            "mode": "adaptive",
+            "max_attempts": int(os.environ.get("AWS_CLIENT_MAX_ATTEMPTS", "3")),
+        },
+    )
+    return config.merge(Config(**overrides)) if overrides else config
+
+
+def get_client(service_name: str, **config_overrides):
+    """
+    Get a boto3 client, creating it on first use in this container.
+    :param service_name: The service, e.g. "iot".
+    :param config_overrides: Config options that replace the shared defaults.
+    """
+    key = (service_name, repr(sorted(config_overrides.items())))
+    if key not in _clients:
+        _clients[key] = boto3.client(service_name, config=client_config(**config_overrides))
+    return _clients[key]
+
+
+def get_iot_data_client():
+    """
+    Get an iot-data client bound to the account's ATS data endpoint.
+    The endpoint is resolved once per container.
+    """
+    global _iot_data_endpoint
+    if _iot_data_endpoint is None:
+        response = get_client("iot").describe_endpoint(endpointType="iot:Data-ATS")
+        _iot_data_endpoint = f"https://{response['endpointAddress']}"
+
+    key = ("iot-data", _iot_data_endpoint)
+    if key not in _clients:
+        _clients[key] = boto3.client("iot-data", endpoint_url=_iot_data_endpoint, config=client_config())
+    return _clients[key]
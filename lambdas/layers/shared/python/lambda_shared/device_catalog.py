@@ -0,0 +1,128 @@
+import os
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+# Every thing shares one partition so that the catalog can be read in thingName order
+CATALOG_PARTITION = 'things'
+THING_TYPE_INDEX = 'byThingType'
+# Deleted things are kept as tombstones for a while so that older writes cannot resurrect them
+TOMBSTONE_TTL_SECONDS = 24 * 60 * 60
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def thing_arn(account_id, thing_name):
+    return f"arn:aws:iot:{os.environ['AWS_REGION']}:{account_id}:thing/{thing_name}"
+
+
+def to_item(thing, event_timestamp):
+    """
+    Build a catalog item from a thing shaped like a ListThings entry.
+    :param event_timestamp: Milliseconds since the epoch at which the thing was observed.
+    """
+    item = {
+        'catalog': CATALOG_PARTITION,
+        'thingName': thing['thingName'],
+        'thingArn': thing['thingArn'],
+        'attributes': thing.get('attributes') or {},
+        'version': thing.get('version', 0),
+        'eventTimestamp': event_timestamp,
+    }
+    # Things without a type are left out of the thing type index
+    if thing.get('thingTypeName'):
+        item['thingTypeName'] = thing['thingTypeName']
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+
+def from_item(item):
+    """Turn a catalog item back into a thing shaped like a ListThings entry."""
+    values = {key: _deserializer.deserialize(value) for key, value in item.items()}
+    thing = {
+        'thingName': values['thingName'],
+        'thingArn': values['thingArn'],
+        'attributes': values['attributes'],
+        'version': int(values['version']),
+    }
+    if 'thingTypeName' in values:
+        thing['thingTypeName'] = values['thingTypeName']
+    return thing
+
+
+def key(thing_name):
+    return {'catalog': {'S': CATALOG_PARTITION}, 'thingName': {'S': thing_name}}
+
+
+def put_thing(dynamodb, table_name, thing, event_timestamp):
+    """
+    Write a thing unless the catalog already holds a newer observation of it.
+    :return: Whether the item was written.
+    """
+    try:
+        dynamodb.put_item(
+            TableName=table_name,
+            Item=to_item(thing, event_timestamp),
+            ConditionExpression='attribute_not_exists(thingName) OR eventTimestamp < :timestamp',
+            ExpressionAttributeValues={':timestamp': {'N': str(event_timestamp)}},
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def delete_thing(dynamodb, table_name, thing_name, event_timestamp):
+    """
+    Replace a thing with a tombstone unless the catalog already holds a newer observation of it.
+    DynamoDB removes the tombstone once its TTL has passed.
+    :return: Whether the thing was removed.
+    """
+    try:
+        dynamodb.put_item(
+            TableName=table_name,
+            Item={
+                **key(thing_name),
+                'deleted': {'BOOL': True},
+                'eventTimestamp': {'N': str(event_timestamp)},
+                'expiresAt': {'N': str(event_timestamp // 1000 + TOMBSTONE_TTL_SECONDS)},
+            },
+            ConditionExpression='attribute_not_exists(thingName) OR eventTimestamp <= :timestamp',
+            ExpressionAttributeValues={':timestamp': {'N': str(event_timestamp)}},
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def query_things(dynamodb, table_name, page_size, start_key=None, name_prefix=None, thing_type=None):
+    """
+    Read one page of the catalog in thingName order.
+    :param start_key: The LastEvaluatedKey of the previous page.
+    :param name_prefix: Only return things whose name starts with this prefix.
+    :param thing_type: Only return things of this type, using the thing type index.
+    :return: The things and the key to resume from, or None on the last page.
+    """
+    if thing_type:
+        request = {
+            'IndexName': THING_TYPE_INDEX,
+            'KeyConditionExpression': 'thingTypeName = :partition',
+            'ExpressionAttributeValues': {':partition': {'S': thing_type}},
+        }
+    else:
+        request = {
+            'KeyConditionExpression': 'catalog = :partition',
+            'ExpressionAttributeValues': {':partition': {'S': CATALOG_PARTITION}},
+            'FilterExpression': 'attribute_not_exists(deleted)',
+        }
+    if name_prefix:
+        request['KeyConditionExpression'] += ' AND begins_with(thingName, :prefix)'
+        request['ExpressionAttributeValues'][':prefix'] = {'S': name_prefix}
+    if start_key:
+        request['ExclusiveStartKey'] = start_key
+
+    response = dynamodb.query(TableName=table_name, Limit=page_size, **request)
+    return [from_item(item) for item in response['Items']], response.get('LastEvaluatedKey')
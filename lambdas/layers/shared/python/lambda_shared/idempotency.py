@@ -0,0 +1,111 @@
+import hashlib
+import json
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+
+def make_key(*parts) -> str:
+    """Derive an idempotency key from request data, e.g. the principal, device and s3Path."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class DynamoDbIdempotencyStore:
+    """
+    Idempotency records in a DynamoDB table keyed by idempotencyKey. A request
+    claims its key with a conditional put; records expire through the table's
+    expiresAt TTL, and expired records that DynamoDB has not removed yet can be
+    claimed again.
+    """
+
+    def __init__(self, dynamodb, table_name: str) -> None:
+        self._dynamodb = dynamodb
+        self._table_name = table_name
+
+    def claim(self, key: str, lease_seconds: int):
+        """
+        Claim a key for a request that is about to run.
+        :param lease_seconds: How long the claim blocks duplicates if the request never completes.
+        :return: None if the claim succeeded, otherwise the existing record as {'status', 'response'}.
+        """
+        now = int(time.time())
+        try:
+            self._dynamodb.put_item(
+                TableName=self._table_name,
+                Item={
+                    'idempotencyKey': {'S': key},
+                    'status': {'S': IN_PROGRESS},
+                    'expiresAt': {'N': str(now + lease_seconds)},
+                },
+                ConditionExpression='attribute_not_exists(idempotencyKey) OR expiresAt < :now',
+                ExpressionAttributeValues={':now': {'N': str(now)}},
+            )
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+        item = self._dynamodb.get_item(
+            TableName=self._table_name,
+            Key={'idempotencyKey': {'S': key}},
+            ConsistentRead=True,
+        ).get('Item')
+        if item is None:
+            # Released between the put and the read; treat it as still in progress
+            return {'status': IN_PROGRESS, 'response': None}
+        response = json.loads(item['response']['S']) if 'response' in item else None
+        return {'status': item['status']['S'], 'response': response}
+
+    def complete(self, key: str, response: dict, ttl_seconds: int) -> None:
+        """Record the response of a claimed request so that duplicates can replay it."""
+        self._dynamodb.put_item(
+            TableName=self._table_name,
+            Item={
+                'idempotencyKey': {'S': key},
+                'status': {'S': COMPLETED},
+                'response': {'S': json.dumps(response)},
+                'expiresAt': {'N': str(int(time.time()) + ttl_seconds)},
+            },
+        )
+
+    def release(self, key: str) -> None:
+        """Drop a claim so that the request can be retried."""
+        self._dynamodb.delete_item(TableName=self._table_name, Key={'idempotencyKey': {'S': key}})
+
+
+class LocalIdempotencyStore:
+    """
+    Idempotency records held in memory. Duplicates are only suppressed when they
+    reach the same container, so this is a fallback for when no table is configured.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self._records = {}
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, lease_seconds: int):
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record['expiresAt'] >= now:
+                return {'status': record['status'], 'response': record['response']}
+            if len(self._records) >= self._max_entries:
+                for expired_key in [k for k, v in self._records.items() if v['expiresAt'] < now]:
+                    del self._records[expired_key]
+                if len(self._records) >= self._max_entries:
+                    del self._records[next(iter(self._records))]
+            self._records[key] = {'status': IN_PROGRESS, 'response': None, 'expiresAt': now + lease_seconds}
+            return None
+
+    def complete(self, key: str, response: dict, ttl_seconds: int) -> None:
+        with self._lock:
+            self._records[key] = {'status': COMPLETED, 'response': response, 'expiresAt': time.time() + ttl_seconds}
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
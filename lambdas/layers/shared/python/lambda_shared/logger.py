@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+
+REDACTED = "[REDACTED]"
+
+# Keys whose values are never written to the logs, compared case-insensitively
+_SENSITIVE_KEYS = {
+    "authorization",
+    "identitytoken",
+    "accesstoken",
+    "idtoken",
+    "token",
+    "email",
+    "password",
+    "cookie",
+}
+# JWTs that end up in free text, e.g. inside a stringified header
+_JWT_PATTERN = re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]*")
+# Email addresses anywhere in a string, whatever key or message they appear in
+_EMAIL_PATTERN = re.compile(r"[\w.%+-]+@[\w-]+(?:\.[\w-]+)+")
+
+
+def redact(value):
+    """
+    Return a copy of value with tokens and personal data masked.
+    :param value: Any JSON-like value.
+    :return: The redacted value.
+    """
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in _SENSITIVE_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return _EMAIL_PATTERN.sub(REDACTED, _JWT_PATTERN.sub(REDACTED, value))
+    return value
+
+
+class _JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line. Only runs for records that pass the level check."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.msg
+        if isinstance(record.args, dict):
+            message = message % redact(record.args)
+        elif record.args:
+            message = message % tuple(redact(arg) for arg in record.args)
+        entry = {
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(str(message)),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _configured_level() -> int:
+    """Read LOG_LEVEL, falling back to INFO for unknown level names."""
+    level = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a logger that writes redacted JSON lines to stdout.
+    The level is read from LOG_LEVEL (default INFO) and set once, here.
+    :param name: The logger name, usually the Lambda module name.
+    """
+    logger = logging.getLogger(name)
+    if not getattr(logger, "_lambda_shared_configured", False):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger._lambda_shared_configured = True
+    logger.base_level = _configured_level()
+    logger.setLevel(logger.base_level)
+    return logger
+
+
+def start_request(logger: logging.Logger, sample_rate: float = None) -> bool:
+    """
+    Pick the log level for one invocation. A sampled invocation logs at DEBUG,
+    every other one at the configured level.
+    :param logger: A logger returned by get_logger.
+    :param sample_rate: Fraction of invocations to sample, LOG_SAMPLE_RATE by default.
+    :return: Whether this invocation is sampled.
+    """
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "0"))
+    sampled = sample_rate > 0 and random.random() < sample_rate
+    level = logging.DEBUG if sampled else logger.base_level
+    # setLevel clears the enabled-level cache of every logger, so it only runs on a change
+    if logger.level != level:
+        logger.setLevel(level)
+    return sampled
@@ -0,0 +1,26 @@
+import json
+import os
+import time
+
+
+def emit_metrics(metrics: dict, dimensions: dict = None, unit: str = "Count") -> None:
+    """
+    Publish metrics by writing a CloudWatch Embedded Metric Format line to stdout.
+    No API call is made; CloudWatch Logs extracts the metrics asynchronously.
+    :param metrics: Metric names and values.
+    :param dimensions: Dimension names and values shared by every metric.
+    :param unit: The CloudWatch unit of every metric.
+    """
+    dimensions = dimensions or {}
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": os.environ.get("METRICS_NAMESPACE", "AvpIotDemo"),
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name in metrics],
+            }],
+        },
+        **dimensions,
+        **metrics,
+    }))
@@ -0,0 +1,52 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lambda_shared.clients import get_iot_data_client
+from lambda_shared.logger import get_logger, start_request
+from lambda_shared.metrics import emit_metrics
+
+logger = get_logger(__name__)
+
+# Keep at or below AWS_CLIENT_MAX_POOL_CONNECTIONS so that publishes never wait for a connection
+PUBLISH_CONCURRENCY = int(os.environ.get('PUBLISH_CONCURRENCY', '10'))
+
+
+def publish_records(iot_client, records):
+    """
+    Publish the body of each SQS record to the download topic of the thing it names.
+    :param records: SQS records whose bodies are download messages.
+    :return: The message ids of the records that were not published.
+    """
+    def publish(record):
+        try:
+            device = json.loads(record['body'])['device']
+            iot_client.publish(topic=f"{os.environ['IOT_TOPIC']}/{device}", qos=1, payload=record['body'])
+            return None
+        except Exception as e:
+            logger.warning("Publishing message %s failed: %s", record['messageId'], e)
+            return record['messageId']
+
+    with ThreadPoolExecutor(max_workers=max(1, min(PUBLISH_CONCURRENCY, len(records)))) as executor:
+        return [message_id for message_id in executor.map(publish, records) if message_id]
+
+
+def lambda_handler(event, context):
+    start_request(logger)
+    records = event.get('Records', [])
+
+    failed = publish_records(get_iot_data_client(), records)
+
+    # How long the oldest message waited in the queue; grows when publishing falls behind
+    sent_timestamps = [int(record['attributes']['SentTimestamp']) for record in records if 'attributes' in record]
+    if sent_timestamps:
+        emit_metrics({'PublishQueueDelay': int(time.time() * 1000) - min(sent_timestamps)},
+                     {'Service': 'Publisher'}, unit='Milliseconds')
+    emit_metrics({'Published': len(records) - len(failed), 'PublishFailed': len(failed)}, {'Service': 'Publisher'})
+    logger.info("Batch published", extra={'fields': {'records': len(records), 'failed': len(failed)}})
+
+    # Only the failed records return to the queue; they reach the dead-letter queue after repeated failures
+    return {
+        'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed]
+    }
@@ -0,0 +1,77 @@
+import os
+import time
+import tracemalloc
+
+import pytest
+
+# Reuse the authorizer fixtures of the unit tests
+from tests.unit.conftest import jwks_url, load_authorizer  # noqa: F401
+
+# Wall-clock assertions flake on loaded machines, so benchmarks only run when asked for
+requires_benchmarks = pytest.mark.skipif(
+    not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run the benchmarks"
+)
+
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", "200"))
+AVP_LATENCY_MS = float(os.environ.get("AVP_LATENCY_MS", "5"))
+
+
+def inject_latency(client, latency_ms=AVP_LATENCY_MS):
+    """
+    Delay every call made through client, before any Stubber response is returned.
+    Must be called before the Stubber is activated.
+    """
+
+    def _sleep(**kwargs):
+        time.sleep(latency_ms / 1000)
+
+    client.meta.events.register_first("before-call.*.*", _sleep)
+
+
+def _percentile(samples, percentile):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def run_benchmark(name, handler, events, warmup=10):
+    """
+    Invoke handler once per event and report wall-clock percentiles, CPU time and allocations.
+    :return: A dict with the measured statistics, all times in milliseconds.
+    """
+    for event in events[:warmup]:
+        handler(event, None)
+
+    wall_times, cpu_times = [], []
+    for event in events:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        handler(event, None)
+        cpu_times.append((time.process_time() - cpu_start) * 1000)
+        wall_times.append((time.perf_counter() - wall_start) * 1000)
+
+    # Allocations are measured in a separate pass, tracing distorts timings
+    peaks = []
+    tracemalloc.start()
+    for event in events[: max(1, len(events) // 10)]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        handler(event, None)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    stats = {
+        "p50_ms": _percentile(wall_times, 50),
+        "p99_ms": _percentile(wall_times, 99),
+        "cpu_ms": sum(cpu_times) / len(cpu_times),
+        "peak_alloc_kb": sum(peaks) / len(peaks) / 1024,
+    }
+    print(
+        f"\n{name:<28} p50={stats['p50_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms "
+        f"cpu={stats['cpu_ms']:.3f}ms peak_alloc={stats['peak_alloc_kb']:.1f}KiB"
+    )
+    return stats
+
+
+@pytest.fixture
+def quiet_logs(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "WARNING")
+    monkeypatch.setenv("LOG_SAMPLE_RATE", "0")
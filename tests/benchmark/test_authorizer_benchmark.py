@@ -0,0 +1,124 @@
+"""
+Microbenchmarks of the Lambda authorizer against a stubbed Verified Permissions.
+
+Run with ``RUN_BENCHMARKS=1 python -m pytest tests/benchmark -s`` to see the report. BENCHMARK_ITERATIONS
+and AVP_LATENCY_MS control the number of invocations and the injected AVP latency.
+"""
+import pytest
+from botocore.stub import Stubber
+
+from tests.benchmark.conftest import AVP_LATENCY_MS, ITERATIONS, inject_latency, requires_benchmarks, run_benchmark
+from tests.unit.conftest import make_token
+from tests.unit.test_authorizer import _batch_response
+from tests.unit.test_local_evaluator import _stub_policy_store
+
+pytestmark = requires_benchmarks
+
+ACTION_IDS = '["get /devices", "post /download"]'
+
+
+def _api_gateway_event(token, method="GET", path="/devices"):
+    """A REQUEST authorizer event with the headers and context API Gateway sends."""
+    return {
+        "type": "REQUEST",
+        "methodArn": f"arn:aws:execute-api:us-east-1:123456789012:abcdef1234/dev/{method}{path}",
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Authorization": f"Bearer {token}",
+            "Host": "abcdef1234.execute-api.us-east-1.amazonaws.com",
+            "User-Agent": "node",
+            "X-Amzn-Trace-Id": "Root=1-67891233-abcdef012345678912345678",
+            "X-Forwarded-For": "203.0.113.10",
+            "X-Forwarded-Port": "443",
+            "X-Forwarded-Proto": "https",
+        },
+        "queryStringParameters": {"s3Path": "s3://bucket/firmware.bin"} if method == "POST" else None,
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": path,
+            "httpMethod": method,
+            "path": f"/dev{path}",
+            "accountId": "123456789012",
+            "stage": "dev",
+            "requestId": "c6af9ac6-7b61-11e6-9a41-93e8deadbeef",
+            "apiId": "abcdef1234",
+            "identity": {"sourceIp": "203.0.113.10", "userAgent": "node"},
+        },
+    }
+
+
+def _events():
+    token = make_token()
+    return [
+        _api_gateway_event(token, *(("GET", "/devices") if i % 2 == 0 else ("POST", "/download")))
+        for i in range(ITERATIONS)
+    ]
+
+
+def test_remote_decisions_without_cache(load_authorizer, quiet_logs):
+    authorizer = load_authorizer(ACTION_IDS=ACTION_IDS, DECISION_CACHE_MAX_ENTRIES="0")
+    events = _events()
+    inject_latency(authorizer.verifiedpermissions)
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        for _ in range(len(events) + len(events) // 10 + 10):
+            stubber.add_response(
+                "batch_is_authorized_with_token",
+                _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+            )
+        stats = run_benchmark("remote, no cache", authorizer.lambda_handler, events)
+
+    assert stats["p50_ms"] >= AVP_LATENCY_MS
+
+
+def test_remote_decisions_with_cache(load_authorizer, quiet_logs):
+    authorizer = load_authorizer(ACTION_IDS=ACTION_IDS)
+    events = _events()
+    inject_latency(authorizer.verifiedpermissions)
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+        )
+        stats = run_benchmark("remote, decision cache", authorizer.lambda_handler, events)
+        stubber.assert_no_pending_responses()
+
+    # Only the first invocation pays for Verified Permissions
+    assert stats["p50_ms"] < AVP_LATENCY_MS
+
+
+def test_local_evaluation(load_authorizer, quiet_logs):
+    pytest.importorskip("cedarpy")
+    authorizer = load_authorizer(
+        ACTION_IDS=ACTION_IDS,
+        LOCAL_EVALUATION="true",
+        POLICY_REFRESH_SECONDS="3600",
+        DECISION_CACHE_MAX_ENTRIES="0",
+    )
+    events = _events()
+    inject_latency(authorizer.verifiedpermissions)
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        _stub_policy_store(stubber)
+        stats = run_benchmark("local evaluation, no cache", authorizer.lambda_handler, events)
+        stubber.assert_no_pending_responses()
+
+    assert stats["p50_ms"] < AVP_LATENCY_MS
+
+
+def test_invalid_token_rejection(load_authorizer, quiet_logs):
+    # Rejections are logged at WARNING, keep them out of the report
+    authorizer = load_authorizer(ACTION_IDS=ACTION_IDS, LOG_LEVEL="ERROR")
+    token = make_token(aud="another-client")
+    events = [_api_gateway_event(token) for _ in range(ITERATIONS)]
+
+    with Stubber(authorizer.verifiedpermissions):
+        stats = run_benchmark("invalid token", authorizer.lambda_handler, events)
+
+    assert stats["p50_ms"] < AVP_LATENCY_MS
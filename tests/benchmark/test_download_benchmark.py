@@ -0,0 +1,179 @@
+"""
+Throughput of device downloads against a local S3 stand-in (moto server).
+
+Run with ``RUN_BENCHMARKS=1 python -m pytest tests/benchmark -s`` to see the report. The stand-in sits
+behind a proxy that adds S3_LATENCY_MS to every request and caps every connection at
+CONNECTION_MBPS, which is what limits a single stream over a real WAN link.
+DOWNLOAD_OBJECT_MB sets the size of the downloaded object; ranged downloads verify its
+SHA-256 as they go.
+"""
+import http.client
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from moto.server import ThreadedMotoServer
+
+from tests.benchmark.conftest import requires_benchmarks
+from tests.unit.conftest import DEVICE_CODE_DIR
+
+pytestmark = requires_benchmarks
+
+OBJECT_MB = int(os.environ.get("DOWNLOAD_OBJECT_MB", "32"))
+CONNECTION_MBPS = float(os.environ.get("CONNECTION_MBPS", "16"))
+S3_LATENCY_MS = float(os.environ.get("S3_LATENCY_MS", "20"))
+MIB = 1024 * 1024
+
+
+class _ThrottlingProxy(BaseHTTPRequestHandler):
+    """Forwards GET and HEAD to moto server, delaying each request and capping each response's rate."""
+
+    protocol_version = "HTTP/1.1"
+    upstream = None
+
+    def do_HEAD(self):
+        self._forward()
+
+    def do_GET(self):
+        self._forward()
+
+    def _forward(self):
+        time.sleep(S3_LATENCY_MS / 1000)
+        connection = http.client.HTTPConnection(*self.upstream)
+        connection.request(self.command, self.path, headers=dict(self.headers))
+        response = connection.getresponse()
+        self.send_response(response.status)
+        for name, value in response.getheaders():
+            if name.lower() not in ("connection", "transfer-encoding", "server", "date"):
+                self.send_header(name, value)
+        self.end_headers()
+
+        started, sent = time.perf_counter(), 0
+        try:
+            while chunk := response.read(64 * 1024):
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                delay = sent / (CONNECTION_MBPS * MIB) - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the download
+            self.close_connection = True
+        finally:
+            connection.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        os.environ.setdefault(name, value)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    _ThrottlingProxy.upstream = server.get_host_and_port()
+    boto3.client("s3", endpoint_url="http://%s:%d" % _ThrottlingProxy.upstream).create_bucket(Bucket="bucket")
+    boto3.client("s3", endpoint_url="http://%s:%d" % _ThrottlingProxy.upstream).put_object(
+        Bucket="bucket", Key="firmware.bin", Body=os.urandom(OBJECT_MB * MIB), ChecksumAlgorithm="SHA256"
+    )
+
+    proxy = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingProxy)
+    proxy.daemon_threads = True
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{proxy.server_port}"
+    proxy.shutdown()
+    server.stop()
+
+
+@pytest.fixture
+def local_subscribe(monkeypatch, s3_endpoint):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    for module_name in ("local_subscribe", "http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+    import local_subscribe
+    monkeypatch.setattr(local_subscribe, "_s3_client", boto3.client(
+        "s3", endpoint_url=s3_endpoint, config=Config(max_pool_connections=16, s3={"addressing_style": "path"})
+    ))
+    yield local_subscribe
+    for module_name in ("local_subscribe", "http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+
+
+def _report(name, seconds):
+    print(f"\n{name:<28} {seconds:.2f}s {OBJECT_MB / seconds:.1f}MiB/s")
+    return OBJECT_MB / seconds
+
+
+def _timed(download):
+    started = time.perf_counter()
+    download()
+    return time.perf_counter() - started
+
+
+def test_ranged_downloads_beat_a_single_stream(local_subscribe, tmp_path, monkeypatch):
+    s3_client = local_subscribe._s3_client
+    single = _report("download_file single stream", _timed(lambda: s3_client.download_file(
+        "bucket", "firmware.bin", str(tmp_path / "single.bin"), Config=TransferConfig(use_threads=False)
+    )))
+    _report("download_file default", _timed(lambda: s3_client.download_file(
+        "bucket", "firmware.bin", str(tmp_path / "default.bin")
+    )))
+
+    ranged = {}
+    for part_size_mb, concurrency in ((8, 4), (8, 8), (4, 8)):
+        monkeypatch.setattr(local_subscribe, "PART_SIZE", part_size_mb * MIB)
+        monkeypatch.setattr(local_subscribe, "PART_CONCURRENCY", concurrency)
+        local_path = tmp_path / f"ranged-{part_size_mb}-{concurrency}.bin"
+        ranged[part_size_mb, concurrency] = _report(
+            f"ranged {part_size_mb}MiB x{concurrency}",
+            _timed(lambda: local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path))),
+        )
+        assert local_path.read_bytes() == (tmp_path / "single.bin").read_bytes()
+
+    assert ranged[8, 4] > 2 * single
+
+
+def test_interrupted_downloads_resume(local_subscribe, tmp_path, monkeypatch):
+    import ranged_download
+    monkeypatch.setattr(local_subscribe, "PART_CONCURRENCY", 4)
+    local_path = tmp_path / "firmware.bin"
+    full = _timed(lambda: local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path)))
+    local_path.unlink()
+
+    # Interrupt the download once half of the object has arrived, then count what the resume fetches
+    download_ranges, received = ranged_download.download_ranges, [0]
+
+    def counted(limit=None):
+        def download(read_range, *args, **kwargs):
+            def read_counted(start, end):
+                for chunk in read_range(start, end):
+                    received[0] += len(chunk)
+                    if limit is not None and received[0] > limit:
+                        raise ConnectionError("connection reset")
+                    yield chunk
+            return download_ranges(read_counted, *args, **kwargs)
+        return download
+
+    monkeypatch.setattr(local_subscribe, "download_ranges", counted(limit=OBJECT_MB * MIB // 2))
+    assert not local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path))
+    monkeypatch.setattr(local_subscribe, "download_ranges", counted())
+    received[0] = 0
+
+    resumed = _timed(lambda: local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path)))
+    print(f"\n{'resume after 50%':<28} {resumed:.2f}s, {received[0] / MIB:.1f}MiB fetched "
+          f"(full download {full:.2f}s)")
+
+    assert local_path.stat().st_size == OBJECT_MB * MIB
+    # Only what the interrupted attempt had not recorded is fetched again
+    assert received[0] <= OBJECT_MB * MIB // 2 + 4 * MIB
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+AUTHORIZER_DIR = os.path.join(ROOT_DIR, "lambdas", "authorizer")
+INTEGRATION_DIR = os.path.join(ROOT_DIR, "lambdas", "integration")
+CATALOG_DIR = os.path.join(ROOT_DIR, "lambdas", "catalog")
+PUBLISHER_DIR = os.path.join(ROOT_DIR, "lambdas", "publisher")
+DEVICE_CODE_DIR = os.path.join(ROOT_DIR, "iot_stack", "device_code")
+SHARED_LAYER_DIR = os.path.join(ROOT_DIR, "lambdas", "layers", "shared", "python")
+
+# Lambda layers are mounted on the function's path at runtime
+sys.path.insert(0, SHARED_LAYER_DIR)
+
+USER_POOL_ID = "us-east-1_TestPool"
+CLIENT_ID = "test-client"
+AUTHORIZER_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "POLICY_STORE_ID": "ps-test",
+    "NAMESPACE": "AvpIotDemoApi",
+    "TOKEN_TYPE": "identityToken",
+    "USER_POOL_ID": USER_POOL_ID,
+    "CLIENT_ID": CLIENT_ID,
+}
+
+# 2048-bit RSA key used to sign test tokens; never use it for anything else
+TEST_KEY_ID = "test-key"
+TEST_KEY_N = int(
+    "b4afb0239ac87a2de0eab75adc80bf540bf00a31dc4dd1c754b39cef63bfafa1f8887fcc03986250560fdb4635218dc0e70e6bc8261e583b6639ae85d1dcc86e6f7c63bfed7062926f44adb7d137198957f658f23176e246f4201d10c399b6103ebc012b1c8335b4c98987fb90ac6cc8bbf359d77f112bdaaf793514000dde2cd758d9c623db13d6cced180103a1dba6294f49453b7736fcb0aea96e3297909e856e54fe4313975281d8f51bbfa42430049262aad8465f99a8024995ce245409930270facee864e2c005d04330b097420aad78d596f3925f758461dada03b2cef71bf8cd0e70268ea815fe48987c68a170e7abc1163daa5ac4a72ffda6f34c69",
+    16,
+)
+TEST_KEY_E = 65537
+TEST_KEY_D = int(
+    "339ed5daf6323c50607cee314939dc6f833c4022b53be3a8e7ac00de96482c9740f7f8fad78970dd096eb248968ea57eed0413b58a1e5fe56873d0f11909d3415471dc804d5cd9972daec3554c079fdb65d952d95959b63fc07dc43ab131cd9a9fdc4fc124a8dfc3c1fd9c19e4dfe89c58b0a7843220926a2c78f10f166235376e04f8c797e8f217da8a30a0cd876e9b2701933c152461cd0a0f9dbecef62f9860396a66abf66ec6cba488b11daa3e7ba12c4f74c053ec76a4a45ed34b8676cde1aa01464bcaa3d65ad4bd349b0247d2c25618ca8fa45ed09722ef1479049b05c7d1baa3a705a200c8a2d738306508bb8f398bab0ad4c9d0c340e143f5ca231",
+    16,
+)
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64url_int(value: int) -> str:
+    return _b64url(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+def _rs256_sign(signing_input: bytes) -> bytes:
+    key_length = (TEST_KEY_N.bit_length() + 7) // 8
+    digest_info = _SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    encoded = b"\x00\x01" + b"\xff" * (key_length - len(digest_info) - 3) + b"\x00" + digest_info
+    return pow(int.from_bytes(encoded, "big"), TEST_KEY_D, TEST_KEY_N).to_bytes(key_length, "big")
+
+
+def make_jwks() -> dict:
+    return {
+        "keys": [
+            {
+                "kid": TEST_KEY_ID,
+                "kty": "RSA",
+                "alg": "RS256",
+                "use": "sig",
+                "n": _b64url_int(TEST_KEY_N),
+                "e": _b64url_int(TEST_KEY_E),
+            }
+        ]
+    }
+
+
+def make_token(sub="user-1", groups=("manager",), exp_in=3600, kid=TEST_KEY_ID, **claims) -> str:
+    """Build an identity token signed like the ones Cognito issues."""
+    payload = {
+        "sub": sub,
+        "iss": f"https://cognito-idp.us-east-1.amazonaws.com/{USER_POOL_ID}",
+        "aud": CLIENT_ID,
+        "cognito:groups": list(groups),
+        "token_use": "id",
+        "exp": int(time.time()) + exp_in,
+        **claims,
+    }
+    header = {"alg": "RS256", "kid": kid}
+    signing_input = f"{_b64url(json.dumps(header).encode())}.{_b64url(json.dumps(payload).encode())}"
+    return f"{signing_input}.{_b64url(_rs256_sign(signing_input.encode()))}"
+
+
+def make_authorizer_event(token, method="GET", path="/devices", query=None) -> dict:
+    return {
+        "type": "REQUEST",
+        "methodArn": f"arn:aws:execute-api:us-east-1:123456789012:api-id/dev/{method}{path}",
+        "headers": {"Authorization": f"Bearer {token}"},
+        "queryStringParameters": query,
+        "requestContext": {"httpMethod": method, "resourcePath": path},
+    }
+
+
+def make_proxy_event(authorizer_context=None, query=None, headers=None, body=None) -> dict:
+    return {
+        "headers": headers or {},
+        "queryStringParameters": query,
+        "body": body,
+        "requestContext": {"authorizer": authorizer_context},
+    }
+
+
+@pytest.fixture
+def jwks_url(tmp_path):
+    """Serve the test JWKS from a local file so no test reaches Cognito."""
+    jwks_path = tmp_path / "jwks.json"
+    jwks_path.write_text(json.dumps(make_jwks()))
+    return jwks_path.as_uri()
+
+
+@pytest.fixture
+def load_authorizer(monkeypatch, jwks_url):
+    """Return a loader that imports a fresh copy of the authorizer with test environment variables."""
+    monkeypatch.syspath_prepend(AUTHORIZER_DIR)
+
+    def _load(**env):
+        for key, value in {**AUTHORIZER_ENV, "JWKS_URL": jwks_url, **env}.items():
+            monkeypatch.setenv(key, value)
+        sys.modules.pop("index", None)
+        return importlib.import_module("index")
+
+    yield _load
+    sys.modules.pop("index", None)
+
+
+@pytest.fixture
+def authorizer(load_authorizer):
+    return load_authorizer()
+
+
+@pytest.fixture
+def load_integration(monkeypatch):
+    """Return a loader that imports a fresh copy of an integration function with test environment variables."""
+    monkeypatch.syspath_prepend(INTEGRATION_DIR)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    loaded = []
+
+    def _load(module_name, **env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        sys.modules.pop(module_name, None)
+        loaded.append(module_name)
+        return importlib.import_module(module_name)
+
+    yield _load
+    for module_name in loaded:
+        sys.modules.pop(module_name, None)
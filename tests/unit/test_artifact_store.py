@@ -0,0 +1,145 @@
+import os
+import sys
+
+import pytest
+
+from tests.unit.conftest import DEVICE_CODE_DIR
+
+S3_PATH = "s3://device-bucket/firmware.bin"
+DEVICE_MODULES = ("checksums", "ranged_download", "http_download", "artifact_store", "local_subscribe")
+
+
+@pytest.fixture
+def device_modules(monkeypatch):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    for module_name in DEVICE_MODULES:
+        sys.modules.pop(module_name, None)
+    import artifact_store
+    import local_subscribe
+    yield artifact_store, local_subscribe
+    for module_name in DEVICE_MODULES:
+        sys.modules.pop(module_name, None)
+
+
+def _item(content, etag='"v1"'):
+    return {"s3Path": S3_PATH, "url": "https://example.com/firmware.bin", "etag": etag, "size": len(content)}
+
+
+def _write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_content_keys(device_modules):
+    artifact_store, _ = device_modules
+    sha256 = {"algorithm": "SHA256", "value": "FeKw08M4keuw8e9gnsQZQgwg4yDOlMZfvIwzEkSOsiU="}
+
+    assert artifact_store.content_key({**_item(b"abc"), "checksum": sha256}) == \
+        "sha256-15e2b0d3c33891ebb0f1ef609ec419420c20e320ce94c65fbc8c3312448eb225"
+    # Without a checksum, the ETag identifies the content
+    assert artifact_store.content_key(_item(b"abc")) == artifact_store.content_key(
+        {**_item(b"abc"), "s3Path": "s3://device-bucket/other.bin"}
+    )
+    assert artifact_store.content_key(_item(b"abc")) != artifact_store.content_key(_item(b"abc", etag='"v2"'))
+    assert artifact_store.content_key({"s3Path": S3_PATH}) is None
+
+
+def test_links_share_one_blob(device_modules, tmp_path):
+    artifact_store, _ = device_modules
+    store = artifact_store.ArtifactStore(str(tmp_path / ".store"))
+    first_path = _write(tmp_path / "day-1" / "firmware.bin", b"abc")
+
+    store.add("key", first_path)
+    assert store.link("key", str(tmp_path / "day-2" / "firmware.bin"))
+
+    assert os.path.samefile(first_path, tmp_path / "day-2" / "firmware.bin")
+    assert store.stats() == {"blobs": 1, "bytes": 3, "links": 2}
+    assert not store.link("other-key", str(tmp_path / "day-2" / "other.bin"))
+    # The index survives restarts
+    assert artifact_store.ArtifactStore(str(tmp_path / ".store")).link("key", str(tmp_path / "day-3" / "firmware.bin"))
+
+
+def test_duplicate_downloads_are_folded_into_the_blob(device_modules, tmp_path):
+    artifact_store, _ = device_modules
+    store = artifact_store.ArtifactStore(str(tmp_path / ".store"))
+    first_path = _write(tmp_path / "a" / "firmware.bin", b"abc")
+    second_path = _write(tmp_path / "b" / "firmware.bin", b"abc")
+
+    store.add("key", first_path)
+    store.add("key", second_path)
+
+    assert os.path.samefile(first_path, second_path)
+
+
+def test_least_recently_used_blobs_are_evicted(device_modules, tmp_path):
+    artifact_store, _ = device_modules
+    store = artifact_store.ArtifactStore(str(tmp_path / ".store"), quota_bytes=6)
+    old_path = _write(tmp_path / "day-1" / "old.bin", b"old")
+    used_path = _write(tmp_path / "day-1" / "used.bin", b"use")
+    store.add("old", old_path)
+    store.add("used", used_path)
+    store.link("used", str(tmp_path / "day-2" / "used.bin"))
+
+    store.add("new", _write(tmp_path / "day-2" / "new.bin", b"new"))
+
+    assert not os.path.exists(old_path)
+    assert not store.link("old", old_path)
+    assert os.path.exists(used_path) and os.path.exists(tmp_path / "day-2" / "used.bin")
+    assert store.stats() == {"blobs": 2, "bytes": 6, "links": 3}
+
+
+def test_eviction_keeps_paths_that_hold_other_content(device_modules, tmp_path):
+    artifact_store, _ = device_modules
+    store = artifact_store.ArtifactStore(str(tmp_path / ".store"), quota_bytes=3)
+    local_path = _write(tmp_path / "firmware.bin", b"old")
+    store.add("old", local_path)
+    os.remove(local_path)
+    _write(tmp_path / "firmware.bin", b"mine")
+
+    store.add("new", _write(tmp_path / "new.bin", b"new"))
+
+    assert (tmp_path / "firmware.bin").read_bytes() == b"mine"
+
+
+def test_repeated_pushes_are_served_from_the_store(device_modules, tmp_path, monkeypatch):
+    artifact_store, local_subscribe = device_modules
+    monkeypatch.setattr(local_subscribe, "artifact_store", artifact_store.ArtifactStore(str(tmp_path / ".store")))
+    downloads = []
+
+    def download_url(url, local_path, size=None, etag=None, **kwargs):
+        downloads.append(local_path)
+        with open(local_path, "wb") as file:
+            file.write(b"abc")
+
+    monkeypatch.setattr(local_subscribe, "download_url", download_url)
+    monkeypatch.setattr(local_subscribe, "download_from_s3", lambda *args: pytest.fail("used the S3 API"))
+    first_path, second_path = str(tmp_path / "day-1" / "firmware.bin"), str(tmp_path / "day-2" / "firmware.bin")
+    (tmp_path / "day-1").mkdir()
+
+    assert local_subscribe.fetch(_item(b"abc"), first_path)
+    assert local_subscribe.fetch(_item(b"abc"), first_path)
+    assert local_subscribe.fetch(_item(b"abc"), second_path)
+
+    assert downloads == [first_path]
+    assert os.path.samefile(first_path, second_path)
+
+
+def test_corrupt_downloads_are_discarded(device_modules, tmp_path, monkeypatch):
+    artifact_store, local_subscribe = device_modules
+    monkeypatch.setattr(local_subscribe, "artifact_store", artifact_store.ArtifactStore(str(tmp_path / ".store")))
+    import ranged_download
+
+    def download_url(url, local_path, size=None, etag=None, **kwargs):
+        ranged_download.download_ranges(lambda start, end: iter([b"abd"]), local_path, size, etag,
+                                        checksum=kwargs["checksum"])
+
+    monkeypatch.setattr(local_subscribe, "download_url", download_url)
+    monkeypatch.setattr(local_subscribe, "download_from_s3", lambda *args: False)
+    local_path = str(tmp_path / "firmware.bin")
+    item = {**_item(b"abc"), "checksum": {"algorithm": "CRC32", "value": "NSRBwg=="}}
+
+    assert not local_subscribe.fetch(item, local_path)
+
+    assert not (tmp_path / "firmware.bin").exists()
+    assert local_subscribe.artifact_store.stats()["blobs"] == 0
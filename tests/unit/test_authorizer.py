@@ -0,0 +1,230 @@
+import json
+import time
+
+from botocore.stub import Stubber
+
+from tests.unit.conftest import USER_POOL_ID, make_authorizer_event, make_token
+
+
+def _principal(sub="user-1"):
+    return {"entityType": "AvpIotDemoApi::User", "entityId": f"{USER_POOL_ID}|{sub}"}
+
+
+def test_repeated_requests_hit_decision_cache(authorizer):
+    token = make_token()
+    event = make_authorizer_event(token)
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "is_authorized_with_token",
+            {"decision": "ALLOW", "determiningPolicies": [], "errors": [], "principal": _principal()},
+        )
+        first = authorizer.lambda_handler(event, None)
+        second = authorizer.lambda_handler(event, None)
+        stubber.assert_no_pending_responses()
+
+    assert first["policyDocument"] == second["policyDocument"]
+    assert first["policyDocument"]["Statement"][0]["Effect"] == "Allow"
+    assert authorizer.decision_cache.stats()["hits"] == 1
+    assert authorizer.decision_cache.stats()["misses"] == 1
+
+
+def test_decision_cache_hits_and_misses_are_published(authorizer, capsys):
+    event = make_authorizer_event(make_token())
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "is_authorized_with_token",
+            {"decision": "ALLOW", "determiningPolicies": [], "errors": [], "principal": _principal()},
+        )
+        authorizer.lambda_handler(event, None)
+        authorizer.lambda_handler(event, None)
+
+    metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+    assert [(metric["DecisionCacheHits"], metric["DecisionCacheMisses"])
+            for metric in metrics if "DecisionCacheHits" in metric] == [(0, 1), (1, 0)]
+
+
+def test_decision_cache_is_keyed_by_action(authorizer):
+    token = make_token()
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        for decision in ("ALLOW", "DENY"):
+            stubber.add_response(
+                "is_authorized_with_token",
+                {"decision": decision, "determiningPolicies": [], "errors": [], "principal": _principal()},
+            )
+        devices = authorizer.lambda_handler(make_authorizer_event(token), None)
+        download = authorizer.lambda_handler(make_authorizer_event(token, "POST", "/download"), None)
+        stubber.assert_no_pending_responses()
+
+    assert devices["policyDocument"]["Statement"][0]["Effect"] == "Allow"
+    assert download["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+
+
+def test_decision_cache_entries_never_outlive_token(authorizer):
+    cache = authorizer.DecisionCache(max_entries=8, ttl_seconds=300)
+    key = cache.make_key("token", "get /devices")
+
+    cache.put(key, {"decision": "ALLOW"}, time.time() - 1)
+    assert cache.get(key) is None
+
+    cache.put(key, {"decision": "ALLOW"}, time.time() + 60)
+    assert cache.get(key) == {"decision": "ALLOW"}
+
+
+def test_decision_cache_evicts_least_recently_used(authorizer):
+    cache = authorizer.DecisionCache(max_entries=2, ttl_seconds=300)
+    exp = time.time() + 60
+    cache.put("a", 1, exp)
+    cache.put("b", 2, exp)
+    cache.get("a")
+    cache.put("c", 3, exp)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["size"] == 2
+
+
+def _batch_response(*decisions):
+    return {
+        "principal": _principal(),
+        "results": [
+            {
+                "request": {
+                    "action": {"actionType": "AvpIotDemoApi::Action", "actionId": action_id},
+                    "resource": {"entityType": "AvpIotDemoApi::Application", "entityId": "AvpIotDemoApi"},
+                },
+                "decision": decision,
+                "determiningPolicies": [],
+                "errors": [],
+            }
+            for action_id, decision in decisions
+        ],
+    }
+
+
+def test_first_request_authorizes_every_action_in_one_call(load_authorizer):
+    authorizer = load_authorizer(ACTION_IDS='["get /devices", "post /download"]')
+    token = make_token()
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "DENY")),
+        )
+        devices = authorizer.lambda_handler(make_authorizer_event(token), None)
+        download = authorizer.lambda_handler(make_authorizer_event(token, "POST", "/download"), None)
+        stubber.assert_no_pending_responses()
+
+    assert devices["policyDocument"] == download["policyDocument"]
+    assert devices["policyDocument"]["Statement"] == [
+        {
+            "Action": "execute-api:Invoke",
+            "Effect": "Allow",
+            "Resource": ["arn:aws:execute-api:us-east-1:123456789012:api-id/dev/GET/devices"],
+        },
+        {
+            "Action": "execute-api:Invoke",
+            "Effect": "Deny",
+            "Resource": ["arn:aws:execute-api:us-east-1:123456789012:api-id/dev/POST/download"],
+        },
+    ]
+    assert download["principalId"] == f'AvpIotDemoApi::User::"{USER_POOL_ID}|user-1"'
+    assert authorizer.decision_cache.stats()["hits"] == 2
+
+
+def test_uncached_requests_make_one_call_each(load_authorizer):
+    authorizer = load_authorizer(ACTION_IDS='["get /devices", "post /download"]', DECISION_CACHE_MAX_ENTRIES="0")
+    token = make_token()
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        for _ in range(4):
+            stubber.add_response(
+                "batch_is_authorized_with_token",
+                _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+            )
+        for method, path in [("GET", "/devices"), ("POST", "/download")] * 2:
+            authorizer.lambda_handler(make_authorizer_event(token, method, path), None)
+        stubber.assert_no_pending_responses()
+
+
+def test_actions_outside_the_schema_use_a_single_call(load_authorizer):
+    authorizer = load_authorizer(ACTION_IDS='["get /devices"]')
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response("batch_is_authorized_with_token", _batch_response(("get /devices", "ALLOW")))
+        stubber.add_response(
+            "is_authorized_with_token",
+            {"decision": "DENY", "determiningPolicies": [], "errors": [], "principal": _principal()},
+        )
+        response = authorizer.lambda_handler(make_authorizer_event(make_token(), "GET", "/unknown"), None)
+        stubber.assert_no_pending_responses()
+
+    assert response["policyDocument"]["Statement"] == [
+        {
+            "Action": "execute-api:Invoke",
+            "Effect": "Allow",
+            "Resource": ["arn:aws:execute-api:us-east-1:123456789012:api-id/dev/GET/devices"],
+        },
+        {
+            "Action": "execute-api:Invoke",
+            "Effect": "Deny",
+            "Resource": ["arn:aws:execute-api:us-east-1:123456789012:api-id/dev/GET/unknown"],
+        },
+    ]
+
+
+def test_context_carries_identity_and_allowed_actions(load_authorizer):
+    authorizer = load_authorizer(ACTION_IDS='["get /devices", "post /download"]')
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+        )
+        response = authorizer.lambda_handler(make_authorizer_event(make_token(groups=("manager", "operator"))), None)
+
+    assert response["context"] == {
+        "principalId": f'AvpIotDemoApi::User::"{USER_POOL_ID}|user-1"',
+        "sub": "user-1",
+        "groups": "manager,operator",
+        "allowedActions": "get /devices,post /download",
+        "degraded": False,
+    }
+
+
+def test_authenticated_actions_skip_verified_permissions(load_authorizer):
+    authorizer = load_authorizer(AUTHENTICATED_ACTION_IDS='["get /role"]')
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        response = authorizer.lambda_handler(make_authorizer_event(make_token(groups=()), "GET", "/role"), None)
+        stubber.assert_no_pending_responses()
+
+    assert response["policyDocument"]["Statement"] == [
+        {
+            "Action": "execute-api:Invoke",
+            "Effect": "Allow",
+            "Resource": ["arn:aws:execute-api:us-east-1:123456789012:api-id/dev/GET/role"],
+        },
+    ]
+    assert response["context"]["groups"] == ""
+    assert response["context"]["allowedActions"] == "get /role"
+
+
+def test_authenticated_actions_still_require_a_valid_token(load_authorizer):
+    authorizer = load_authorizer(AUTHENTICATED_ACTION_IDS='["get /role"]')
+
+    response = authorizer.lambda_handler(make_authorizer_event(make_token(exp_in=-60), "GET", "/role"), None)
+
+    assert response["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+
+
+def test_missing_tokens_are_denied(authorizer):
+    event = make_authorizer_event(make_token())
+    del event["headers"]["Authorization"]
+
+    response = authorizer.lambda_handler(event, None)
+
+    assert response["policyDocument"]["Statement"][0]["Effect"] == "Deny"
@@ -7,9 +7,125 @@ from avp_iot_demo.avp_iot_demo_stack import AvpIotDemoStack
 # resource in avp_iot_demo/avp_iot_demo_stack.py
 def test_sqs_queue_created():
     app = core.App()
-    stack = AvpIotDemoStack(app, "avp-iot-demo")
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
     template = assertions.Template.from_stack(stack)
 
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+def test_authorizer_results_are_cached_per_token():
+    app = core.App()
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    template = assertions.Template.from_stack(stack)
+
+    apis = template.find_resources("AWS::ApiGateway::RestApi")
+    (api,) = apis.values()
+    authorizer = api["Properties"]["Body"]["components"]["securitySchemes"]["AvpAuthorizer"][
+        "x-amazon-apigateway-authorizer"
+    ]
+    assert authorizer["identitySource"] == "method.request.header.Authorization"
+    assert authorizer["authorizerResultTtlInSeconds"] == 300
+
+
+def test_authorizer_outlasts_its_slowest_cold_start():
+    app = core.App()
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    template = assertions.Template.from_stack(stack)
+
+    (authorizer,) = [
+        function for function in template.find_resources("AWS::Lambda::Function").values()
+        if function["Properties"].get("Handler") == "index.lambda_handler"
+    ]
+    variables = authorizer["Properties"]["Environment"]["Variables"]
+    # JWKS fetch, one batch call and one single call, each within its own budget
+    assert authorizer["Properties"]["Timeout"] > 2 + 2 * float(variables["AVP_TIMEOUT_BUDGET_SECONDS"])
+
+
+def test_devices_read_from_the_device_catalog():
+    app = core.App()
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::IoT::TopicRule", {
+        "TopicRulePayload": assertions.Match.object_like({
+            "Sql": "SELECT * FROM '$aws/events/thing/+/+'",
+        }),
+    })
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [
+            {"AttributeName": "catalog", "KeyType": "HASH"},
+            {"AttributeName": "thingName", "KeyType": "RANGE"},
+        ],
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "devices.lambda_handler",
+        "Environment": {
+            "Variables": assertions.Match.object_like({"DEVICE_CATALOG_TABLE": assertions.Match.any_value()}),
+        },
+    })
+
+
+def test_api_compresses_responses():
+    app = core.App()
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::RestApi", {"MinimumCompressionSize": 1024})
+
+
+def test_rollout_creates_jobs_for_the_thing_group():
+    app = core.App()
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "rollout.lambda_handler",
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "IOT_THING_GROUP": {"Fn::ImportValue": "IoTThingGroupName-Export"},
+            }),
+        },
+    })
+    (api,) = template.find_resources("AWS::ApiGateway::RestApi").values()
+    assert "post" in api["Properties"]["Body"]["paths"]["/rollout"]
+
+
+def test_downloads_are_queued_for_the_publisher():
+    app = core.App()
+    stack = AvpIotDemoStack(app, "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+        "ScalingConfig": {"MaximumConcurrency": 2},
+    })
+    template.has_resource_properties("AWS::SQS::Queue", {
+        "RedrivePolicy": assertions.Match.object_like({"maxReceiveCount": 5}),
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "download.lambda_handler",
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "PUBLISH_QUEUE_URL": assertions.Match.any_value(),
+                "IDEMPOTENCY_TABLE": assertions.Match.any_value(),
+            }),
+        },
+    })
+
+
+def test_fleet_indexing_is_opt_in():
+    default = assertions.Template.from_stack(
+        AvpIotDemoStack(core.App(), "avp-iot-demo", config_path="web_app/amplify_outputs.json")
+    )
+    enabled = assertions.Template.from_stack(AvpIotDemoStack(
+        core.App(context={"enableFleetIndexing": "true"}), "avp-iot-demo", config_path="web_app/amplify_outputs.json"
+    ))
+
+    # Indexing is account-wide, so the stack never changes it unless asked to
+    def indexing(template):
+        return [name for name in template.find_resources("Custom::AWS") if name.startswith("FleetIndexing")]
+
+    assert indexing(default) == []
+    assert len(indexing(enabled)) == 1
@@ -0,0 +1,42 @@
+import pytest
+from botocore.stub import Stubber
+
+from lambda_shared import clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(clients, "_clients", {})
+    monkeypatch.setattr(clients, "_iot_data_endpoint", None)
+
+
+def test_clients_are_created_once_per_container():
+    assert clients.get_client("iot") is clients.get_client("iot")
+    assert clients.get_client("iot") is not clients.get_client("iot", read_timeout=1)
+
+
+def test_clients_use_tuned_configuration(monkeypatch):
+    monkeypatch.setenv("AWS_CLIENT_MAX_POOL_CONNECTIONS", "25")
+    config = clients.get_client("verifiedpermissions", read_timeout=1.5).meta.config
+
+    assert config.max_pool_connections == 25
+    assert config.tcp_keepalive is True
+    assert config.connect_timeout == 2
+    assert config.read_timeout == 1.5
+    assert config.retries["mode"] == "adaptive"
+
+
+def test_iot_data_endpoint_is_resolved_once():
+    with Stubber(clients.get_client("iot")) as stubber:
+        stubber.add_response(
+            "describe_endpoint",
+            {"endpointAddress": "abc123-ats.iot.us-east-1.amazonaws.com"},
+            {"endpointType": "iot:Data-ATS"},
+        )
+        first = clients.get_iot_data_client()
+        second = clients.get_iot_data_client()
+        stubber.assert_no_pending_responses()
+
+    assert first is second
+    assert first.meta.endpoint_url == "https://abc123-ats.iot.us-east-1.amazonaws.com"
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.unit.conftest import ROOT_DIR
+
+CERT_LAMBDA_DIR = os.path.join(ROOT_DIR, "iot_stack", "lambda")
+CONTEXT = SimpleNamespace(invoked_function_arn="arn:aws:lambda:us-east-1:123456789012:function:create-cert")
+
+
+class _CloudFormation:
+    """Collects the responses the handler sends to the pre-signed response URL."""
+
+    def __init__(self):
+        self.responses = []
+
+    def PoolManager(self):
+        return self
+
+    def request(self, method, url, body, headers):
+        self.responses.append(json.loads(body))
+
+
+@pytest.fixture
+def create_cert(monkeypatch):
+    monkeypatch.syspath_prepend(CERT_LAMBDA_DIR)
+    for key, value in {
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "CERTIFICATE_SSM_PARAM": "/iot/device-1/certificate",
+        "PRIVATE_KEY_SSM_PARAM": "/iot/device-1/private-key",
+        "PUBLIC_KEY_SSM_PARAM": "/iot/device-1/public-key",
+        "THING_NAME": "device-1",
+        "IOT_TOPIC": "downloads",
+        "THING_GROUP": "fleet",
+    }.items():
+        monkeypatch.setenv(key, value)
+    sys.modules.pop("create_cert", None)
+    import create_cert
+    monkeypatch.setattr(create_cert, "urllib3", _CloudFormation())
+    with mock_aws():
+        boto3.client("iot").create_thing_group(thingGroupName="fleet")
+        yield create_cert
+    sys.modules.pop("create_cert", None)
+
+
+def _event(request_type, physical_id=None):
+    event = {
+        "RequestType": request_type,
+        "StackId": "stack",
+        "RequestId": "request",
+        "LogicalResourceId": "CertificateResource",
+        "ResponseURL": "https://cloudformation.example.com/response",
+    }
+    if physical_id:
+        event["PhysicalResourceId"] = physical_id
+    return event
+
+
+def test_updates_apply_the_current_policy_to_the_existing_certificate(create_cert, monkeypatch):
+    iot = boto3.client("iot")
+    created = create_cert.handler(_event("Create"), CONTEXT)
+    assert created["Status"] == "SUCCESS"
+
+    # Fill the policy up to its version limit so the update has to prune
+    for _ in range(4):
+        iot.create_policy_version(policyName="device-1-policy", policyDocument=json.dumps({"Version": "2012-10-17", "Statement": []}))
+    monkeypatch.setenv("IOT_TOPIC", "firmware")
+    updated = create_cert.handler(_event("Update", created["PhysicalResourceId"]), CONTEXT)
+
+    assert updated["Status"] == "SUCCESS"
+    assert updated["PhysicalResourceId"] == created["PhysicalResourceId"]
+    assert updated["Data"]["certificateArn"] == created["Data"]["certificateArn"]
+    assert len(iot.list_certificates()["certificates"]) == 1
+    policy = json.loads(iot.get_policy(policyName="device-1-policy")["policyDocument"])
+    assert policy == create_cert.policy_document("us-east-1", "123456789012", "device-1", "firmware")
+    assert len(iot.list_policy_versions(policyName="device-1-policy")["policyVersions"]) == 2
+
+
+def test_unchanged_policy_is_not_versioned(create_cert):
+    iot = boto3.client("iot")
+    created = create_cert.handler(_event("Create"), CONTEXT)
+
+    create_cert.handler(_event("Update", created["PhysicalResourceId"]), CONTEXT)
+
+    assert len(iot.list_policy_versions(policyName="device-1-policy")["policyVersions"]) == 1
+
+
+def test_updates_add_the_thing_to_a_new_group(create_cert, monkeypatch):
+    iot = boto3.client("iot")
+    created = create_cert.handler(_event("Create"), CONTEXT)
+
+    iot.create_thing_group(thingGroupName="canary")
+    monkeypatch.setenv("THING_GROUP", "canary")
+    # A retried Update finds the thing already in the group
+    create_cert.handler(_event("Update", created["PhysicalResourceId"]), CONTEXT)
+    updated = create_cert.handler(_event("Update", created["PhysicalResourceId"]), CONTEXT)
+
+    assert updated["Status"] == "SUCCESS"
+    groups = iot.list_thing_groups_for_thing(thingName="device-1")["thingGroups"]
+    assert "canary" in [group["groupName"] for group in groups]
@@ -0,0 +1,132 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from tests.unit.conftest import make_authorizer_event, make_token
+from tests.unit.test_authorizer import _batch_response
+
+ACTION_IDS = '["get /devices", "post /download"]'
+
+
+@pytest.fixture
+def authorizer(load_authorizer):
+    # Disable the token cache so every request reaches the decision path
+    return load_authorizer(
+        ACTION_IDS=ACTION_IDS,
+        DECISION_CACHE_MAX_ENTRIES="0",
+        AVP_MAX_ATTEMPTS="1",
+        AVP_BREAKER_FAILURE_THRESHOLD="2",
+        AVP_BREAKER_RESET_SECONDS="30",
+    )
+
+
+def _effects(response):
+    return {statement["Effect"]: statement["Resource"] for statement in response["policyDocument"]["Statement"]}
+
+
+def _emitted_metrics(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_throttling_without_history_is_not_a_decision(authorizer):
+    # Raising makes API Gateway answer 500 instead of caching a deny for the token
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_client_error("batch_is_authorized_with_token", "ThrottlingException")
+        with pytest.raises(RuntimeError, match="No decision"):
+            authorizer.lambda_handler(make_authorizer_event(make_token()), None)
+
+
+def test_throttling_serves_last_known_good_decision(authorizer, capsys):
+    token = make_token()
+    event = make_authorizer_event(token)
+    download_event = make_authorizer_event(token, "POST", "/download")
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "DENY")),
+        )
+        stubber.add_client_error("batch_is_authorized_with_token", "ThrottlingException")
+        stubber.add_client_error("batch_is_authorized_with_token", "ThrottlingException")
+        fresh = authorizer.lambda_handler(event, None)
+        stale = authorizer.lambda_handler(event, None)
+        stale_download = authorizer.lambda_handler(download_event, None)
+        stubber.assert_no_pending_responses()
+
+    # API Gateway reuses the cached policy for every endpoint the token calls, so it covers them all
+    assert stale["policyDocument"] == fresh["policyDocument"]
+    assert _effects(stale)["Deny"] == [download_event["methodArn"]]
+    assert stale_download["policyDocument"] == fresh["policyDocument"]
+    assert stale["context"]["degraded"] is True
+    assert stale["context"]["allowedActions"] == "get /devices"
+    assert fresh["context"]["degraded"] is False
+    metrics = _emitted_metrics(capsys.readouterr().out)
+    assert [metric["StaleDecisionsServed"] for metric in metrics if "StaleDecisionsServed" in metric] == [1, 1]
+
+
+def test_partial_history_is_not_a_decision(authorizer):
+    principal = f"{authorizer.user_pool_id}|user-1"
+    authorizer.last_known_good.put(
+        authorizer.DecisionCache.make_key(principal, "get /devices"), {"decision": "ALLOW"}, float("inf")
+    )
+
+    # A policy without post /download would deny it for as long as API Gateway caches the result
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_client_error("batch_is_authorized_with_token", "ThrottlingException")
+        with pytest.raises(RuntimeError, match="No decision"):
+            authorizer.lambda_handler(make_authorizer_event(make_token()), None)
+
+
+def test_open_circuit_skips_verified_permissions(authorizer, capsys):
+    event = make_authorizer_event(make_token())
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+        )
+        stubber.add_client_error("batch_is_authorized_with_token", "ThrottlingException")
+        stubber.add_client_error("batch_is_authorized_with_token", "InternalServerException", http_status_code=500)
+        for _ in range(4):
+            response = authorizer.lambda_handler(event, None)
+        stubber.assert_no_pending_responses()
+
+    assert authorizer.avp_breaker.state == "open"
+    assert list(_effects(response)) == ["Allow"]
+    metrics = _emitted_metrics(capsys.readouterr().out)
+    assert any(metric.get("AvpCircuitOpen") == 1 for metric in metrics)
+
+
+def test_circuit_closes_after_successful_trial_call(authorizer, monkeypatch):
+    breaker = authorizer.avp_breaker
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    monkeypatch.setattr(breaker, "_opened_at", breaker._opened_at - 60)
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+        )
+        authorizer.lambda_handler(make_authorizer_event(make_token()), None)
+
+    assert breaker.state == "closed"
+
+
+def test_non_transient_errors_are_not_masked(authorizer):
+    event = make_authorizer_event(make_token())
+
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "batch_is_authorized_with_token",
+            _batch_response(("get /devices", "ALLOW"), ("post /download", "ALLOW")),
+        )
+        stubber.add_client_error("batch_is_authorized_with_token", "AccessDeniedException", http_status_code=403)
+        authorizer.lambda_handler(event, None)
+        with pytest.raises(ClientError, match="AccessDeniedException"):
+            authorizer.lambda_handler(event, None)
+
+    assert authorizer.avp_breaker.state == "closed"
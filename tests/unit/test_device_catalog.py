@@ -0,0 +1,144 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from moto import mock_aws
+
+from lambda_shared.clients import get_client
+from tests.unit.conftest import CATALOG_DIR, make_proxy_event
+
+TABLE_NAME = "DeviceCatalog"
+
+
+@pytest.fixture
+def catalog_env(monkeypatch, load_integration):
+    """Create the catalog table in a mocked account and return a loader for the catalog functions."""
+    monkeypatch.syspath_prepend(CATALOG_DIR)
+    for key, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_REGION": "us-east-1",
+        "DEVICE_CATALOG_TABLE": TABLE_NAME,
+        "DEVICE_CACHE_TTL_SECONDS": "0",
+    }.items():
+        monkeypatch.setenv(key, value)
+
+    with mock_aws():
+        boto3.client("dynamodb", region_name="us-east-1").create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "catalog", "KeyType": "HASH"},
+                {"AttributeName": "thingName", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "catalog", "AttributeType": "S"},
+                {"AttributeName": "thingName", "AttributeType": "S"},
+                {"AttributeName": "thingTypeName", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[{
+                "IndexName": "byThingType",
+                "KeySchema": [
+                    {"AttributeName": "thingTypeName", "KeyType": "HASH"},
+                    {"AttributeName": "thingName", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield load_integration
+
+
+def _thing_event(operation, thing_name, timestamp, thing_type=None, **attributes):
+    return {
+        "eventType": "THING_EVENT",
+        "eventId": f"{thing_name}-{timestamp}",
+        "timestamp": timestamp,
+        "operation": operation,
+        "accountId": "123456789012",
+        "thingId": f"id-{thing_name}",
+        "thingName": thing_name,
+        "versionNumber": 1,
+        "thingTypeName": thing_type,
+        "attributes": attributes,
+    }
+
+
+def _list(devices, **query):
+    response = devices.lambda_handler(make_proxy_event(query=query), None)
+    assert response["statusCode"] == 200, response
+    return json.loads(response["body"])
+
+
+def test_registry_events_are_materialized(catalog_env):
+    ingest = catalog_env("ingest")
+    devices = catalog_env("devices")
+
+    ingest.lambda_handler(_thing_event("CREATED", "sensor-1", 1000, "Sensor", floor="1"), None)
+    ingest.lambda_handler(_thing_event("CREATED", "sensor-2", 1000, "Sensor"), None)
+    ingest.lambda_handler(_thing_event("CREATED", "gateway-1", 1000, "Gateway"), None)
+    ingest.lambda_handler(_thing_event("UPDATED", "sensor-1", 2000, "Sensor", floor="2"), None)
+    ingest.lambda_handler(_thing_event("DELETED", "sensor-2", 3000), None)
+
+    body = _list(devices)
+    assert [thing["thingName"] for thing in body["things"]] == ["gateway-1", "sensor-1"]
+    assert body["things"][1] == {
+        "thingName": "sensor-1",
+        "thingArn": "arn:aws:iot:us-east-1:123456789012:thing/sensor-1",
+        "thingTypeName": "Sensor",
+        "attributes": {"floor": "2"},
+        "version": 1,
+    }
+    assert [thing["thingName"] for thing in _list(devices, thingType="Sensor")["things"]] == ["sensor-1"]
+    assert [thing["thingName"] for thing in _list(devices, namePrefix="gate")["things"]] == ["gateway-1"]
+
+
+def test_out_of_order_events_do_not_overwrite_newer_state(catalog_env):
+    ingest = catalog_env("ingest")
+    devices = catalog_env("devices")
+
+    ingest.lambda_handler(_thing_event("UPDATED", "sensor-1", 2000, "Sensor", floor="2"), None)
+    ingest.lambda_handler(_thing_event("CREATED", "sensor-1", 1000, "Sensor", floor="1"), None)
+    ingest.lambda_handler(_thing_event("DELETED", "sensor-2", 3000), None)
+    ingest.lambda_handler(_thing_event("CREATED", "sensor-2", 1000), None)
+
+    things = _list(devices)["things"]
+    assert [(thing["thingName"], thing["attributes"]) for thing in things] == [("sensor-1", {"floor": "2"})]
+
+
+def test_catalog_pages_with_cursors(catalog_env):
+    ingest = catalog_env("ingest")
+    devices = catalog_env("devices")
+    for index in range(5):
+        ingest.lambda_handler(_thing_event("CREATED", f"thing-{index}", 1000), None)
+
+    names, cursor = [], None
+    while True:
+        query = {"maxResults": "2", **({"nextToken": cursor} if cursor else {})}
+        body = _list(devices, **query)
+        names.extend(thing["thingName"] for thing in body["things"])
+        cursor = body.get("nextToken")
+        if not cursor:
+            break
+
+    assert names == [f"thing-{index}" for index in range(5)]
+
+
+def test_backfill_copies_the_registry(catalog_env):
+    backfill = catalog_env("backfill")
+    devices = catalog_env("devices")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {
+            "things": [
+                {
+                    "thingName": "legacy-1",
+                    "thingArn": "arn:aws:iot:us-east-1:123456789012:thing/legacy-1",
+                    "attributes": {},
+                    "version": 3,
+                },
+            ],
+        })
+        assert backfill.lambda_handler({}, None) == {"written": 1, "skipped": 0}
+
+    assert [thing["version"] for thing in _list(devices)["things"]] == [3]
@@ -0,0 +1,159 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from awscrt import mqtt
+
+from tests.unit.conftest import DEVICE_CODE_DIR
+
+THING_NAME = "demo-thing"
+
+
+def _matches(topic_filter, topic):
+    filter_levels, topic_levels = topic_filter.split("/"), topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels) or level not in ("+", topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class LocalMqttConnection(mqtt.Connection):
+    """An in-process MQTT broker and connection, standing in for AWS IoT Core."""
+
+    def __init__(self):  # no native connection is created
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic, qos, callback=None):
+        with self._lock:
+            self._subscriptions.append((topic, callback))
+        return _done({"packet_id": 1, "topic": topic, "qos": qos}), 1
+
+    def unsubscribe(self, topic):
+        with self._lock:
+            self._subscriptions = [(f, c) for f, c in self._subscriptions if f != topic]
+        return _done({"packet_id": 1}), 1
+
+    def publish(self, topic, payload, qos, retain=False):
+        with self._lock:
+            callbacks = [callback for topic_filter, callback in self._subscriptions if _matches(topic_filter, topic)]
+        payload = payload.encode() if isinstance(payload, str) else payload
+        for callback in callbacks:
+            callback(topic=topic, payload=payload, dup=False, qos=qos, retain=retain)
+        return _done({"packet_id": 1}), 1
+
+
+class FakeJobsService:
+    """Answers the reserved Jobs topics of one thing from an in-memory queue."""
+
+    def __init__(self, connection, thing_name):
+        self.connection = connection
+        self.prefix = f"$aws/things/{thing_name}/jobs"
+        self.queue = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+        connection.subscribe(f"{self.prefix}/start-next", 1, self._on_start_next)
+        connection.subscribe(f"{self.prefix}/+/update", 1, self._on_update)
+
+    def _reply(self, topic, payload):
+        self.connection.publish(topic, json.dumps(payload), 1)
+
+    def enqueue(self, job_id, document, notify=False):
+        with self._lock:
+            self.queue.append({"jobId": job_id, "jobDocument": document})
+        if notify:
+            self._reply(f"{self.prefix}/notify-next", {"execution": {"jobId": job_id, "jobDocument": document}})
+
+    def _on_start_next(self, topic, payload, **kwargs):
+        with self._lock:
+            job = self.queue.pop(0) if self.queue else None
+        if job is None:
+            self._reply(f"{self.prefix}/start-next/accepted", {"timestamp": int(time.time())})
+            return
+        self.statuses[job["jobId"]] = "IN_PROGRESS"
+        execution = {**job, "status": "IN_PROGRESS", "versionNumber": 1, "executionNumber": 1}
+        self._reply(f"{self.prefix}/start-next/accepted", {"execution": execution, "timestamp": int(time.time())})
+
+    def _on_update(self, topic, payload, **kwargs):
+        job_id = topic.split("/")[-2]
+        request = json.loads(payload)
+        self.statuses[job_id] = (request["status"], request.get("statusDetails"))
+        self._reply(f"{self.prefix}/{job_id}/update/accepted", {"timestamp": int(time.time())})
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    sys.modules.pop("jobs", None)
+    import jobs
+    yield jobs
+    sys.modules.pop("jobs", None)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+def _reported(service, job_id):
+    return isinstance(service.statuses.get(job_id), tuple)
+
+
+def test_queued_jobs_run_in_order_and_report_status(jobs):
+    connection = LocalMqttConnection()
+    service = FakeJobsService(connection, THING_NAME)
+    downloaded = []
+
+    def download(document):
+        downloaded.append(document["s3Path"])
+        return {"localPath": "/tmp/a"}
+
+    service.enqueue("job-1", {"operation": "download", "s3Path": "s3://bucket/a"})
+    service.enqueue("job-2", {"operation": "reboot"})
+    jobs.JobRunner(connection, THING_NAME, {"download": download}).start()
+
+    _wait_for(lambda: _reported(service, "job-1") and _reported(service, "job-2"))
+    assert downloaded == ["s3://bucket/a"]
+    assert service.statuses["job-1"] == ("SUCCEEDED", {"localPath": "/tmp/a"})
+    assert service.statuses["job-2"][0] == "FAILED"
+    assert "Unsupported operation" in service.statuses["job-2"][1]["reason"]
+
+
+def test_failed_downloads_are_reported_as_failed(jobs):
+    connection = LocalMqttConnection()
+    service = FakeJobsService(connection, THING_NAME)
+
+    def download(document):
+        raise RuntimeError("Access Denied")
+
+    service.enqueue("job-1", {"operation": "download", "s3Path": "s3://bucket/a"})
+    jobs.JobRunner(connection, THING_NAME, {"download": download}).start()
+
+    _wait_for(lambda: _reported(service, "job-1"))
+    assert service.statuses["job-1"] == ("FAILED", {"reason": "Access Denied"})
+
+
+def test_jobs_queued_later_are_picked_up_from_notifications(jobs):
+    connection = LocalMqttConnection()
+    service = FakeJobsService(connection, THING_NAME)
+    jobs.JobRunner(connection, THING_NAME, {"download": lambda document: {}}).start()
+
+    service.enqueue("job-1", {"operation": "download", "s3Path": "s3://bucket/a"}, notify=True)
+
+    _wait_for(lambda: _reported(service, "job-1"))
+    assert service.statuses["job-1"][0] == "SUCCEEDED"
@@ -0,0 +1,185 @@
+import json
+
+from botocore.stub import Stubber
+
+from lambda_shared.clients import get_client
+from tests.unit.conftest import make_proxy_event
+
+
+def _things(*names):
+    return [{"thingName": name, "thingArn": f"arn:aws:iot:us-east-1:123456789012:thing/{name}"} for name in names]
+
+
+def test_first_page_returns_an_opaque_cursor(load_integration):
+    devices = load_integration("devices")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": _things("a", "b"), "nextToken": "iot-token"}, {"maxResults": 2})
+        response = devices.lambda_handler(make_proxy_event(query={"maxResults": "2"}), None)
+        stubber.assert_no_pending_responses()
+
+    body = json.loads(response["body"])
+    assert [thing["thingName"] for thing in body["things"]] == ["a", "b"]
+    assert body["nextToken"] != "iot-token"
+    assert devices.decode_cursor(body["nextToken"]) == "iot-token"
+
+
+def test_cursor_resumes_listing(load_integration):
+    devices = load_integration("devices")
+    cursor = devices.encode_cursor("iot-token")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response(
+            "list_things", {"things": _things("c")}, {"maxResults": 100, "nextToken": "iot-token"}
+        )
+        response = devices.lambda_handler(make_proxy_event(query={"nextToken": cursor}), None)
+        stubber.assert_no_pending_responses()
+
+    body = json.loads(response["body"])
+    assert [thing["thingName"] for thing in body["things"]] == ["c"]
+    assert "nextToken" not in body
+
+
+def test_all_pages_stops_at_the_response_size_limit(load_integration):
+    devices = load_integration("devices", MAX_RESPONSE_BYTES="400")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": _things("a", "b"), "nextToken": "t1"})
+        stubber.add_response("list_things", {"things": _things("c", "d"), "nextToken": "t2"})
+        response = devices.lambda_handler(make_proxy_event(query={"all": "true", "maxResults": "2"}), None)
+        stubber.assert_no_pending_responses()
+
+    body = json.loads(response["body"])
+    assert [thing["thingName"] for thing in body["things"]] == ["a", "b", "c", "d"]
+    assert devices.decode_cursor(body["nextToken"]) == "t2"
+
+
+def test_all_pages_lists_the_whole_fleet(load_integration):
+    devices = load_integration("devices")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": _things("a"), "nextToken": "t1"})
+        stubber.add_response("list_things", {"things": _things("b")})
+        response = devices.lambda_handler(make_proxy_event(query={"all": "true"}), None)
+
+    body = json.loads(response["body"])
+    assert [thing["thingName"] for thing in body["things"]] == ["a", "b"]
+    assert "nextToken" not in body
+
+
+def test_invalid_parameters_are_rejected(load_integration):
+    devices = load_integration("devices")
+
+    for query in ({"maxResults": "0"}, {"maxResults": "many"}, {"nextToken": "not-a-cursor"}):
+        response = devices.lambda_handler(make_proxy_event(query=query), None)
+        assert response["statusCode"] == 400, query
+
+
+def test_device_list_is_cached_with_an_etag(load_integration):
+    devices = load_integration("devices")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": _things("a")})
+        first = devices.lambda_handler(make_proxy_event(), None)
+        second = devices.lambda_handler(make_proxy_event(), None)
+        stubber.assert_no_pending_responses()
+
+    assert first["body"] == second["body"]
+    assert first["headers"]["ETag"] == second["headers"]["ETag"]
+    assert first["headers"]["ETag"].startswith('"')
+
+
+def test_matching_if_none_match_returns_not_modified(load_integration):
+    devices = load_integration("devices")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": _things("a")})
+        etag = devices.lambda_handler(make_proxy_event(), None)["headers"]["ETag"]
+        not_modified = devices.lambda_handler(make_proxy_event(headers={"if-none-match": f'"other", W/{etag}'}), None)
+        modified = devices.lambda_handler(make_proxy_event(headers={"If-None-Match": '"other"'}), None)
+
+    assert not_modified["statusCode"] == 304
+    assert not_modified["body"] == ""
+    assert modified["statusCode"] == 200
+
+
+def test_expired_entries_are_reloaded(load_integration):
+    devices = load_integration("devices", DEVICE_CACHE_TTL_SECONDS="0")
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": _things("a")})
+        stubber.add_response("list_things", {"things": _things("a", "b")})
+        first = devices.lambda_handler(make_proxy_event(), None)
+        second = devices.lambda_handler(make_proxy_event(), None)
+        stubber.assert_no_pending_responses()
+
+    assert first["headers"]["ETag"] != second["headers"]["ETag"]
+
+
+def test_search_parameters_build_a_fleet_index_query(load_integration):
+    devices = load_integration("devices")
+
+    query = devices.build_search_query({
+        "namePrefix": "sensor-",
+        "thingType": "Gateway",
+        "attributes": "floor=2,site=lab",
+        "connectivity": "connected",
+    })
+
+    assert query == (
+        "thingName:sensor-* AND thingTypeName:Gateway AND attributes.floor:2 AND "
+        "attributes.site:lab AND connectivity.connected:true"
+    )
+    assert devices.build_search_query({"maxResults": "10"}) is None
+
+
+def test_search_returns_only_requested_fields(load_integration):
+    devices = load_integration("devices")
+    thing = {
+        "thingName": "sensor-1",
+        "thingId": "id-1",
+        "thingTypeName": "Sensor",
+        "attributes": {"floor": "2"},
+        "connectivity": {"connected": True, "timestamp": 1},
+    }
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response(
+            "search_index",
+            {"things": [thing], "nextToken": "search-token"},
+            {"indexName": "AWS_Things", "queryString": "thingName:sensor-*", "maxResults": 100},
+        )
+        response = devices.lambda_handler(
+            make_proxy_event(query={"namePrefix": "sensor-", "fields": "thingName,connectivity"}), None
+        )
+        stubber.assert_no_pending_responses()
+
+    body = json.loads(response["body"])
+    assert body["things"] == [{"connectivity": {"connected": True, "timestamp": 1}, "thingName": "sensor-1"}]
+    assert devices.decode_cursor(body["nextToken"]) == "search-token"
+
+
+def test_search_terms_cannot_inject_query_syntax(load_integration):
+    devices = load_integration("devices")
+
+    for query in (
+        {"namePrefix": "a* OR thingName:b"},
+        {"attributes": "floor"},
+        {"attributes": "floor=2:3"},
+        {"connectivity": "maybe"},
+        {"namePrefix": "a", "fields": "password"},
+    ):
+        response = devices.lambda_handler(make_proxy_event(query=query), None)
+        assert response["statusCode"] == 400, query
+
+
+def test_listing_returns_a_compact_sparse_fieldset(load_integration):
+    devices = load_integration("devices")
+    thing = {**_things("a")[0], "thingTypeName": "Sensor", "attributes": {"floor": "2"}, "version": 4}
+
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("list_things", {"things": [thing]})
+        response = devices.lambda_handler(make_proxy_event(query={"fields": "thingName,attributes"}), None)
+
+    assert response["body"] == '{"message":"Successfully retrieved IoT things","things":[{"attributes":{"floor":"2"},"thingName":"a"}]}'
+    assert response["headers"]["Content-Type"] == "application/json"
@@ -0,0 +1,317 @@
+import json
+import sys
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.unit.conftest import DEVICE_CODE_DIR, make_proxy_event
+
+TOPIC = "devices/download"
+
+
+class _FakeIotData:
+    """Records publishes, failing those addressed to the given things."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def publish(self, topic, qos, payload):
+        message = json.loads(payload)
+        with self._lock:
+            if message["device"] in self.failing:
+                raise RuntimeError("Rate exceeded")
+            self.messages.append((topic, qos, message))
+
+
+@pytest.fixture
+def download(load_integration):
+    return load_integration("download", IOT_TOPIC=TOPIC, IOT_THING_NAME="demo-thing", PUBLISH_CONCURRENCY="4")
+
+
+@pytest.fixture
+def queued_download(load_integration, monkeypatch):
+    """Load the download function with a publish queue in a mocked account."""
+    for key, value in {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}.items():
+        monkeypatch.setenv(key, value)
+    with mock_aws():
+        sqs = boto3.client("sqs", region_name="us-east-1")
+        queue_url = sqs.create_queue(QueueName="publish")["QueueUrl"]
+        module = load_integration(
+            "download", IOT_TOPIC=TOPIC, IOT_THING_NAME="demo-thing", PUBLISH_QUEUE_URL=queue_url, PUBLISH_CONCURRENCY="4"
+        )
+        monkeypatch.setattr(module, "get_iot_data_client", lambda: pytest.fail("published inline"))
+        yield module, sqs, queue_url
+
+
+def _queued_messages(sqs, queue_url):
+    messages = []
+    while True:
+        received = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages", [])
+        if not received:
+            return messages
+        messages.extend(json.loads(message["Body"]) for message in received)
+
+
+def _batch_event(body):
+    event = make_proxy_event(body=json.dumps(body))
+    event["resource"] = "/download/batch"
+    return event
+
+
+def test_batch_publishes_every_target(download, monkeypatch):
+    client = _FakeIotData()
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+    things = [f"thing-{index}" for index in range(10)]
+
+    response = download.lambda_handler(_batch_event({"s3Paths": ["s3://bucket/a", "s3://bucket/b"], "things": things}), None)
+
+    assert response["statusCode"] == 200
+    results = json.loads(response["body"])["results"]
+    assert [(result["thing"], result["s3Path"]) for result in results] == [
+        (thing, s3_path) for thing in things for s3_path in ("s3://bucket/a", "s3://bucket/b")
+    ]
+    assert {result["status"] for result in results} == {"published"}
+    assert len(client.messages) == 20
+    assert all((topic, qos) == (f"{TOPIC}/{message['device']}", 1) for topic, qos, message in client.messages)
+
+
+def test_devices_only_download_their_own_targets(download, monkeypatch):
+    client = _FakeIotData()
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+    download.lambda_handler(_batch_event({"s3Paths": ["s3://bucket/a"], "things": ["thing-1", "thing-2"]}), None)
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    sys.modules.pop("local_subscribe", None)
+    import local_subscribe
+    submitted = []
+
+    class _Pool:
+        def submit(self, key, message, local_path, priority=0):
+            submitted.append((local_subscribe.THING_NAME, message["device"]))
+            return True
+
+    monkeypatch.setattr(local_subscribe, "download_pool", _Pool())
+    for thing in ("thing-1", "thing-2"):
+        monkeypatch.setattr(local_subscribe, "THING_NAME", thing)
+        # The broker delivers the messages of the device's topic; a message for another device is ignored
+        for topic, _, message in client.messages:
+            if topic == f"{TOPIC}/{thing}":
+                local_subscribe.on_message_received(topic, json.dumps(message).encode(), False, 1, False)
+        local_subscribe.on_message_received(f"{TOPIC}/{thing}", json.dumps({**message, "device": "other"}).encode(),
+                                            False, 1, False)
+    sys.modules.pop("local_subscribe", None)
+
+    assert submitted == [("thing-1", "thing-1"), ("thing-2", "thing-2")]
+
+
+def test_batch_reports_failed_targets(download, monkeypatch):
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: _FakeIotData(failing={"thing-2"}))
+
+    response = download.lambda_handler(_batch_event({"s3Paths": ["s3://bucket/a"], "things": ["thing-1", "thing-2"]}), None)
+
+    assert response["statusCode"] == 207
+    results = json.loads(response["body"])["results"]
+    assert [result["status"] for result in results] == ["published", "failed"]
+    assert results[1]["error"] == "Rate exceeded"
+
+
+@pytest.mark.parametrize("body", [
+    {"s3Paths": ["s3://bucket/a"]},
+    {"s3Paths": [], "things": ["thing-1"]},
+    {"s3Paths": ["https://example.com/a"], "things": ["thing-1"]},
+    {"s3Paths": ["s3://bucket/a"], "things": ["thing/../1"]},
+    {"s3Paths": [f"s3://bucket/{index}" for index in range(40)], "things": [f"t{index}" for index in range(30)]},
+])
+def test_invalid_batches_are_rejected(download, monkeypatch, body):
+    client = _FakeIotData()
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+
+    response = download.lambda_handler(_batch_event(body), None)
+
+    assert response["statusCode"] == 400
+    assert client.messages == []
+
+
+def test_single_download_still_targets_the_configured_thing(download, monkeypatch):
+    client = _FakeIotData()
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+
+    response = download.lambda_handler(make_proxy_event(query={"s3Path": "s3://bucket/a"}), None)
+
+    assert response["statusCode"] == 200
+    ((_, _, message),) = client.messages
+    assert message["device"] == "demo-thing"
+    assert message["s3Path"] == "s3://bucket/a"
+
+
+def test_single_download_is_queued(queued_download):
+    download, sqs, queue_url = queued_download
+
+    response = download.lambda_handler(make_proxy_event(query={"s3Path": "s3://bucket/a"}), None)
+
+    assert response["statusCode"] == 202
+    (message,) = _queued_messages(sqs, queue_url)
+    assert message == json.loads(response["body"])["data"]
+    assert (message["device"], message["s3Path"]) == ("demo-thing", "s3://bucket/a")
+
+
+def test_batch_is_queued_ten_messages_per_request(queued_download):
+    download, sqs, queue_url = queued_download
+    things = [f"thing-{index}" for index in range(25)]
+
+    response = download.lambda_handler(_batch_event({"s3Paths": ["s3://bucket/a"], "things": things}), None)
+
+    assert response["statusCode"] == 202
+    results = json.loads(response["body"])["results"]
+    assert [result["thing"] for result in results] == things
+    assert {result["status"] for result in results} == {"queued"}
+    assert sorted(message["device"] for message in _queued_messages(sqs, queue_url)) == sorted(things)
+
+
+def test_repeated_downloads_replay_the_first_response(download, monkeypatch):
+    client = _FakeIotData()
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+    event = make_proxy_event(authorizer_context={"principalId": "user-1"}, query={"s3Path": "s3://bucket/a"})
+
+    first = download.lambda_handler(event, None)
+    repeated = download.lambda_handler(event, None)
+    other_user = download.lambda_handler(
+        make_proxy_event(authorizer_context={"principalId": "user-2"}, query={"s3Path": "s3://bucket/a"}), None
+    )
+
+    assert len(client.messages) == 2
+    assert repeated["body"] == first["body"]
+    assert repeated["headers"]["Idempotent-Replayed"] == "true"
+    assert "headers" not in other_user
+
+
+def test_idempotency_key_header_overrides_derived_key(download, monkeypatch):
+    client = _FakeIotData()
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+    things = ["thing-1", "thing-2"]
+
+    for s3_path in ("s3://bucket/a", "s3://bucket/b"):
+        event = _batch_event({"s3Paths": [s3_path], "things": things})
+        event["headers"] = {"Idempotency-Key": "retry-1"}
+        download.lambda_handler(event, None)
+
+    assert [message["s3Path"] for _, _, message in client.messages] == ["s3://bucket/a"] * 2
+
+
+def test_failed_batches_can_be_retried(download, monkeypatch):
+    client = _FakeIotData(failing={"thing-2"})
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: client)
+    event = _batch_event({"s3Paths": ["s3://bucket/a"], "things": ["thing-1", "thing-2"]})
+
+    assert download.lambda_handler(event, None)["statusCode"] == 207
+    client.failing.clear()
+    assert download.lambda_handler(event, None)["statusCode"] == 200
+
+
+def test_duplicates_of_a_running_request_are_rejected(download, monkeypatch):
+    event = make_proxy_event(query={"s3Path": "s3://bucket/a"})
+    key = download.idempotency_key(event, [("demo-thing", "s3://bucket/a")])
+    download._local_idempotency_store.claim(key, 60)
+    monkeypatch.setattr(download, "get_iot_data_client", lambda: pytest.fail("published a duplicate"))
+
+    assert download.lambda_handler(event, None)["statusCode"] == 409
+
+
+@pytest.fixture
+def presigned_download(load_integration, monkeypatch):
+    """Load the download function with a device bucket in a mocked account."""
+    for key, value in {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}.items():
+        monkeypatch.setenv(key, value)
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="device-bucket")
+        s3.put_object(Bucket="device-bucket", Key="firmware/a.bin", Body=b"a" * 1024)
+        module = load_integration(
+            "download", IOT_TOPIC=TOPIC, IOT_THING_NAME="demo-thing", PRESIGN_BUCKET="device-bucket"
+        )
+        client = _FakeIotData()
+        monkeypatch.setattr(module, "get_iot_data_client", lambda: client)
+        yield module, client
+
+
+def test_messages_carry_a_presigned_url(presigned_download):
+    download, client = presigned_download
+
+    response = download.lambda_handler(make_proxy_event(query={"s3Path": "s3://device-bucket/firmware/a.bin"}), None)
+
+    assert response["statusCode"] == 200
+    ((_, _, message),) = client.messages
+    assert message["url"].startswith("https://device-bucket.s3.amazonaws.com/firmware/a.bin?")
+    assert "X-Amz-Signature=" in message["url"]
+    assert message["size"] == 1024
+    assert message["etag"].startswith('"')
+    assert "expiresAt" in message
+
+
+def test_batches_presign_each_object_once(presigned_download, monkeypatch):
+    download, client = presigned_download
+    described = []
+    describe_object = download.describe_object
+    monkeypatch.setattr(download, "describe_object", lambda *args: described.append(args[1]) or describe_object(*args))
+
+    download.lambda_handler(_batch_event({
+        "s3Paths": ["s3://device-bucket/firmware/a.bin", "s3://other-bucket/b.bin"],
+        "things": ["thing-1", "thing-2", "thing-3"],
+    }), None)
+
+    assert sorted(described) == ["s3://device-bucket/firmware/a.bin", "s3://other-bucket/b.bin"]
+    presigned = {message["s3Path"] for _, _, message in client.messages if "url" in message}
+    # Objects outside the device bucket are left to the device's own credentials
+    assert presigned == {"s3://device-bucket/firmware/a.bin"}
+    assert len(client.messages) == 6
+
+
+def test_messages_carry_the_object_manifest(presigned_download):
+    download, client = presigned_download
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.put_bucket_versioning(Bucket="device-bucket", VersioningConfiguration={"Status": "Enabled"})
+    version_id = s3.put_object(
+        Bucket="device-bucket", Key="firmware/b.bin", Body=b"abc", ChecksumAlgorithm="SHA256"
+    )["VersionId"]
+
+    download.lambda_handler(make_proxy_event(query={"s3Path": "s3://device-bucket/firmware/b.bin"}), None)
+
+    ((_, _, message),) = client.messages
+    assert message["size"] == 3
+    assert message["versionId"] == version_id
+    assert f"versionId={version_id}" in message["url"]
+    assert message["checksum"] == {"algorithm": "SHA256", "value": "ungWv48Bz+pBQUDeXa4iI7ADYaOWF3qctBD/YfIAFa0="}
+
+
+def test_overwritten_objects_are_published_again(presigned_download):
+    download, client = presigned_download
+    s3 = boto3.client("s3", region_name="us-east-1")
+    event = make_proxy_event(query={"s3Path": "s3://device-bucket/firmware/a.bin"})
+
+    first = download.lambda_handler(event, None)
+    s3.put_object(Bucket="device-bucket", Key="firmware/a.bin", Body=b"b" * 2048)
+    second = download.lambda_handler(event, None)
+    repeated = download.lambda_handler(event, None)
+
+    assert "headers" not in second
+    assert repeated["headers"]["Idempotent-Replayed"] == "true"
+    assert [message["size"] for _, _, message in client.messages] == [1024, 2048]
+    assert json.loads(second["body"])["data"]["etag"] != json.loads(first["body"])["data"]["etag"]
+
+
+def test_missing_objects_are_rejected_before_publishing(presigned_download):
+    download, client = presigned_download
+
+    single = download.lambda_handler(make_proxy_event(query={"s3Path": "s3://device-bucket/missing.bin"}), None)
+    batch = download.lambda_handler(_batch_event({
+        "s3Paths": ["s3://device-bucket/firmware/a.bin", "s3://device-bucket/missing.bin"],
+        "things": ["thing-1"],
+    }), None)
+
+    assert single["statusCode"] == 404
+    assert batch["statusCode"] == 404
+    assert "s3://device-bucket/missing.bin" in json.loads(batch["body"])["error"]
+    assert client.messages == []
@@ -0,0 +1,169 @@
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+from tests.unit.conftest import DEVICE_CODE_DIR
+
+
+@pytest.fixture
+def download_pool(monkeypatch):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    sys.modules.pop("download_pool", None)
+    import download_pool
+    yield download_pool
+    sys.modules.pop("download_pool", None)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+class _Downloads:
+    """Downloads that run until released, recording their order and concurrency."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, name):
+        with self._lock:
+            self.started.append(name)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+
+
+def test_concurrency_is_bounded_by_the_worker_count(download_pool):
+    downloads = _Downloads()
+    pool = download_pool.DownloadPool(downloads, workers=3, max_queued=100)
+
+    for index in range(20):
+        pool.submit(f"file-{index}", f"file-{index}")
+    _wait_for(lambda: pool.stats()["inFlight"] == 3)
+    assert pool.stats()["queued"] == 17
+
+    downloads.release.set()
+    pool.shutdown()
+    assert downloads.max_running == 3
+    assert pool.stats() == {
+        "queued": 0, "inFlight": 0, "completed": 20, "failed": 0, "rejected": 0, "evicted": 0, "duplicates": 0,
+    }
+
+
+def test_higher_priorities_run_first(download_pool):
+    downloads = _Downloads()
+    pool = download_pool.DownloadPool(downloads, workers=1)
+    pool.submit("blocker", "blocker")
+    _wait_for(lambda: pool.stats()["inFlight"] == 1)
+
+    pool.submit("low-1", "low-1", priority=0)
+    pool.submit("high", "high", priority=10)
+    pool.submit("low-2", "low-2", priority=0)
+    pool.submit("mid", "mid", priority=5)
+    downloads.release.set()
+    pool.shutdown()
+
+    assert downloads.started == ["blocker", "high", "mid", "low-1", "low-2"]
+
+
+def test_full_queue_rejects_or_evicts(download_pool):
+    downloads = _Downloads()
+    rejecting = download_pool.DownloadPool(downloads, workers=1, max_queued=1, overflow=download_pool.REJECT)
+    evicting = download_pool.DownloadPool(downloads, workers=1, max_queued=1, overflow=download_pool.DROP_LOWEST)
+    for pool in (rejecting, evicting):
+        pool.submit("blocker", "blocker")
+        _wait_for(lambda: pool.stats()["inFlight"] == 1)
+        assert pool.submit("queued", "queued")
+
+    assert not rejecting.submit("urgent", "urgent", priority=10)
+    assert evicting.submit("urgent", "urgent", priority=10)
+    assert not evicting.submit("routine", "routine")
+
+    downloads.release.set()
+    for pool in (rejecting, evicting):
+        pool.shutdown()
+    assert rejecting.stats()["rejected"] == 1
+    assert evicting.stats()["evicted"] == 1
+    assert evicting.stats()["rejected"] == 1
+    assert sorted(downloads.started) == ["blocker", "blocker", "queued", "urgent"]
+
+
+@pytest.mark.parametrize("overflow", ["reject", "drop-lowest"])
+def test_submit_never_waits_for_room(download_pool, overflow):
+    downloads = _Downloads()
+    pool = download_pool.DownloadPool(downloads, workers=1, max_queued=1, overflow=overflow)
+    pool.submit("blocker", "blocker")
+    _wait_for(lambda: pool.stats()["inFlight"] == 1)
+    pool.submit("queued", "queued")
+
+    # Submissions come from the MQTT client's event loop thread, which must never stall
+    submitter = threading.Thread(target=pool.submit, args=("waiting", "waiting"))
+    submitter.start()
+    submitter.join(1)
+    assert not submitter.is_alive()
+
+    downloads.release.set()
+    pool.shutdown()
+    assert downloads.started == ["blocker", "queued"]
+
+
+def test_blocking_overflow_is_not_accepted(download_pool):
+    with pytest.raises(ValueError, match="overflow"):
+        download_pool.DownloadPool(lambda: None, overflow="block")
+
+
+def test_duplicates_and_failures_are_counted(download_pool):
+    downloads = _Downloads()
+    outcomes = {"ok": None, "failed": False, "raised": RuntimeError("Access Denied")}
+
+    def download(name):
+        downloads(name)
+        if isinstance(outcomes[name], Exception):
+            raise outcomes[name]
+        return outcomes[name]
+
+    pool = download_pool.DownloadPool(download, workers=1)
+    for name in ("ok", "ok", "failed", "raised"):
+        pool.submit(name, name)
+    downloads.release.set()
+    pool.shutdown()
+
+    stats = pool.stats()
+    assert (stats["completed"], stats["failed"], stats["duplicates"]) == (1, 2, 1)
+
+
+def test_messages_are_queued_with_their_priority(monkeypatch):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    sys.modules.pop("local_subscribe", None)
+    import local_subscribe
+    submitted = []
+
+    class _Pool:
+        def submit(self, key, *args, priority=0):
+            submitted.append((key, priority))
+            return True
+
+    monkeypatch.setattr(local_subscribe, "download_pool", _Pool())
+    monkeypatch.setattr(local_subscribe, "THING_NAME", "thing-1")
+    for priority in (7, "high"):
+        message = {"device": "thing-1", "timestamp": "2026-01-02 03:04:05Z", "s3Path": "s3://bucket/a.bin", "priority": priority}
+        local_subscribe.on_message_received("topic", json.dumps(message).encode(), False, 1, False)
+    sys.modules.pop("local_subscribe", None)
+
+    assert submitted == [
+        ("/home/ec2-user/downloads/thing-1/2026-01-02/a.bin", 7),
+        ("/home/ec2-user/downloads/thing-1/2026-01-02/a.bin", 0),
+    ]
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tests.unit.conftest import DEVICE_CODE_DIR
+
+CONTENT = bytes(range(256)) * 64
+ETAG = f'"{hashlib.md5(CONTENT).hexdigest()}"'
+
+
+class _ObjectHandler(BaseHTTPRequestHandler):
+    """Serves CONTENT the way S3 serves a presigned GET, including Range and If-Match."""
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get("If-Match") not in (None, ETAG):
+            self.send_response(412)
+            self.end_headers()
+            return
+        body, status = CONTENT, 200
+        if self.headers.get("Range"):
+            start, _, end = self.headers["Range"].removeprefix("bytes=").partition("-")
+            body, status = CONTENT[int(start):int(end) + 1 if end else None], 206
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def object_url():
+    _ObjectHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ObjectHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/firmware.bin?X-Amz-Signature=test"
+    server.shutdown()
+
+
+@pytest.fixture
+def http_download(monkeypatch):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    for module_name in ("http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+    import http_download
+    yield http_download
+    for module_name in ("http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+
+
+def test_downloads_the_whole_object(http_download, object_url, tmp_path):
+    local_path = tmp_path / "downloads" / "firmware.bin"
+
+    http_download.download_url(object_url, str(local_path), size=len(CONTENT), etag=ETAG)
+
+    assert local_path.read_bytes() == CONTENT
+    assert not (tmp_path / "downloads" / "firmware.bin.part").exists()
+    assert _ObjectHandler.requests[0]["If-Match"] == ETAG
+
+
+def test_resumes_a_partial_download(http_download, object_url, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    (tmp_path / "firmware.bin.part").write_bytes(CONTENT[:5000])
+
+    http_download.download_url(object_url, str(local_path), size=len(CONTENT), etag=ETAG)
+
+    assert local_path.read_bytes() == CONTENT
+    assert _ObjectHandler.requests[0]["Range"] == f"bytes=5000-{len(CONTENT) - 1}"
+
+
+def test_downloads_parts_in_parallel(http_download, object_url, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+
+    http_download.download_url(object_url, str(local_path), size=len(CONTENT), etag=ETAG,
+                               part_size=4096, concurrency=4)
+
+    assert local_path.read_bytes() == CONTENT
+    assert sorted(request["Range"] for request in _ObjectHandler.requests) == [
+        "bytes=0-4095", "bytes=12288-16383", "bytes=4096-8191", "bytes=8192-12287"
+    ]
+    assert not (tmp_path / "firmware.bin.part.json").exists()
+
+
+def test_streams_objects_of_unknown_size(http_download, object_url, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    (tmp_path / "firmware.bin.part").write_bytes(CONTENT[:5000])
+
+    http_download.download_url(object_url, str(local_path))
+
+    assert local_path.read_bytes() == CONTENT
+    assert _ObjectHandler.requests[0]["Range"] == "bytes=5000-"
+
+
+def test_streamed_downloads_are_verified(http_download, object_url, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    (tmp_path / "firmware.bin.part").write_bytes(CONTENT[:5000])
+    sha256 = {"algorithm": "SHA256", "value": base64.b64encode(hashlib.sha256(CONTENT).digest()).decode("ascii")}
+
+    http_download.download_url(object_url, str(local_path), checksum=sha256)
+    assert local_path.read_bytes() == CONTENT
+
+    local_path.unlink()
+    with pytest.raises(http_download.ChecksumMismatchError):
+        http_download.download_url(object_url, str(local_path), checksum={**sha256, "value": "AAAAAA=="})
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_changed_objects_are_not_mixed(http_download, object_url, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    (tmp_path / "firmware.bin.part").write_bytes(CONTENT[:5000])
+
+    with pytest.raises(RuntimeError, match="412"):
+        http_download.download_url(object_url, str(local_path), size=len(CONTENT), etag='"older-version"')
+
+    assert not local_path.exists()
+    assert not (tmp_path / "firmware.bin.part").exists()
+    assert not (tmp_path / "firmware.bin.part.json").exists()
+
+
+def test_incomplete_downloads_are_not_kept(http_download, object_url, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+
+    with pytest.raises(RuntimeError, match="bytes"):
+        http_download.download_url(object_url, str(local_path), size=len(CONTENT) + 1)
+
+    assert not local_path.exists()
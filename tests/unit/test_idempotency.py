@@ -0,0 +1,64 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from lambda_shared.idempotency import (
+    COMPLETED,
+    IN_PROGRESS,
+    DynamoDbIdempotencyStore,
+    LocalIdempotencyStore,
+    make_key,
+)
+
+TABLE_NAME = "Idempotency"
+
+
+@pytest.fixture
+def dynamodb_store(monkeypatch):
+    for key, value in {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}.items():
+        monkeypatch.setenv(key, value)
+    with mock_aws():
+        dynamodb = boto3.client("dynamodb", region_name="us-east-1")
+        dynamodb.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{"AttributeName": "idempotencyKey", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "idempotencyKey", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield DynamoDbIdempotencyStore(dynamodb, TABLE_NAME)
+
+
+@pytest.fixture(params=["dynamodb", "local"])
+def store(request):
+    if request.param == "local":
+        return LocalIdempotencyStore()
+    return request.getfixturevalue("dynamodb_store")
+
+
+def test_first_claim_wins_and_duplicates_see_it_in_progress(store):
+    assert store.claim("key", 60) is None
+    assert store.claim("key", 60) == {"status": IN_PROGRESS, "response": None}
+
+
+def test_completed_requests_are_replayed(store):
+    response = {"statusCode": 202, "body": "{}"}
+    store.claim("key", 60)
+    store.complete("key", response, 300)
+
+    assert store.claim("key", 60) == {"status": COMPLETED, "response": response}
+
+
+def test_released_and_expired_claims_can_be_claimed_again(store):
+    store.claim("released", 60)
+    store.release("released")
+    store.claim("expired", -1)
+
+    assert store.claim("released", 60) is None
+    assert store.claim("expired", 60) is None
+
+
+def test_derived_keys_ignore_target_order():
+    targets = [("thing-1", "s3://bucket/a"), ("thing-2", "s3://bucket/a")]
+
+    assert make_key("user", sorted(targets)) == make_key("user", sorted(reversed(targets)))
+    assert make_key("user", sorted(targets)) != make_key("other-user", sorted(targets))
@@ -0,0 +1,83 @@
+import base64
+import json
+import sys
+
+import pytest
+from botocore.stub import Stubber
+
+from tests.unit.conftest import make_authorizer_event, make_token
+
+
+def _effect(response):
+    return response["policyDocument"]["Statement"][0]["Effect"]
+
+
+def _tamper(token):
+    header, payload, signature = token.split(".")
+    forged = make_token(groups=("manager",), sub="someone-else").split(".")[1]
+    return ".".join([header, forged, signature])
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "not-a-jwt",
+        make_token(exp_in=-60),
+        make_token(aud="another-client"),
+        make_token(iss="https://cognito-idp.us-east-1.amazonaws.com/us-east-1_Other"),
+        make_token(token_use="access"),
+        _tamper(make_token(groups=())),
+        make_token(exp="tomorrow"),
+        make_token(exp=None),
+    ],
+    ids=["malformed", "expired", "audience", "issuer", "token-use", "forged", "text-exp", "null-exp"],
+)
+def test_invalid_tokens_are_denied_without_calling_avp(authorizer, token):
+    with Stubber(authorizer.verifiedpermissions) as stubber:
+        response = authorizer.lambda_handler(make_authorizer_event(token), None)
+        stubber.assert_no_pending_responses()
+
+    assert _effect(response) == "Deny"
+    assert response["principalId"] == ""
+
+
+def test_unsigned_tokens_are_rejected(authorizer):
+    _, payload, _ = make_token().split(".")
+    unsigned_header = base64.urlsafe_b64encode(b'{"alg": "none"}').rstrip(b"=").decode()
+
+    with pytest.raises(sys.modules["jwt_verifier"].InvalidTokenError, match="algorithm"):
+        authorizer.jwt_verifier.verify(f"{unsigned_header}.{payload}.")
+
+
+def test_jwks_is_fetched_once_and_refreshed_for_unknown_kids(authorizer, jwks_url, tmp_path):
+    verifier = authorizer.jwt_verifier
+    claims = verifier.verify(make_token())
+    assert claims["sub"] == "user-1"
+
+    # A rotated key only becomes known after the JWKS is fetched again
+    jwks_path = tmp_path / "jwks.json"
+    jwks = json.loads(jwks_path.read_text())
+    jwks["keys"].append({**jwks["keys"][0], "kid": "rotated-key"})
+    jwks_path.write_text(json.dumps(jwks))
+
+    verifier._fetched_at -= 3600
+    assert verifier.verify(make_token(kid="rotated-key"))["sub"] == "user-1"
+
+    # Unknown kids do not trigger another fetch within the refresh interval
+    jwks_path.unlink()
+    with pytest.raises(sys.modules["jwt_verifier"].InvalidTokenError, match="Unknown signing key"):
+        verifier.verify(make_token(kid="made-up-key"))
+
+
+def test_failed_jwks_fetches_are_retried(authorizer, tmp_path):
+    jwks_path = tmp_path / "jwks.json"
+    jwks = jwks_path.read_text()
+    jwks_path.unlink()
+    event = make_authorizer_event(make_token())
+
+    # Without keys the authorizer cannot decide, so it fails rather than caching a deny
+    with pytest.raises(OSError):
+        authorizer.lambda_handler(event, None)
+
+    jwks_path.write_text(jwks)
+    assert authorizer.jwt_verifier.verify(make_token())["sub"] == "user-1"
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+from avp_iot_demo.policy_store.policy_store_construct import AvpPolicyStore
+from tests.unit.conftest import ROOT_DIR, USER_POOL_ID, make_authorizer_event, make_token
+
+pytest.importorskip("cedarpy")
+
+SCHEMA_PATH = os.path.join(ROOT_DIR, "avp_iot_demo", "policy_store", "cedarschema.json")
+
+# Decisions returned by Verified Permissions for the policies in AvpPolicyStore
+REMOTE_DECISIONS = [
+    (("manager",), "GET", "/devices", "ALLOW"),
+    (("manager",), "POST", "/download", "ALLOW"),
+    (("operator",), "GET", "/devices", "ALLOW"),
+    (("operator",), "POST", "/download", "DENY"),
+    ((), "GET", "/devices", "DENY"),
+    ((), "POST", "/download", "DENY"),
+    (("manager",), "POST", "/download/batch", "ALLOW"),
+    (("operator",), "POST", "/download/batch", "DENY"),
+    ((), "POST", "/download/batch", "DENY"),
+    (("manager",), "POST", "/rollout", "ALLOW"),
+    (("operator",), "POST", "/rollout", "DENY"),
+    ((), "POST", "/rollout", "DENY"),
+]
+
+
+def _stub_policy_store(stubber):
+    statements = AvpPolicyStore.policy_statements(USER_POOL_ID)
+    stubber.add_response(
+        "list_policies",
+        {
+            "policies": [
+                {
+                    "policyStoreId": "ps-test",
+                    "policyId": name,
+                    "policyType": "STATIC",
+                    "definition": {"static": {}},
+                    "createdDate": "2025-01-01T00:00:00Z",
+                    "lastUpdatedDate": "2025-01-01T00:00:00Z",
+                }
+                for name in statements
+            ]
+        },
+    )
+    for name, statement in statements.items():
+        stubber.add_response(
+            "get_policy",
+            {
+                "policyStoreId": "ps-test",
+                "policyId": name,
+                "policyType": "STATIC",
+                "definition": {"static": {"statement": statement}},
+                "createdDate": "2025-01-01T00:00:00Z",
+                "lastUpdatedDate": "2025-01-01T00:00:00Z",
+            },
+            {"policyStoreId": "ps-test", "policyId": name},
+        )
+    with open(SCHEMA_PATH) as f:
+        stubber.add_response(
+            "get_schema",
+            {
+                "policyStoreId": "ps-test",
+                "schema": f.read(),
+                "createdDate": "2025-01-01T00:00:00Z",
+                "lastUpdatedDate": "2025-01-01T00:00:00Z",
+            },
+        )
+
+
+@pytest.mark.parametrize("groups,method,path,remote_decision", REMOTE_DECISIONS)
+def test_local_decisions_match_remote_decisions(load_authorizer, groups, method, path, remote_decision):
+    token = make_token(sub="user-1", groups=groups)
+    event = make_authorizer_event(token, method, path)
+
+    remote = load_authorizer(LOCAL_EVALUATION="false")
+    with Stubber(remote.verifiedpermissions) as stubber:
+        stubber.add_response(
+            "is_authorized_with_token",
+            {
+                "decision": remote_decision,
+                "determiningPolicies": [],
+                "errors": [],
+                "principal": {"entityType": "AvpIotDemoApi::User", "entityId": f"{USER_POOL_ID}|user-1"},
+            },
+            {
+                "identityToken": ANY,
+                "policyStoreId": "ps-test",
+                "action": ANY,
+                "resource": ANY,
+            },
+        )
+        remote_response = remote.lambda_handler(event, None)
+
+    local = load_authorizer(LOCAL_EVALUATION="true")
+    with Stubber(local.verifiedpermissions) as stubber:
+        _stub_policy_store(stubber)
+        local_response = local.lambda_handler(event, None)
+        stubber.assert_no_pending_responses()
+
+    assert local_response["principalId"] == remote_response["principalId"]
+    assert local_response["policyDocument"] == remote_response["policyDocument"]
+
+
+def test_local_evaluation_rejects_expired_tokens(load_authorizer):
+    local = load_authorizer(LOCAL_EVALUATION="true")
+    response = local.lambda_handler(make_authorizer_event(make_token(exp_in=-60)), None)
+
+    assert response["policyDocument"]["Statement"][0]["Effect"] == "Deny"
+
+
+def test_local_evaluator_keeps_previous_copy_when_refresh_fails(load_authorizer):
+    local = load_authorizer(LOCAL_EVALUATION="true", POLICY_REFRESH_SECONDS="0")
+    claims = {"sub": "user-1", "cognito:groups": ["operator"]}
+
+    with Stubber(local.verifiedpermissions) as stubber:
+        _stub_policy_store(stubber)
+        stubber.add_client_error("list_policies", "ThrottlingException")
+        first = local.local_evaluator.is_authorized(USER_POOL_ID, claims, "get /devices", "AvpIotDemoApi")
+        second = local.local_evaluator.is_authorized(USER_POOL_ID, claims, "get /devices", "AvpIotDemoApi")
+        stubber.assert_no_pending_responses()
+
+    assert first == second
+    assert first["decision"] == "ALLOW"
+
+
+def test_local_evaluator_backs_off_after_a_failed_refresh(load_authorizer):
+    local = load_authorizer(LOCAL_EVALUATION="true", POLICY_REFRESH_SECONDS="0")
+    claims = {"sub": "user-1", "cognito:groups": ["operator"]}
+    refreshes = []
+    local.verifiedpermissions.meta.events.register(
+        "before-parameter-build.verifiedpermissions.ListPolicies", lambda **kwargs: refreshes.append(1)
+    )
+
+    with Stubber(local.verifiedpermissions) as stubber:
+        _stub_policy_store(stubber)
+        stubber.add_client_error("list_policies", "ThrottlingException")
+        for _ in range(3):
+            decision = local.local_evaluator.is_authorized(USER_POOL_ID, claims, "get /devices", "AvpIotDemoApi")
+        stubber.assert_no_pending_responses()
+
+    assert decision["decision"] == "ALLOW"
+    assert len(refreshes) == 2
@@ -0,0 +1,94 @@
+import json
+import logging
+
+from lambda_shared.logger import REDACTED, get_logger, redact, start_request
+from tests.unit.conftest import make_token
+
+
+class _ExplodingRepr:
+    def __repr__(self):
+        raise AssertionError("arguments of disabled log calls must not be formatted")
+
+    __str__ = __repr__
+
+
+def test_redact_masks_sensitive_keys_and_embedded_tokens():
+    token = make_token()
+    event = {
+        "headers": {"Authorization": f"Bearer {token}", "Accept": "application/json"},
+        "body": f"token={token}",
+        "claims": {"email": "user@example.com", "sub": "user-1"},
+    }
+
+    redacted = redact(event)
+
+    assert redacted["headers"] == {"Authorization": REDACTED, "Accept": "application/json"}
+    assert redacted["body"] == f"token={REDACTED}"
+    assert redacted["claims"] == {"email": REDACTED, "sub": "user-1"}
+
+
+def test_emails_are_masked_in_any_string(capsys, monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    logger = get_logger("test_logger.emails")
+
+    assert redact({"user": "jane.doe+iot@example.co.uk", "principal": "User::\"a@b.io\""}) == {
+        "user": REDACTED, "principal": f"User::\"{REDACTED}\""
+    }
+    logger.info("Denied jane@example.com on %s", "get /devices", extra={"fields": {"caller": "jane@example.com"}})
+
+    output = capsys.readouterr().out
+    assert "example.com" not in output
+    assert json.loads(output)["message"] == f"Denied {REDACTED} on get /devices"
+
+
+def test_log_lines_are_json_and_redacted(capsys, monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "DEBUG")
+    logger = get_logger("test_logger.json_lines")
+
+    logger.info("Received event: %s", {"authorization": "secret"}, extra={"fields": {"token": "x", "n": 1}})
+
+    entry = json.loads(capsys.readouterr().out)
+    assert entry["level"] == "INFO"
+    assert "secret" not in entry["message"]
+    assert entry["token"] == REDACTED
+    assert entry["n"] == 1
+
+
+def test_disabled_levels_skip_formatting(capsys, monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    logger = get_logger("test_logger.gated")
+
+    start_request(logger, sample_rate=0)
+    logger.debug("Event: %s", _ExplodingRepr())
+
+    assert capsys.readouterr().out == ""
+
+
+def test_sampled_requests_log_at_debug(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "WARNING")
+    logger = get_logger("test_logger.sampled")
+
+    assert start_request(logger, sample_rate=1.0)
+    assert logger.isEnabledFor(logging.DEBUG)
+
+    assert not start_request(logger, sample_rate=0)
+    assert not logger.isEnabledFor(logging.INFO)
+
+
+def test_unknown_log_levels_fall_back_to_info(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "VERBOSE")
+    logger = get_logger("test_logger.unknown_level")
+
+    assert logger.level == logging.INFO
+
+
+def test_unsampled_requests_keep_the_level(monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    logger = get_logger("test_logger.unchanged")
+    calls = []
+    monkeypatch.setattr(logger, "setLevel", calls.append)
+
+    for _ in range(3):
+        start_request(logger, sample_rate=0)
+
+    assert calls == []
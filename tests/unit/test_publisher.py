@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from tests.unit.conftest import PUBLISHER_DIR
+
+TOPIC = "devices/download"
+
+
+class _FakeIotData:
+    """Records publishes, failing those addressed to the given things."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.payloads = []
+
+    def publish(self, topic, qos, payload):
+        if json.loads(payload)["device"] in self.failing:
+            raise RuntimeError("Rate exceeded")
+        self.payloads.append((topic, qos, payload))
+
+
+@pytest.fixture
+def publisher(load_integration, monkeypatch):
+    monkeypatch.syspath_prepend(PUBLISHER_DIR)
+    return load_integration("publisher", IOT_TOPIC=TOPIC, PUBLISH_CONCURRENCY="4")
+
+
+def _sqs_event(things):
+    return {"Records": [
+        {
+            "messageId": f"message-{thing}",
+            "body": json.dumps({"device": thing, "s3Path": "s3://bucket/a"}),
+            "attributes": {"SentTimestamp": "1700000000000"},
+        }
+        for thing in things
+    ]}
+
+
+def test_publishes_every_record(publisher, monkeypatch):
+    client = _FakeIotData()
+    monkeypatch.setattr(publisher, "get_iot_data_client", lambda: client)
+    event = _sqs_event(["thing-1", "thing-2", "thing-3"])
+
+    response = publisher.lambda_handler(event, None)
+
+    assert response == {"batchItemFailures": []}
+    assert sorted(payload for _, _, payload in client.payloads) == sorted(record["body"] for record in event["Records"])
+    assert {(topic, qos) for topic, qos, _ in client.payloads} == {
+        (f"{TOPIC}/{thing}", 1) for thing in ("thing-1", "thing-2", "thing-3")
+    }
+
+
+def test_reports_only_failed_records(publisher, monkeypatch):
+    monkeypatch.setattr(publisher, "get_iot_data_client", lambda: _FakeIotData(failing={"thing-2"}))
+
+    response = publisher.lambda_handler(_sqs_event(["thing-1", "thing-2", "thing-3"]), None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-thing-2"}]}
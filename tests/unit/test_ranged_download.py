@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.unit.conftest import DEVICE_CODE_DIR
+
+CONTENT = bytes(range(256)) * 400
+PART_SIZE = 10_000
+SHA256 = {"algorithm": "SHA256", "value": base64.b64encode(hashlib.sha256(CONTENT).digest()).decode("ascii")}
+
+
+@pytest.fixture
+def ranged_download(monkeypatch):
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    for module_name in ("checksums", "ranged_download"):
+        sys.modules.pop(module_name, None)
+    import ranged_download
+    yield ranged_download
+    for module_name in ("checksums", "ranged_download"):
+        sys.modules.pop(module_name, None)
+
+
+def _reader(requests, fail_at=None, chunk_size=1000):
+    """Serve CONTENT in chunks, failing once a range reaches the byte fail_at."""
+    def read_range(start, end):
+        requests.append((start, end))
+        for offset in range(start, end + 1, chunk_size):
+            if fail_at is not None and offset >= fail_at:
+                raise ConnectionError("connection reset")
+            yield CONTENT[offset:min(offset + chunk_size, end + 1)]
+    return read_range
+
+
+def test_downloads_every_part(ranged_download, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    requests = []
+
+    ranged_download.download_ranges(_reader(requests), str(local_path), len(CONTENT), '"v1"',
+                                    part_size=PART_SIZE, concurrency=4)
+
+    assert local_path.read_bytes() == CONTENT
+    assert sorted(requests) == [(start, min(start + PART_SIZE, len(CONTENT)) - 1)
+                                for start in range(0, len(CONTENT), PART_SIZE)]
+    assert not (tmp_path / "firmware.bin.part").exists()
+    assert not (tmp_path / "firmware.bin.part.json").exists()
+
+
+def test_parts_download_concurrently(ranged_download, tmp_path):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def read_range(start, end):
+        # Only returns if three parts are in flight at once
+        barrier.wait()
+        yield CONTENT[start:end + 1]
+
+    ranged_download.download_ranges(read_range, str(tmp_path / "firmware.bin"), 3 * PART_SIZE,
+                                    part_size=PART_SIZE, concurrency=3)
+
+
+def test_resumes_from_the_last_recorded_byte(ranged_download, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+
+    with pytest.raises(ConnectionError):
+        ranged_download.download_ranges(_reader([], fail_at=25_000), str(local_path), len(CONTENT), '"v1"',
+                                        part_size=PART_SIZE, concurrency=1)
+    state = json.loads((tmp_path / "firmware.bin.part.json").read_text())
+    assert state["progress"][:3] == [PART_SIZE, PART_SIZE, 5000]
+
+    requests = []
+    ranged_download.download_ranges(_reader(requests), str(local_path), len(CONTENT), '"v1"',
+                                    part_size=PART_SIZE, concurrency=1)
+
+    assert local_path.read_bytes() == CONTENT
+    assert requests[0] == (25_000, 29_999)
+    assert all(start >= 25_000 for start, _ in requests)
+
+
+def test_progress_on_another_version_is_discarded(ranged_download, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    with pytest.raises(ConnectionError):
+        ranged_download.download_ranges(_reader([], fail_at=25_000), str(local_path), len(CONTENT), '"v1"',
+                                        part_size=PART_SIZE, concurrency=1)
+
+    requests = []
+    ranged_download.download_ranges(_reader(requests), str(local_path), len(CONTENT), '"v2"',
+                                    part_size=PART_SIZE, concurrency=1)
+
+    assert local_path.read_bytes() == CONTENT
+    assert requests[0] == (0, PART_SIZE - 1)
+
+
+def test_adopts_a_streamed_prefix(ranged_download, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    (tmp_path / "firmware.bin.part").write_bytes(CONTENT[:15_000])
+    requests = []
+
+    ranged_download.download_ranges(_reader(requests), str(local_path), len(CONTENT),
+                                    part_size=PART_SIZE, concurrency=1)
+
+    assert local_path.read_bytes() == CONTENT
+    assert requests[0] == (15_000, 19_999)
+
+
+def test_short_parts_fail(ranged_download, tmp_path):
+    def read_range(start, end):
+        yield CONTENT[start:end]
+
+    with pytest.raises(RuntimeError, match="Received bytes"):
+        ranged_download.download_ranges(read_range, str(tmp_path / "firmware.bin"), PART_SIZE,
+                                        part_size=PART_SIZE)
+
+    assert not (tmp_path / "firmware.bin").exists()
+
+
+def test_checksums_are_computed_as_parts_arrive(ranged_download, tmp_path, monkeypatch):
+    local_path = tmp_path / "firmware.bin"
+    # Bytes of a fresh download are never read back, and parts run at most 2 chunks ahead
+    monkeypatch.setattr(os, "pread", lambda *args: pytest.fail("read the file back"))
+    monkeypatch.setattr(ranged_download, "MAX_BUFFERED_BYTES", 2000)
+
+    ranged_download.download_ranges(_reader([]), str(local_path), len(CONTENT), '"v1"',
+                                    part_size=PART_SIZE, concurrency=4, checksum=SHA256)
+
+    assert local_path.read_bytes() == CONTENT
+
+
+def test_mismatched_downloads_never_appear(ranged_download, tmp_path):
+    checksum = {"algorithm": "SHA256", "value": base64.b64encode(hashlib.sha256(b"other").digest()).decode("ascii")}
+
+    with pytest.raises(ranged_download.ChecksumMismatchError):
+        ranged_download.download_ranges(_reader([]), str(tmp_path / "firmware.bin"), len(CONTENT), '"v1"',
+                                        part_size=PART_SIZE, concurrency=4, checksum=checksum)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_checksums_cover_bytes_of_interrupted_attempts(ranged_download, tmp_path):
+    local_path = tmp_path / "firmware.bin"
+    with pytest.raises(ConnectionError):
+        ranged_download.download_ranges(_reader([], fail_at=25_000), str(local_path), len(CONTENT), '"v1"',
+                                        part_size=PART_SIZE, concurrency=2, checksum=SHA256)
+
+    ranged_download.download_ranges(_reader([]), str(local_path), len(CONTENT), '"v1"',
+                                    part_size=PART_SIZE, concurrency=2, checksum=SHA256)
+
+    assert local_path.read_bytes() == CONTENT
+
+
+def test_crc64nvme_is_unsupported_on_older_awscrt(ranged_download, monkeypatch):
+    checksums = sys.modules["checksums"]
+    # awscrt before 0.23 has crc32c but no crc64nvme
+    monkeypatch.setattr(checksums, "crt_checksums", SimpleNamespace(crc32c=lambda data, previous: 0))
+
+    assert checksums.new_digest("CRC64NVME") is None
+    assert checksums.new_digest("CRC32C") is not None
+
+
+def test_s3_downloads_resume(monkeypatch, tmp_path):
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    for module_name in ("local_subscribe", "http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+    import local_subscribe
+    monkeypatch.setattr(local_subscribe, "PART_SIZE", PART_SIZE)
+    local_path = tmp_path / "firmware.bin"
+
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="bucket")
+        boto3.client("s3").put_object(Bucket="bucket", Key="firmware.bin", Body=CONTENT,
+                                      ChecksumAlgorithm="SHA256")
+        (tmp_path / "firmware.bin.part").write_bytes(CONTENT[:15_000])
+
+        assert local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path))
+        assert local_path.read_bytes() == CONTENT
+        # The checksum S3 holds is verified when the message carries none
+        local_path.unlink()
+        (tmp_path / "firmware.bin.part").write_bytes(b"x" * 15_000)
+        assert not local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path))
+
+    assert not local_path.exists()
+    for module_name in ("local_subscribe", "http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+
+
+def test_interrupted_s3_downloads_only_fetch_the_rest(monkeypatch, tmp_path):
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.syspath_prepend(DEVICE_CODE_DIR)
+    for module_name in ("local_subscribe", "http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
+    import local_subscribe
+    monkeypatch.setattr(local_subscribe, "PART_SIZE", PART_SIZE)
+    monkeypatch.setattr(local_subscribe, "PART_CONCURRENCY", 1)
+    download_ranges, received = local_subscribe.download_ranges, [0]
+
+    def counted(limit=None):
+        def download(read_range, *args, **kwargs):
+            def read_counted(start, end):
+                for chunk in read_range(start, end):
+                    if limit is not None and received[0] + len(chunk) > limit:
+                        raise ConnectionError("connection reset")
+                    received[0] += len(chunk)
+                    yield chunk
+            return download_ranges(read_counted, *args, **kwargs)
+        return download
+
+    local_path = tmp_path / "firmware.bin"
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="bucket")
+        boto3.client("s3").put_object(Bucket="bucket", Key="firmware.bin", Body=CONTENT)
+
+        monkeypatch.setattr(local_subscribe, "download_ranges", counted(limit=len(CONTENT) // 2))
+        assert not local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path))
+        interrupted_at, received[0] = received[0], 0
+        monkeypatch.setattr(local_subscribe, "download_ranges", counted())
+        assert local_subscribe.download_from_s3("s3://bucket/firmware.bin", str(local_path))
+
+    assert local_path.read_bytes() == CONTENT
+    # Every byte the interrupted attempt recorded is kept
+    assert received[0] == len(CONTENT) - interrupted_at
+    for module_name in ("local_subscribe", "http_download", "ranged_download", "checksums"):
+        sys.modules.pop(module_name, None)
@@ -0,0 +1,28 @@
+import json
+
+from tests.unit.conftest import make_proxy_event
+
+
+def test_role_is_read_from_authorizer_context(load_integration):
+    role = load_integration("role")
+
+    response = role.lambda_handler(make_proxy_event({"groups": "manager,operator"}), None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == {"group": "manager"}
+
+
+def test_user_without_groups(load_integration):
+    role = load_integration("role")
+
+    response = role.lambda_handler(make_proxy_event({"groups": ""}), None)
+
+    assert json.loads(response["body"]) == {"message": "User does not belong to any group"}
+
+
+def test_missing_authorizer_context_is_rejected(load_integration):
+    role = load_integration("role")
+
+    response = role.lambda_handler(make_proxy_event(), None)
+
+    assert response["statusCode"] == 400
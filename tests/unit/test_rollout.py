@@ -0,0 +1,120 @@
+import json
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+from lambda_shared.clients import get_client
+from tests.unit.conftest import make_proxy_event
+
+GROUP_ARN = "arn:aws:iot:us-east-1:123456789012:thinggroup/fleet"
+
+
+@pytest.fixture
+def rollout(load_integration):
+    return load_integration(
+        "rollout",
+        IOT_THING_GROUP="fleet",
+        ROLLOUT_MAXIMUM_PER_MINUTE="50",
+        ROLLOUT_ABORT_FAILURE_PERCENT="10",
+        ROLLOUT_ABORT_MIN_EXECUTED_THINGS="5",
+        ROLLOUT_TIMEOUT_MINUTES="15",
+    )
+
+
+def _create_job_response(job_id="download-1"):
+    return {"jobId": job_id, "jobArn": f"arn:aws:iot:us-east-1:123456789012:job/{job_id}"}
+
+
+def test_creates_job_for_default_thing_group(rollout):
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("describe_thing_group", {"thingGroupArn": GROUP_ARN}, {"thingGroupName": "fleet"})
+        stubber.add_response(
+            "create_job",
+            _create_job_response(),
+            {
+                "jobId": ANY,
+                "targets": [GROUP_ARN],
+                "document": json.dumps({"operation": "download", "s3Path": "s3://bucket/firmware.bin"}),
+                "description": "Download s3://bucket/firmware.bin",
+                "targetSelection": "SNAPSHOT",
+                "jobExecutionsRolloutConfig": {"maximumPerMinute": 50},
+                "abortConfig": {"criteriaList": [{
+                    "failureType": "ALL",
+                    "action": "CANCEL",
+                    "thresholdPercentage": 10.0,
+                    "minNumberOfExecutedThings": 5,
+                }]},
+                "timeoutConfig": {"inProgressTimeoutInMinutes": 15},
+            },
+        )
+
+        response = rollout.lambda_handler(make_proxy_event(body=json.dumps({"s3Path": "s3://bucket/firmware.bin"})), None)
+
+    assert response["statusCode"] == 201
+    assert json.loads(response["body"])["jobId"] == "download-1"
+
+
+def test_exponential_rate_and_explicit_group(rollout):
+    body = {
+        "s3Path": "s3://bucket/firmware.bin",
+        "thingGroup": "canary",
+        "exponentialRate": {"baseRatePerMinute": 5, "incrementFactor": 2, "numberOfSucceededThings": 10},
+    }
+
+    request = rollout.build_job_request(body, GROUP_ARN)
+
+    assert request["jobExecutionsRolloutConfig"] == {
+        "maximumPerMinute": 50,
+        "exponentialRate": {
+            "baseRatePerMinute": 5,
+            "incrementFactor": 2.0,
+            "rateIncreaseCriteria": {"numberOfSucceededThings": 10},
+        },
+    }
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("describe_thing_group", {"thingGroupArn": GROUP_ARN}, {"thingGroupName": "canary"})
+        stubber.add_response("create_job", _create_job_response(), None)
+
+        response = rollout.lambda_handler(make_proxy_event(body=json.dumps(body)), None)
+
+    assert response["statusCode"] == 201
+
+
+def test_continuous_rollouts_are_opt_in(rollout):
+    body = {"s3Path": "s3://bucket/firmware.bin", "continuous": True}
+
+    assert rollout.build_job_request(body, GROUP_ARN)["targetSelection"] == "CONTINUOUS"
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"s3Path": "https://example.com/firmware.bin"},
+        {"s3Path": "s3://bucket/a", "maximumPerMinute": 0},
+        {"s3Path": "s3://bucket/a", "maximumPerMinute": "fast"},
+        {"s3Path": "s3://bucket/a", "exponentialRate": {"baseRatePerMinute": 5}},
+        {"s3Path": "s3://bucket/a", "abort": {"failurePercent": 150}},
+        {"s3Path": "s3://bucket/a", "continuous": "yes"},
+    ],
+)
+def test_invalid_requests_are_rejected(rollout, body):
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_response("describe_thing_group", {"thingGroupArn": GROUP_ARN}, {"thingGroupName": "fleet"})
+
+        response = rollout.lambda_handler(make_proxy_event(body=json.dumps(body)), None)
+
+    assert response["statusCode"] == 400
+
+
+def test_unknown_thing_group_returns_service_status(rollout):
+    with Stubber(get_client("iot")) as stubber:
+        stubber.add_client_error(
+            "describe_thing_group", "ResourceNotFoundException", "Thing group missing not found", http_status_code=404
+        )
+
+        response = rollout.lambda_handler(
+            make_proxy_event(body=json.dumps({"s3Path": "s3://bucket/a", "thingGroup": "missing"})), None
+        )
+
+    assert response["statusCode"] == 404
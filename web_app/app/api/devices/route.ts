@@ -5,7 +5,8 @@ export async function GET(request: Request) {
 
   try {
     // make sure the API endpoint is correctly defined in the .env.local file
-    const response = await fetch(`${process.env.API_URL}devices`, {
+    const { search } = new URL(request.url);
+    const response = await fetch(`${process.env.API_URL}devices${search}`, {
       method: 'GET',
       headers: {
         'Authorization': token || '',
@@ -91,7 +91,8 @@ export default function App() {
     }
   };
 
-  const listDevices = () => makeAuthenticatedRequest("devices", "GET");
+  const listDevices = () =>
+    makeAuthenticatedRequest("devices", "GET", { fields: "thingName,attributes" });
   const downloadFile = () =>
     makeAuthenticatedRequest("download", "POST", { s3Path: s3filePath });
 